@@ -2,7 +2,7 @@ import argparse
 import os
 from datetime import timedelta
 
-from fasthtml.common import Beforeware, RedirectResponse, Response, serve
+from fasthtml.common import Beforeware, JSONResponse, RedirectResponse, Response, serve
 
 from app.routes.auth import AUTH_SKIP, ar as auth_routes
 from app.routes.chat import ar as chat_routes
@@ -17,7 +17,9 @@ from varro.chat.price_updates import start_price_updates, stop_price_updates
 from varro.config import DATA_DIR
 from varro.dashboard.routes import mount_dashboard_routes
 from varro.db import crud
+from varro.db.admission import admission
 from varro.db.db import dst_read_engine
+from varro.startup import warm_start
 
 STATIC_SKIP = [
     r"/favicon\.ico",
@@ -62,6 +64,22 @@ def health():
     return Response("ok", status_code=200)
 
 
+@app.get("/_internal/admission")
+def admission_stats(req):
+    # Per-worker query admission metrics; only served to direct local requests,
+    # not through the Caddy proxy.
+    if "x-forwarded-for" in req.headers:
+        return Response("Not found", status_code=404)
+    return JSONResponse(admission.stats())
+
+
+@app.get("/_internal/shells")
+def shell_pool_stats(req):
+    if "x-forwarded-for" in req.headers:
+        return Response("Not found", status_code=404)
+    return JSONResponse(shell_pool.stats())
+
+
 @app.get("/")
 def frontpage(sess):
     if sess.get("auth"):
@@ -73,6 +91,7 @@ def frontpage(sess):
 async def start_chat_cleanup():
     run_manager.start_cleanup_task(retention=timedelta(minutes=5), interval=30)
     shell_pool.start_cleanup_task(ttl=timedelta(minutes=10), interval=60)
+    warm_start()
     # start_price_updates()
 
 
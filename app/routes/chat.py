@@ -15,6 +15,7 @@ from ui.app.chat import (
     ChatRunStream,
     ErrorBlock,
 )
+from varro.agent.shell_snapshot import remove_snapshot
 from varro.chat.model_registry import DEFAULT_CHAT_MODEL_KEY, get_chat_model
 from varro.chat.model_costs import has_positive_balance
 from varro.chat.run_manager import run_manager
@@ -43,7 +44,7 @@ def _delete_chat_with_artifacts(chats, chat, user_id: int) -> None:
     for path in cache_paths:
         path.unlink(missing_ok=True)
     state_path.unlink(missing_ok=True)
-    snapshot_path.unlink(missing_ok=True)
+    remove_snapshot(snapshot_path)
 
 
 def _stream_block(block):
@@ -88,10 +89,11 @@ async def _execute_run(
     current_url: str | None,
     model_key: str,
 ) -> None:
-    from varro.chat.agent_run import run_agent
+    from varro.chat.agent_run import ReasoningState, run_agent
 
     chats = crud.chat.for_user(user_id)
     request_url = (current_url or "").strip()
+    state = ReasoningState()
 
     try:
         async with shell_pool.lease(user_id=user_id, chat_id=chat_id) as shell:
@@ -103,6 +105,7 @@ async def _execute_run(
                 chat_id=chat_id,
                 run_id=run_id,
                 current_url=request_url,
+                state=state,
             ):
                 await run_manager.publish(run_id, _stream_block(block))
 
@@ -114,6 +117,7 @@ async def _execute_run(
     except asyncio.CancelledError:
         await _publish_blocks(
             run_id,
+            *state.abort_blocks(),
             ChatProgressEnd(),
             ChatFormEnabled(chat_id, model_key),
         )
@@ -121,6 +125,7 @@ async def _execute_run(
         await shell_pool.invalidate(user_id, chat_id)
         await _publish_blocks(
             run_id,
+            *state.abort_blocks(),
             ErrorBlock(str(exc)),
             ChatProgressEnd(),
             ChatFormEnabled(chat_id, model_key),
@@ -226,6 +231,7 @@ def chat_page():
 @ar.get("/chat/new")
 def chat_new(req, sess):
     sess.pop("chat_id", None)
+    shell_pool.prewarm(sess.get("user_id"))
     return ChatPanel(None, shell=None, hx_swap_oob="outerHTML:#chat-panel")
 
 
@@ -235,6 +241,7 @@ def chat_switch(chat_id: int, req, sess):
     if not chat:
         return Response(status_code=404)
     sess["chat_id"] = chat_id
+    shell_pool.prewarm(sess.get("user_id"))
     return ChatPanel(chat, shell=None, hx_swap_oob="outerHTML:#chat-panel")
 
 
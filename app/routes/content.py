@@ -1,14 +1,17 @@
 import hashlib
 
-import mistletoe
 from fasthtml.common import APIRouter, A, Button, Div, Form, Input, NotStr, Textarea
 
 from ui.app.layout import AppShell, SettingsPage
 from varro.agent.workspace import user_workspace_root
+from varro.chat.shell_pool import shell_pool
 from varro.config import DATA_DIR
 from varro.dashboard.public_fs import has_public_dashboard
 from varro.dashboard.routes import list_dashboards
 from varro.db import crud
+from varro.startup import LazyModule
+
+mistletoe = LazyModule("mistletoe")
 
 ar = APIRouter()
 
@@ -121,6 +124,7 @@ def app_home(req, sess):
     if not req.headers.get("HX-Request"):
         sess.pop("chat_id", None)
     user_id = sess["user_id"]
+    shell_pool.prewarm(user_id)
     welcome_content = _welcome_path(user_id).read_text(encoding="utf-8")
     content = _render_welcome_page(welcome_content, list_dashboards(user_id), user_id)
     return _app_or_fragment(req, sess, content)
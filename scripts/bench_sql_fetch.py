@@ -0,0 +1,84 @@
+"""Benchmark result transfer for a 1M-row query with date and int4range columns.
+
+Compares the old pd.read_sql path (plus per-value date normalization) with
+the columnar COPY -> Arrow paths used by the dashboard executor (psycopg) and
+the agent Sql tool (asyncpg).
+
+Usage: python scripts/bench_sql_fetch.py [--rows 1000000] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from datetime import date
+
+import pandas as pd
+import psycopg
+from sqlalchemy import text
+
+from varro.agent import sql as agent_sql
+from varro.db.db import POSTGRES_DST_READ, dst_read_engine
+from varro.db.pg_arrow import read_frame
+
+QUERY = """
+SELECT
+    (i % 99)::smallint AS omrade,
+    CASE WHEN i % 7 = 0 THEN NULL ELSE 'Område ' || (i % 500) END AS titel,
+    int4range((i % 20) * 5, CASE WHEN i % 20 = 19 THEN NULL ELSE (i % 20) * 5 + 5 END) AS alder,
+    (date '2000-01-01' + (i % 300) * interval '1 month')::date AS tid,
+    (i * 1.5)::numeric AS indhold
+FROM generate_series(1, {rows}) AS i
+"""
+
+
+def legacy_read_sql(query: str) -> pd.DataFrame:
+    with dst_read_engine.connect() as conn:
+        df = pd.read_sql(text(query), conn)
+    for col in df.select_dtypes(include=["object"]).columns:
+        non_null = df[col].dropna()
+        if not non_null.empty and non_null.map(lambda v: isinstance(v, date)).all():
+            df[col] = pd.to_datetime(df[col])
+    return df
+
+
+def psycopg_copy(query: str) -> pd.DataFrame:
+    with psycopg.connect(POSTGRES_DST_READ) as conn:
+        return read_frame(conn, query)
+
+
+def asyncpg_copy(query: str) -> pd.DataFrame:
+    async def run() -> pd.DataFrame:
+        result = await agent_sql.run_query(query, max_rows=10**9, max_bytes=2**40)
+        return result.df
+
+    return asyncio.run(run())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    query = QUERY.format(rows=args.rows)
+
+    for name, fetch in [
+        ("pd.read_sql + date loop", legacy_read_sql),
+        ("psycopg COPY -> Arrow", psycopg_copy),
+        ("asyncpg COPY -> Arrow", asyncpg_copy),
+    ]:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            df = fetch(query)
+            timings.append(time.perf_counter() - start)
+        mem_mb = df.memory_usage(deep=True).sum() / 1e6
+        print(
+            f"{name:<26} best {min(timings):6.2f}s  rows {len(df):>9}  "
+            f"memory {mem_mb:7.1f} MB  dtypes {dict(df.dtypes.astype(str))}"
+        )
+
+
+if __name__ == "__main__":
+    main()
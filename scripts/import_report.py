@@ -0,0 +1,82 @@
+"""Import-time report for app startup, aggregated per subsystem.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+sums each module's self time into its subsystem: the top-level package for
+third-party code, `varro.<subpackage>` / `app` / `ui` for ours. Save a run
+with --json and pass it to --baseline later to see what regressed.
+
+Usage: python scripts/import_report.py [--module app.main] [--top 25]
+                                       [--json out.json] [--baseline old.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+OWN_PACKAGES = {"varro"}
+
+
+def subsystem(module: str) -> str:
+    parts = module.split(".")
+    if parts[0] in OWN_PACKAGES and len(parts) > 2:
+        return ".".join(parts[:2])
+    return parts[0]
+
+
+def measure(module: str) -> tuple[float, dict[str, float]]:
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if res.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{res.stderr[-2000:]}")
+    totals: dict[str, float] = defaultdict(float)
+    total_us = 0
+    for line in res.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        totals[subsystem(name)] += int(self_us) / 1000
+        if not indent:
+            total_us += int(cumulative_us)
+    return total_us / 1000, dict(totals)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--json", type=Path, help="write the per-subsystem report here")
+    parser.add_argument("--baseline", type=Path, help="compare with an earlier --json report")
+    args = parser.parse_args()
+
+    total_ms, totals = measure(args.module)
+    baseline = json.loads(args.baseline.read_text())["subsystems"] if args.baseline else {}
+
+    print(f"import {args.module}: {total_ms:.0f} ms")
+    print(f"{'subsystem':<32} {'ms':>9}" + (f" {'delta':>9}" if baseline else ""))
+    for name, ms in sorted(totals.items(), key=lambda item: -item[1])[: args.top]:
+        row = f"{name:<32} {ms:>9.1f}"
+        if baseline:
+            row += f" {ms - baseline.get(name, 0.0):>+9.1f}"
+        print(row)
+
+    if args.json:
+        args.json.write_text(
+            json.dumps({"module": args.module, "total_ms": total_ms, "subsystems": totals}, indent=2)
+        )
+
+
+if __name__ == "__main__":
+    main()
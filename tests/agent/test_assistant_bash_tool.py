@@ -31,8 +31,8 @@ def test_bash_returns_command_output_and_persists_cwd(assistant_module, monkeypa
         calls.append(("load", user_id, chat_id))
         return "/start"
 
-    def fake_run_bash_command(user_id: int, cwd_rel: str, command: str):
-        calls.append(("run", user_id, cwd_rel, command))
+    def fake_run_bash_command(user_id: int, cwd_rel: str, command: str, *, chat_id=None):
+        calls.append(("run", user_id, cwd_rel, command, chat_id))
         return "command output", "/next"
 
     def fake_save_bash_cwd(user_id: int, chat_id: int, cwd: str) -> None:
@@ -48,7 +48,7 @@ def test_bash_returns_command_output_and_persists_cwd(assistant_module, monkeypa
     assert output == "command output"
     assert calls == [
         ("load", 42, 7),
-        ("run", 42, "/start", "ls /subjects"),
+        ("run", 42, "/start", "ls /subjects", 7),
         ("save", 42, 7, "/next"),
     ]
 
@@ -60,8 +60,8 @@ def test_bash_uses_loaded_root_cwd_when_store_returns_root(assistant_module, mon
         calls.append(("load", user_id, chat_id))
         return "/"
 
-    def fake_run_bash_command(user_id: int, cwd_rel: str, command: str):
-        calls.append(("run", user_id, cwd_rel, command))
+    def fake_run_bash_command(user_id: int, cwd_rel: str, command: str, *, chat_id=None):
+        calls.append(("run", user_id, cwd_rel, command, chat_id))
         return "pwd output", "/"
 
     def fake_save_bash_cwd(user_id: int, chat_id: int, cwd: str) -> None:
@@ -77,7 +77,7 @@ def test_bash_uses_loaded_root_cwd_when_store_returns_root(assistant_module, mon
     assert output == "pwd output"
     assert calls == [
         ("load", 9, 2),
-        ("run", 9, "/", "pwd"),
+        ("run", 9, "/", "pwd", 2),
         ("save", 9, 2, "/"),
     ]
 
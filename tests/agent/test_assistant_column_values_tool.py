@@ -58,7 +58,6 @@ def setup_column_values_files(tmp_path, assistant_module):
 
     assistant_module.COLUMN_VALUES_DIR = column_values_dir
     assistant_module.DIMENSION_LINKS_DIR = links_dir
-    assistant_module.DIM_TABLES = ("overtraedtype",)
 
 
 def setup_empty_links_files(tmp_path, assistant_module):
@@ -90,7 +89,6 @@ def setup_empty_links_files(tmp_path, assistant_module):
 
     assistant_module.COLUMN_VALUES_DIR = column_values_dir
     assistant_module.DIMENSION_LINKS_DIR = links_dir
-    assistant_module.DIM_TABLES = ("overtraedtype",)
 
 
 def test_column_values_filters_dim_values_by_for_table(assistant_module, tmp_path):
@@ -149,13 +149,11 @@ def test_build_available_skills_prompt_fallback_when_none_found(
 
 
 def test_get_system_prompt_injects_available_skills(assistant_module, monkeypatch) -> None:
-    captured: dict[str, str] = {}
+    captured: dict[str, dict] = {}
 
     def fake_render_prompt(name: str, **variables):
-        captured["name"] = name
-        for key, value in variables.items():
-            captured[key] = value
-        return "rendered"
+        captured[name] = variables
+        return f"[{name}]"
 
     monkeypatch.setattr(assistant_module.crud.prompt, "render_prompt", fake_render_prompt)
     monkeypatch.setattr(
@@ -173,8 +171,69 @@ def test_get_system_prompt_injects_available_skills(assistant_module, monkeypatc
     )
     result = asyncio.run(assistant_module.get_system_prompt(ctx))
 
-    assert result == "rendered"
-    assert captured["name"] == "rigsstatistiker"
-    assert captured["AVAILABLE_SKILLS"] == "- name: Skill\n  description: Desc\n  location: /skills/x/SKILL.md"
-    assert captured["SUBJECT_HIERARCHY"] == "x"
-    assert "CURRENT_DATE" in captured
+    assert result == "[rigsstatistiker]\n\n[rigsstatistiker_session]"
+    prefix_vars = captured["rigsstatistiker"]
+    assert prefix_vars["AVAILABLE_SKILLS"] == "- name: Skill\n  description: Desc\n  location: /skills/x/SKILL.md"
+    assert prefix_vars["SUBJECT_HIERARCHY"] == "x"
+    assert "CURRENT_DATE" not in prefix_vars
+    assert "CURRENT_DATE" in captured["rigsstatistiker_session"]
+    assert captured["rigsstatistiker_session"]["CURRENT_URL"] == "/"
+
+
+def test_system_prompt_prefix_is_cached_until_skills_change(
+    assistant_module, skills_module, monkeypatch, tmp_path: Path
+) -> None:
+    workspace = tmp_path / "workspace"
+    skill = workspace / "skills" / "alpha" / "SKILL.md"
+    skill.parent.mkdir(parents=True)
+    skill.write_text("---\nname: Alpha\ndescription: First\n---\n", encoding="utf-8")
+    monkeypatch.setattr(skills_module, "user_workspace_root", lambda user_id: workspace)
+    monkeypatch.setattr(assistant_module, "get_static_prompts", lambda: {"SUBJECT_HIERARCHY": "x"})
+    builds = []
+    build_skills = assistant_module.build_available_skills_prompt
+    monkeypatch.setattr(
+        assistant_module,
+        "build_available_skills_prompt",
+        lambda user_id: builds.append(user_id) or build_skills(user_id),
+    )
+    assistant_module.render_instructions_prefix.cache_clear()
+
+    def run(url: str) -> str:
+        ctx = SimpleNamespace(deps=SimpleNamespace(user_id=3, request_current_url=lambda: url))
+        return asyncio.run(assistant_module.get_system_prompt(ctx))
+
+    first, second = run("/"), run("/dashboard/sales")
+    prefix, _, suffix = second.rpartition("<session>")
+    assert first.rpartition("<session>")[0] == prefix
+    assert "Current URL: /dashboard/sales" in suffix
+    assert "<description>First</description>" in prefix
+    assert builds == [3]
+
+    skill.write_text("---\nname: Alpha\ndescription: Second one\n---\n", encoding="utf-8")
+    assert "<description>Second one</description>" in run("/")
+    assert builds == [3, 3]
+
+
+def test_anthropic_model_sends_session_suffix_as_uncached_block(assistant_module) -> None:
+    from pydantic_ai.messages import ModelRequest, UserPromptPart
+    from pydantic_ai.models import ModelRequestParameters
+
+    model = assistant_module.resolve_model("anthropic:claude-sonnet-4-6")
+    request = ModelRequest(
+        parts=[UserPromptPart("hej")],
+        instructions="static\n\n<session>\nCurrent URL: /\n</session>",
+    )
+
+    system, _ = asyncio.run(
+        model._map_message(
+            [request], ModelRequestParameters(), assistant_module.default_model_settings
+        )
+    )
+
+    assert [block["text"] for block in system] == [
+        "static",
+        "<session>\nCurrent URL: /\n</session>",
+    ]
+    assert "cache_control" in system[0]
+    assert "cache_control" not in system[1]
+    assert assistant_module.resolve_model("google-gla:gemini") == "google-gla:gemini"
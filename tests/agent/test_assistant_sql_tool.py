@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import importlib
 from types import SimpleNamespace
 
@@ -7,23 +8,31 @@ import pandas as pd
 import pytest
 
 
-class _DummyConn:
-    def __enter__(self):
-        return self
+def _patch_run_query(assistant_module, monkeypatch, df, **kwargs):
+    from varro.agent.sql import QueryResult
 
-    def __exit__(self, exc_type, exc, tb):
-        return False
+    async def fake_run_query(query):
+        return QueryResult(
+            df=df,
+            elapsed_s=0.25,
+            rows_fetched=len(df),
+            bytes_fetched=int(df.memory_usage(deep=True).sum()),
+            **kwargs,
+        )
 
-
-class _DummyEngine:
-    def connect(self):
-        return _DummyConn()
+    monkeypatch.setattr(assistant_module, "guarded_query", fake_run_query)
+    monkeypatch.setattr(assistant_module, "guarded_preview", fake_run_query)
 
 
 @pytest.fixture
-def assistant_module(monkeypatch):
+def assistant_module(monkeypatch, tmp_path):
     monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
 
+    from varro.agent import sql
+    from varro.db.result_cache import ResultCache
+
+    monkeypatch.setattr(sql, "result_cache", ResultCache(tmp_path, max_bytes=0))
+
     import logfire
 
     monkeypatch.setattr(logfire, "configure", lambda **kwargs: None)
@@ -38,60 +47,94 @@ def assistant_module(monkeypatch):
 
 def test_sql_includes_row_count_dtypes_and_stores_dataframe(assistant_module, monkeypatch):
     df = pd.DataFrame({"x": [1, 2]})
-    monkeypatch.setattr(assistant_module, "dst_read_engine", _DummyEngine())
-    monkeypatch.setattr(assistant_module.pd, "read_sql", lambda query, conn: df)
+    _patch_run_query(assistant_module, monkeypatch, df)
 
-    ctx = SimpleNamespace(deps=SimpleNamespace(shell=SimpleNamespace(user_ns={})))
-    result = assistant_module.Sql(ctx, query="select 1 as x", df_name="df_x")
+    ctx = SimpleNamespace(deps=SimpleNamespace(user_id=1, shell=SimpleNamespace(user_ns={})))
+    result = asyncio.run(assistant_module.Sql(ctx, query="select 1 as x", df_name="df_x"))
 
-    assert result.return_value.startswith("Stored as df_x\nrow_count: 2\n")
+    assert result.return_value.startswith(
+        "Stored as df_x\nrow_count: 2\nelapsed: 0.25s\nrows_fetched: 2\n"
+    )
     assert "dtypes: x=int64" in result.return_value
     assert "x\n1\n2\n" in result.return_value
     assert ctx.deps.shell.user_ns["df_x"].equals(df)
     assert result.metadata == {"ui": {"has_tool_content": False}}
 
 
-def test_sql_dtypes_resolve_date_columns(assistant_module, monkeypatch):
-    import datetime
+def test_sql_warns_when_query_returns_no_rows(assistant_module, monkeypatch):
+    df = pd.DataFrame(columns=["x"])
+    _patch_run_query(assistant_module, monkeypatch, df)
 
-    df = pd.DataFrame({"tid": [datetime.date(2024, 1, 1)], "val": [1.5]})
-    monkeypatch.setattr(assistant_module, "dst_read_engine", _DummyEngine())
-    monkeypatch.setattr(assistant_module.pd, "read_sql", lambda query, conn: df)
+    ctx = SimpleNamespace(deps=SimpleNamespace(user_id=1, shell=SimpleNamespace(user_ns={})))
+    result = asyncio.run(assistant_module.Sql(ctx, query="select 1 as x where false"))
 
-    ctx = SimpleNamespace(deps=SimpleNamespace(shell=SimpleNamespace(user_ns={})))
-    result = assistant_module.Sql(ctx, query="select 1", df_name="df")
+    assert result.return_value.startswith("Warning: query returned 0 rows.")
+    assert "row_count: 0" in result.return_value
+    assert "ColumnValues(table, column)" in result.return_value
+    assert result.metadata == {"ui": {"has_tool_content": False}}
 
-    assert "dtypes: tid=datetime64[ns], val=float64" in result.return_value
-    assert pd.api.types.is_datetime64_any_dtype(ctx.deps.shell.user_ns["df"]["tid"])
 
+def test_sql_warns_when_result_is_truncated(assistant_module, monkeypatch):
+    df = pd.DataFrame({"x": range(3)})
+    _patch_run_query(assistant_module, monkeypatch, df, truncated=True)
 
-def test_sql_skips_datetime_conversion_without_df_name(assistant_module, monkeypatch):
-    import datetime
+    ctx = SimpleNamespace(deps=SimpleNamespace(user_id=1, shell=SimpleNamespace(user_ns={})))
+    result = asyncio.run(assistant_module.Sql(ctx, query="select x from big"))
 
-    df = pd.DataFrame({"tid": [datetime.date(2024, 1, 1)], "val": [1.5]})
-    monkeypatch.setattr(assistant_module, "dst_read_engine", _DummyEngine())
-    monkeypatch.setattr(assistant_module.pd, "read_sql", lambda query, conn: df)
+    assert "Warning: result truncated at the row/byte cap." in result.return_value
 
-    def fail_to_datetime(_):
-        raise AssertionError("pd.to_datetime should not be called without df_name")
 
-    monkeypatch.setattr(assistant_module.pd, "to_datetime", fail_to_datetime)
+def test_sql_surfaces_statement_timeout_as_model_retry(assistant_module, monkeypatch):
+    from varro.agent.sql import QueryTimeoutError
 
-    ctx = SimpleNamespace(deps=SimpleNamespace(shell=SimpleNamespace(user_ns={})))
-    result = assistant_module.Sql(ctx, query="select 1")
+    async def timeout_run_query(query):
+        raise QueryTimeoutError("Query cancelled after the 60s statement timeout.")
 
-    assert "dtypes:" not in result.return_value
+    monkeypatch.setattr(assistant_module, "guarded_query", timeout_run_query)
+    monkeypatch.setattr(assistant_module, "guarded_preview", timeout_run_query)
 
+    ctx = SimpleNamespace(deps=SimpleNamespace(user_id=1, shell=SimpleNamespace(user_ns={})))
+    with pytest.raises(assistant_module.ModelRetry, match="statement timeout"):
+        asyncio.run(assistant_module.Sql(ctx, query="select * from fact.folk1a"))
 
-def test_sql_warns_when_query_returns_no_rows(assistant_module, monkeypatch):
-    df = pd.DataFrame(columns=["x"])
-    monkeypatch.setattr(assistant_module, "dst_read_engine", _DummyEngine())
-    monkeypatch.setattr(assistant_module.pd, "read_sql", lambda query, conn: df)
 
-    ctx = SimpleNamespace(deps=SimpleNamespace(shell=SimpleNamespace(user_ns={})))
-    result = assistant_module.Sql(ctx, query="select 1 as x where false")
+def test_sql_without_df_name_uses_preview_and_server_row_count(assistant_module, monkeypatch):
+    df = pd.DataFrame({"x": range(30)})
+    _patch_run_query(assistant_module, monkeypatch, df, row_count=1_250_000)
 
-    assert result.return_value.startswith("Warning: query returned 0 rows.")
-    assert "row_count: 0" in result.return_value
-    assert "ColumnValues(table, column)" in result.return_value
-    assert result.metadata == {"ui": {"has_tool_content": False}}
+    async def fail_run_query(query):
+        raise AssertionError("run_query should only be used when df_name is given")
+
+    monkeypatch.setattr(assistant_module, "guarded_query", fail_run_query)
+
+    ctx = SimpleNamespace(deps=SimpleNamespace(user_id=1, shell=SimpleNamespace(user_ns={})))
+    result = asyncio.run(assistant_module.Sql(ctx, query="select x from fact.big"))
+
+    assert result.return_value.startswith("row_count: 1250000\n")
+    assert "df.head(30)" in result.return_value
+    assert ctx.deps.shell.user_ns == {}
+
+
+def test_sql_stores_dataframe_off_the_event_loop_thread(assistant_module, monkeypatch):
+    import threading
+
+    df = pd.DataFrame({"x": [1, 2]})
+    _patch_run_query(assistant_module, monkeypatch, df)
+    store_threads = []
+
+    class _Namespace(dict):
+        def __setitem__(self, key, value):
+            store_threads.append(threading.get_ident())
+            super().__setitem__(key, value)
+
+    ctx = SimpleNamespace(deps=SimpleNamespace(user_id=1, shell=SimpleNamespace(user_ns=_Namespace())))
+
+    async def run():
+        loop_thread = threading.get_ident()
+        await assistant_module.Sql(ctx, query="select 1 as x", df_name="df_x")
+        return loop_thread
+
+    loop_thread = asyncio.run(run())
+
+    assert store_threads and store_threads[0] != loop_thread
+    assert ctx.deps.shell.user_ns["df_x"].equals(df)
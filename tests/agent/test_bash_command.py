@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import importlib
 import resource
+import time
 from pathlib import Path
 from types import SimpleNamespace
 
@@ -172,3 +173,71 @@ def test_apply_limits_skips_nproc_when_unset(monkeypatch):
     assert resource.RLIMIT_AS in kinds
     assert resource.RLIMIT_NOFILE in kinds
     assert resource.RLIMIT_FSIZE in kinds
+
+
+def test_bash_session_reuses_one_shell_per_chat(tmp_path: Path, monkeypatch):
+    sandbox = importlib.import_module("varro.agent.sandbox")
+    (tmp_path / "sub").mkdir()
+    monkeypatch.setattr(sandbox, "SHELL_MODE", "BWRAP")
+    monkeypatch.setattr(sandbox, "user_workspace_root", lambda user_id: tmp_path)
+    # No bwrap here: the session is a plain `sh` and paths are host paths.
+    monkeypatch.setattr(sandbox, "_build_bwrap_bash_args", lambda user_root, cwd_rel: [])
+    monkeypatch.setattr(sandbox, "_normalize_existing_cwd", lambda user_root, cwd_rel: cwd_rel)
+    sessions = sandbox.BashSessions()
+    monkeypatch.setattr(sandbox, "bash_sessions", sessions)
+    root = str(tmp_path)
+
+    try:
+        assert sandbox.run_bash_command(1, root, "cd sub && echo hi", chat_id=5) == (
+            "hi",
+            f"{root}/sub",
+        )
+        output, cwd = sandbox.run_bash_command(1, f"{root}/sub", "false", chat_id=5)
+        assert output == "Error: command failed with exit code 1"
+        assert cwd == f"{root}/sub"
+        assert sandbox.run_bash_command(1, root, "python -c 1", chat_id=5)[0] == (
+            "Error: command not allowed: python"
+        )
+        assert sessions.spawns == 1
+
+        session = sessions._lease(1, 5)
+        assert session.run(root, "sleep 5", timeout=0.2)[0] == (
+            "Error: command timed out after 0.2s"
+        )
+        assert not session.alive
+        assert sandbox.run_bash_command(1, root, "pwd", chat_id=5) == (root, root)
+        assert sessions.spawns == 2
+
+        sessions.evict_idle(0)
+        assert len(sessions) == 0
+    finally:
+        sessions.close_all()
+
+
+def test_bash_session_kills_background_jobs_after_each_command(tmp_path: Path, monkeypatch):
+    sandbox = importlib.import_module("varro.agent.sandbox")
+    monkeypatch.setattr(sandbox, "_build_bwrap_bash_args", lambda user_root, cwd_rel: [])
+    session = sandbox.BashSession(tmp_path)
+    root = str(tmp_path)
+    try:
+        output, _ = session.run(root, "sleep 30 & echo $! > job.pid; echo started")
+        assert output == "started"
+        assert not session.busy
+        pid = int((tmp_path / "job.pid").read_text())
+
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            try:
+                state = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[0]
+            except FileNotFoundError:
+                break
+            if state == "Z":
+                break
+            time.sleep(0.02)
+        else:
+            raise AssertionError("background job outlived its command")
+
+        # The session itself keeps working.
+        assert session.run(root, "echo again")[0] == "again"
+    finally:
+        session.close()
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import importlib
+from pathlib import Path
+
+import pandas as pd
+
+
+def _user_root(monkeypatch, tmp_path: Path) -> Path:
+    workspace = importlib.import_module("varro.agent.workspace")
+    monkeypatch.setattr(workspace, "DATA_DIR", tmp_path)
+    root = tmp_path / "user" / "1"
+    root.mkdir(parents=True)
+    return root
+
+
+def test_read_file_pages_parquet_rows_from_footer_and_row_groups(
+    tmp_path: Path, monkeypatch
+) -> None:
+    root = _user_root(monkeypatch, tmp_path)
+    pd.DataFrame({"id": range(100), "label": [f"r{i}" for i in range(100)]}).to_parquet(
+        root / "rows.parquet", index=False, row_group_size=10
+    )
+    filesystem = importlib.import_module("varro.agent.filesystem")
+
+    head = filesystem.read_file("/rows.parquet", user_id=1, limit=2)
+    page = filesystem.read_file("/rows.parquet", user_id=1, offset=19, limit=3)
+
+    lines = head.splitlines()
+    assert lines[0] == "rows.parquet: 100 rows, 2 columns, 10 row groups"
+    assert lines[1].startswith("dtypes: id=int64, label=")
+    assert lines[2:] == ["rows.head(2)", "id|label", "0|r0", "1|r1"]
+    assert page.splitlines()[2:] == ["rows.iloc[18:21]", "id|label", "18|r18", "19|r19", "20|r20"]
+
+    # A huge limit is capped like the line limit for text files.
+    monkeypatch.setattr(filesystem, "MAX_LINES_DEFAULT", 5)
+    capped = filesystem.read_file("/rows.parquet", user_id=1, offset=98, limit=10**9)
+    assert capped.splitlines()[2:] == ["rows.iloc[97:100]", "id|label", "97|r97", "98|r98", "99|r99"]
+    capped = filesystem.read_file("/rows.parquet", user_id=1, limit=10**9)
+    assert capped.splitlines()[2] == "rows.head(5)"
+
+
+def test_read_file_pages_text_through_cached_line_index(tmp_path: Path, monkeypatch) -> None:
+    root = _user_root(monkeypatch, tmp_path)
+    line_index = importlib.import_module("varro.agent.line_index")
+    filesystem = importlib.import_module("varro.agent.filesystem")
+    monkeypatch.setattr(line_index, "LINE_INDEX_DIR", tmp_path / "line_index")
+    monkeypatch.setattr(line_index, "LINE_INDEX_STRIDE", 10)
+    monkeypatch.setattr(filesystem, "MAX_LINE_LENGTH", 5)
+    log = root / "log.txt"
+    log.write_text("".join(f"{i}{'é' * 20 if i == 42 else ''}\r\n" for i in range(1, 101)))
+
+    page = filesystem.read_file("/log.txt", user_id=1, offset=41, limit=3)
+    assert page == "    41\t41\n    42\t42ééé\n    43\t43"
+    assert len(list((tmp_path / "line_index").rglob("*.npy"))) == 1
+
+    log.write_text("".join(f"new {i}\n" for i in range(1, 31)))
+    assert filesystem.read_file("/log.txt", user_id=1, offset=30) == "    30\tnew 3"
+    assert filesystem.read_file("/log.txt", user_id=1, offset=31) == ""
+    assert len(list((tmp_path / "line_index").rglob("*.npy"))) == 1
@@ -9,6 +9,7 @@ from pydantic_ai import BinaryContent
 from PIL import Image
 
 from varro.agent.images import JUPYTER_SHOW_MAX_PIXELS, optimize_png_bytes
+from varro.agent.png_cache import PngCache
 
 
 def _png_bytes(width: int, height: int) -> bytes:
@@ -38,13 +39,14 @@ def test_optimize_png_bytes_resizes_proportionally_above_threshold() -> None:
         assert abs((image.width / image.height) - original_ratio) < 0.01
 
 
-def test_show_element_plotly_uses_jupyter_pixel_cap(monkeypatch) -> None:
+def test_show_element_plotly_uses_jupyter_pixel_cap(monkeypatch, tmp_path) -> None:
     utils = importlib.import_module("varro.agent.utils")
+    monkeypatch.setattr(utils, "png_cache", PngCache(tmp_path))
 
-    async def fake_html_to_png(*args, **kwargs):
+    async def fake_figure_to_png(*args, **kwargs):
         return _png_bytes(2000, 2000)
 
-    monkeypatch.setattr(utils, "html_to_png", fake_html_to_png)
+    monkeypatch.setattr(utils, "figure_to_png", fake_figure_to_png)
 
     figure = go.Figure(data=[go.Scatter(x=[1, 2], y=[1, 3])])
     rendered = asyncio.run(utils.show_element(figure))
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from varro.agent import playwright_render
+
+
+class _FakePage:
+    active = 0
+    peak = 0
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.renders: list[str] = []
+        self.closed = False
+
+    async def evaluate(self, script, args):
+        assert "Plotly.react" in script
+        _FakePage.active += 1
+        _FakePage.peak = max(_FakePage.peak, _FakePage.active)
+        try:
+            await asyncio.sleep(0.01)
+            if self.fail:
+                raise RuntimeError("page crashed")
+            self.renders.append(args["figure"])
+            return [args["width"], args["height"]]
+        finally:
+            _FakePage.active -= 1
+
+    def locator(self, selector):
+        page = self
+
+        class _Locator:
+            async def screenshot(self, **kwargs):
+                return f"png:{page.renders[-1]}".encode()
+
+        return _Locator()
+
+    async def close(self):
+        self.closed = True
+
+
+def test_rasterizer_reuses_pooled_pages_up_to_the_concurrency_limit(monkeypatch):
+    pages: list[_FakePage] = []
+
+    async def fake_new_page(self):
+        page = _FakePage(fail=not pages)
+        pages.append(page)
+        return page
+
+    monkeypatch.setattr(playwright_render.FigureRasterizer, "_new_page", fake_new_page)
+    rasterizer = playwright_render.FigureRasterizer(concurrency=2)
+
+    async def run():
+        # The first page fails its render and is replaced, not returned to the pool.
+        with pytest.raises(RuntimeError, match="page crashed"):
+            await rasterizer.render("{}")
+        return await asyncio.gather(*(rasterizer.render(f"fig{i}") for i in range(6)))
+
+    assert asyncio.run(run()) == [f"png:fig{i}".encode() for i in range(6)]
+    assert pages[0].closed
+    assert len(pages) == 3
+    assert _FakePage.peak == 2
+    assert sorted(len(p.renders) for p in pages[1:]) == [3, 3]
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+import io
+import json
+
+import plotly.graph_objects as go
+from PIL import Image
+
+from varro.agent.png_cache import PngCache, figure_key
+
+
+def _png_bytes(width: int, height: int) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), color=(20, 60, 180)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_figure_key_ignores_key_order_but_not_viewport_or_pixel_cap():
+    spec = {"data": [{"type": "bar", "y": [1, 2]}], "layout": {"title": {"text": "x"}}}
+    reordered = {"layout": spec["layout"], "data": spec["data"]}
+    key = figure_key(json.dumps(spec), width=600, height=600, max_pixels=1000)
+    assert figure_key(json.dumps(reordered), width=600, height=600, max_pixels=1000) == key
+    assert figure_key(json.dumps(spec), width=800, height=600, max_pixels=1000) != key
+    assert figure_key(json.dumps(spec), width=600, height=600, max_pixels=2000) != key
+
+
+def test_png_cache_evicts_least_recently_used(tmp_path):
+    cache = PngCache(tmp_path, max_bytes=250)
+    for key in ("a", "b"):
+        cache.put(key, b"x" * 100)
+    assert cache.get("a") == b"x" * 100
+    cache.put("c", b"y" * 100)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+
+
+def test_identical_figures_are_rasterized_once(tmp_path, monkeypatch):
+    utils = importlib.import_module("varro.agent.utils")
+    monkeypatch.setattr(utils, "png_cache", PngCache(tmp_path))
+    renders = []
+
+    async def fake_figure_to_png(figure_json, **kwargs):
+        renders.append(figure_json)
+        return _png_bytes(40, 30)
+
+    monkeypatch.setattr(utils, "figure_to_png", fake_figure_to_png)
+
+    async def run():
+        first = await utils.plotly_figure_to_png(go.Figure(go.Bar(y=[1, 2])), max_pixels=10_000)
+        again = await utils.plotly_figure_to_png(go.Figure(go.Bar(y=[1, 2])), max_pixels=10_000)
+        other = await utils.plotly_figure_to_png(go.Figure(go.Bar(y=[1, 3])), max_pixels=10_000)
+        return first, again, other
+
+    first, again, other = asyncio.run(run())
+    assert first == again
+    assert len(renders) == 2
+
+
+def test_figures_are_rendered_when_the_png_cache_is_broken(tmp_path, monkeypatch):
+    utils = importlib.import_module("varro.agent.utils")
+    (tmp_path / "index.sqlite").mkdir()
+    monkeypatch.setattr(utils, "png_cache", PngCache(tmp_path))
+
+    async def fake_figure_to_png(figure_json, **kwargs):
+        return _png_bytes(40, 30)
+
+    monkeypatch.setattr(utils, "figure_to_png", fake_figure_to_png)
+    png = asyncio.run(utils.plotly_figure_to_png(go.Figure(go.Bar(y=[1])), max_pixels=10_000))
+    assert png.startswith(b"\x89PNG")
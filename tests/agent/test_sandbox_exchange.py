@@ -1,6 +1,13 @@
 from __future__ import annotations
 
 import importlib
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from varro.agent.exchange import read_frame, write_frame
 
 
 class _DummyProc:
@@ -24,76 +31,235 @@ class _DummyProc:
         self._alive = False
 
 
-def test_exchange_dir_is_scoped_per_chat_and_cleaned_on_close(tmp_path, monkeypatch):
-    sandbox = importlib.import_module("varro.agent.sandbox")
-    user_root = tmp_path / "user" / "1"
-    user_root.mkdir(parents=True, exist_ok=True)
-    monkeypatch.setattr(sandbox, "user_workspace_root", lambda user_id: user_root)
-    monkeypatch.setattr(
-        sandbox.SandboxShellProxy,
-        "_spawn_worker",
-        lambda self: _DummyProc(),
-    )
+def _fake_worker(sandbox, monkeypatch, requests=None):
+    monkeypatch.setattr(sandbox.SandboxShellProxy, "_spawn_worker", lambda self: _DummyProc())
     monkeypatch.setattr(
         sandbox.SandboxShellProxy,
         "_request",
-        lambda self, payload: {"ok": True},
+        lambda self, payload: (requests.append(payload) if requests is not None else None)
+        or {"ok": True},
     )
 
+
+def _save_in_worker(shell, text):
+    # Snapshots are saved by writing a new file and renaming it over the old.
+    tmp = shell.state_dir / "shell.tmp"
+    tmp.write_text(text)
+    tmp.replace(shell.state_dir / "shell.pkl")
+
+
+def _dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def _dropped_shell(sandbox, monkeypatch, snapshot_fp):
+    """A shell whose owning process died without closing it."""
+    dead_pid = _dead_pid()
+    with monkeypatch.context() as m:
+        m.setattr(sandbox.os, "getpid", lambda: dead_pid)
+        shell = sandbox.SandboxShellProxy(user_id=1, chat_id=4, snapshot_fp=snapshot_fp)
+    _save_in_worker(shell, '{"saved": true}')
+    return shell
+
+
+def test_exchange_dir_is_scoped_per_worker_and_cleaned_on_close(tmp_path, monkeypatch):
+    sandbox = importlib.import_module("varro.agent.sandbox")
+    user_root = tmp_path / "user" / "1"
+    user_root.mkdir(parents=True, exist_ok=True)
+    monkeypatch.setattr(sandbox, "user_workspace_root", lambda user_id: user_root)
+    monkeypatch.setattr(sandbox, "EXCHANGE_SHM_ROOT", tmp_path / "shm" / "varro_exchange")
+    _fake_worker(sandbox, monkeypatch)
+
     shell = sandbox.SandboxShellProxy(
         user_id=1,
         chat_id=5,
         snapshot_fp=tmp_path / "chat" / "1" / "5" / "shell.pkl",
     )
+    spare = sandbox.SandboxShellProxy(user_id=1, state_root=tmp_path / "chat" / "1")
 
-    assert shell._exchange_dir == user_root / ".varro_exchange" / "5"
-    assert shell._exchange_dir.exists()
+    user_exchange_root = tmp_path / "shm" / "varro_exchange" / "1"
+    assert shell._exchange_dir.parent == user_exchange_root
+    assert shell._exchange_dir != spare._exchange_dir
+    assert shell._exchange_dir.exists() and spare._exchange_dir.exists()
 
     shell.close(save_snapshot=False)
 
-    assert not (user_root / ".varro_exchange" / "5").exists()
+    # The user's other workers keep their exchange dirs.
+    assert not shell._exchange_dir.exists()
+    assert spare._exchange_dir.exists()
+    spare.close(save_snapshot=False)
+    assert user_exchange_root.exists()
 
 
-def test_exchange_dir_is_recreated_clean_when_chat_starts(tmp_path, monkeypatch):
+def test_fallback_exchange_dir_close_keeps_the_workspace(tmp_path, monkeypatch):
     sandbox = importlib.import_module("varro.agent.sandbox")
     user_root = tmp_path / "user" / "1"
-    stale_dir = user_root / ".varro_exchange" / "9"
-    stale_dir.mkdir(parents=True, exist_ok=True)
-    (stale_dir / "stale.bin").write_bytes(b"stale")
-
+    user_root.mkdir(parents=True, exist_ok=True)
     monkeypatch.setattr(sandbox, "user_workspace_root", lambda user_id: user_root)
-    monkeypatch.setattr(
-        sandbox.SandboxShellProxy,
-        "_spawn_worker",
-        lambda self: _DummyProc(),
-    )
-    monkeypatch.setattr(
-        sandbox.SandboxShellProxy,
-        "_request",
-        lambda self, payload: {"ok": True},
-    )
+    # No usable tmpfs: fall back to the exchange dir inside the workspace.
+    (tmp_path / "not_a_dir").write_bytes(b"")
+    monkeypatch.setattr(sandbox, "EXCHANGE_SHM_ROOT", tmp_path / "not_a_dir" / "shm")
+    _fake_worker(sandbox, monkeypatch)
 
     shell = sandbox.SandboxShellProxy(
         user_id=1,
         chat_id=9,
         snapshot_fp=tmp_path / "chat" / "1" / "9" / "shell.pkl",
     )
-    try:
-        assert shell._exchange_dir.exists()
-        assert not (shell._exchange_dir / "stale.bin").exists()
-    finally:
-        shell.close(save_snapshot=False)
+    assert shell._exchange_dir.parent == user_root / ".varro_exchange"
+    assert list(shell._exchange_dir.iterdir()) == []
+
+    shell.close(save_snapshot=False)
+
+    assert not shell._exchange_dir.exists()
+    assert user_root.is_dir()
 
 
 def test_worker_args_include_exchange_dir_argument(tmp_path):
     sandbox = importlib.import_module("varro.agent.sandbox")
     user_root = tmp_path / "user"
     snapshot_dir = tmp_path / "chat"
+    exchange_root = tmp_path / "shm" / "1"
     args = sandbox._build_bwrap_worker_args(
         user_root,
         snapshot_dir,
-        "/.varro_exchange/7",
+        exchange_root,
     )
 
     idx = args.index("--exchange-dir")
-    assert args[idx + 1] == "/.varro_exchange/7"
+    assert args[idx + 1] == "/varro_exchange"
+    bind = args.index(str(exchange_root))
+    assert args[bind - 1 : bind + 2] == ["--bind", str(exchange_root), "/varro_exchange"]
+
+
+def test_dataframes_cross_the_exchange_as_arrow_ipc(tmp_path, monkeypatch):
+    sandbox = importlib.import_module("varro.agent.sandbox")
+    user_root = tmp_path / "user" / "1"
+    user_root.mkdir(parents=True, exist_ok=True)
+    monkeypatch.setattr(sandbox, "user_workspace_root", lambda user_id: user_root)
+    monkeypatch.setattr(sandbox, "EXCHANGE_SHM_ROOT", tmp_path / "shm")
+    worker_ns = {}
+
+    def fake_request(self, payload):
+        # Stand-in for the worker: read host files, write files for the host.
+        if payload["op"] == "set_dataframe":
+            worker_ns[payload["name"]] = read_frame(self._worker_path_to_host(payload["path"]))
+        if payload["op"] == "get_object":
+            fp = self._exchange_dir / "df_out.arrow"
+            write_frame(worker_ns[payload["name"]] * 2, fp)
+            return {"ok": True, "kind": "dataframe", "path": "/varro_exchange/df_out.arrow"}
+        return {"ok": True}
+
+    monkeypatch.setattr(sandbox.SandboxShellProxy, "_spawn_worker", lambda self: _DummyProc())
+    monkeypatch.setattr(sandbox.SandboxShellProxy, "_request", fake_request)
+    shell = sandbox.SandboxShellProxy(user_id=1, chat_id=3, snapshot_fp=tmp_path / "s.pkl")
+    try:
+        df = pd.DataFrame({"indhold": [1.5, 2.0]}, index=pd.Index(["0", "101"], name="omrade"))
+        shell.user_ns["df"] = df
+        pd.testing.assert_frame_equal(worker_ns["df"], df)
+        worker_ns["df"].loc["0", "indhold"] = 3.0
+
+        shell._cache.clear()
+        doubled = shell.user_ns.get("df")
+        assert doubled.loc["0", "indhold"] == 6.0
+        assert list(shell._exchange_dir.iterdir()) == []
+        with pytest.raises(RuntimeError, match="outside the exchange dir"):
+            shell._worker_path_to_host("/varro_exchange/../etc/passwd")
+    finally:
+        shell.close(save_snapshot=False)
+
+
+def test_warm_worker_attaches_to_a_chat_later(tmp_path, monkeypatch):
+    sandbox = importlib.import_module("varro.agent.sandbox")
+    user_root = tmp_path / "user" / "1"
+    user_root.mkdir(parents=True, exist_ok=True)
+    monkeypatch.setattr(sandbox, "user_workspace_root", lambda user_id: user_root)
+    monkeypatch.setattr(sandbox, "EXCHANGE_SHM_ROOT", tmp_path / "shm")
+    requests = []
+    _fake_worker(sandbox, monkeypatch, requests)
+
+    state_root = tmp_path / "chat" / "1"
+    snapshot_fp = state_root / "4" / "shell.pkl"
+    snapshot_fp.parent.mkdir(parents=True)
+    snapshot_fp.write_text("{}")
+    (state_root / "4" / "shell.vars").mkdir()
+    (state_root / "7").mkdir()
+
+    shell = sandbox.SandboxShellProxy(user_id=1, state_root=state_root)
+    assert shell.chat_id is None
+    assert requests == [{"op": "ping"}]
+    # The worker's /varro_state is a private dir, not the user's chat data dir.
+    assert shell.state_dir.parent == state_root / ".workers"
+    assert list(shell.state_dir.iterdir()) == []
+
+    shell.attach(chat_id=4, snapshot_fp=snapshot_fp)
+    assert requests[-1] == {
+        "op": "attach",
+        "snapshot_path": "/varro_state/shell.pkl",
+        "exchange_dir": "/varro_exchange",
+    }
+    assert sorted(p.name for p in shell.state_dir.iterdir()) == ["shell.pkl", "shell.vars"]
+    # Linked in, not moved: the chat keeps its snapshot while the shell is leased.
+    assert snapshot_fp.read_text() == "{}"
+
+    _save_in_worker(shell, '{"saved": true}')
+    shell.close(save_snapshot=True)
+    assert snapshot_fp.read_text() == '{"saved": true}'
+    assert (state_root / "4" / "shell.vars").is_dir()
+    assert not shell.state_dir.exists()
+
+
+def _chat_snapshot(tmp_path, sandbox, monkeypatch):
+    user_root = tmp_path / "user" / "1"
+    user_root.mkdir(parents=True, exist_ok=True)
+    monkeypatch.setattr(sandbox, "user_workspace_root", lambda user_id: user_root)
+    monkeypatch.setattr(sandbox, "EXCHANGE_SHM_ROOT", tmp_path / "shm")
+    _fake_worker(sandbox, monkeypatch)
+    snapshot_fp = tmp_path / "chat" / "1" / "4" / "shell.pkl"
+    (snapshot_fp.parent / "shell.vars").mkdir(parents=True)
+    (snapshot_fp.parent / "shell.vars" / "a.arrow").write_bytes(b"frame")
+    snapshot_fp.write_text("{}")
+    return snapshot_fp
+
+
+def test_snapshot_survives_a_shell_that_is_never_closed(tmp_path, monkeypatch):
+    sandbox = importlib.import_module("varro.agent.sandbox")
+    snapshot_fp = _chat_snapshot(tmp_path, sandbox, monkeypatch)
+
+    dropped = _dropped_shell(sandbox, monkeypatch, snapshot_fp)
+
+    assert snapshot_fp.read_text() == "{}"
+    assert (snapshot_fp.parent / "shell.vars" / "a.arrow").read_bytes() == b"frame"
+
+    # The next shell for the user sweeps the dead worker's dirs.
+    shell = sandbox.SandboxShellProxy(user_id=1, chat_id=4, snapshot_fp=snapshot_fp)
+    try:
+        assert not dropped.state_dir.exists()
+        assert not dropped._exchange_dir.exists()
+        assert sorted(p.name for p in shell.state_dir.parent.iterdir()) == [
+            shell.state_dir.name,
+            shell.state_dir.name + ".attached",
+        ]
+        assert snapshot_fp.read_text() == "{}"
+        assert (shell.state_dir / "shell.vars" / "a.arrow").read_bytes() == b"frame"
+    finally:
+        shell.close(save_snapshot=False)
+    assert snapshot_fp.read_text() == "{}"
+
+
+def test_sweep_recovers_a_snapshot_whose_move_back_was_cut_short(tmp_path, monkeypatch):
+    sandbox = importlib.import_module("varro.agent.sandbox")
+    snapshot_fp = _chat_snapshot(tmp_path, sandbox, monkeypatch)
+
+    dropped = _dropped_shell(sandbox, monkeypatch, snapshot_fp)
+    # The process died in close() after removing the chat's copy.
+    sandbox.remove_snapshot(snapshot_fp)
+
+    spare = sandbox.SandboxShellProxy(user_id=1, state_root=snapshot_fp.parent)
+    spare.close(save_snapshot=False)
+
+    assert not dropped.state_dir.exists()
+    assert snapshot_fp.read_text() == '{"saved": true}'
+    assert (snapshot_fp.parent / "shell.vars" / "a.arrow").read_bytes() == b"frame"
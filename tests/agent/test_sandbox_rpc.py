@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+import io
+import subprocess
+import sys
+import threading
+from collections import deque
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from pydantic_ai import BinaryContent
+
+from varro.agent import worker_rpc
+
+
+def test_framing_round_trips_binary_payloads_and_detects_truncation():
+    stream = io.BytesIO()
+    worker_rpc.send_message(stream, {"id": 1, "op": "render_show", "data": b"\x89PNG\x00"})
+    worker_rpc.send_message(stream, {"id": 2, "ok": True})
+    stream.seek(0)
+    assert worker_rpc.recv_message(stream) == {"id": 1, "op": "render_show", "data": b"\x89PNG\x00"}
+    assert worker_rpc.recv_message(stream) == {"id": 2, "ok": True}
+    assert worker_rpc.recv_message(stream) is None
+
+    truncated = io.BytesIO(stream.getvalue()[:-3])
+    worker_rpc.recv_message(truncated)
+    with pytest.raises(worker_rpc.ProtocolError, match="mid-message"):
+        worker_rpc.recv_message(truncated)
+
+
+@pytest.fixture
+def worker_shell(tmp_path, monkeypatch):
+    """A SandboxShellProxy talking to a real worker process, without bwrap."""
+    sandbox = importlib.import_module("varro.agent.sandbox")
+    user_root = tmp_path / "user" / "1"
+    user_root.mkdir(parents=True)
+    monkeypatch.setattr(sandbox, "user_workspace_root", lambda user_id: user_root)
+    monkeypatch.setattr(sandbox, "EXCHANGE_SHM_ROOT", tmp_path / "shm")
+
+    def spawn(self):
+        # Without bwrap the worker sees the host path of its exchange dir.
+        self._exchange_dir_guest = str(self._exchange_dir)
+        return subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import sys; from varro.agent import ipython_worker; "
+                "ipython_worker.BLOB_INLINE_MAX = 10_000; sys.exit(ipython_worker.main())",
+                "--exchange-dir",
+                str(self._exchange_dir),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    monkeypatch.setattr(sandbox.SandboxShellProxy, "_spawn_worker", spawn)
+    shell = sandbox.SandboxShellProxy(user_id=1, chat_id=3, snapshot_fp=tmp_path / "state" / "shell.pkl")
+    try:
+        yield shell
+    finally:
+        shell.close(save_snapshot=False)
+
+
+def test_worker_rpc_pipelines_render_show_and_survives_raw_stdout(worker_shell, monkeypatch):
+    worker_shell.user_ns["df"] = pd.DataFrame({"omrade": ["0", "101"], "indhold": [1.5, 2.0]})
+    res = worker_shell.run_cell(
+        "import os\n"
+        "os.write(1, b'raw output outside capture\\n')\n"
+        "fig = go.Figure(go.Scatter(x=list(range(2000)), y=list(range(2000))))\n"
+        "mfig = plt.figure()\n"
+        "print(df.indhold.sum())"
+    )
+    assert res.error_in_exec is None
+    assert res.stdout == "3.5\n"
+
+    async def fake_show_element(fig):
+        return f"png:{len(fig.data[0].x)}"
+
+    sandbox = importlib.import_module("varro.agent.sandbox")
+    monkeypatch.setattr(sandbox, "show_element", fake_show_element)
+    text, fig_png, mpl_png = asyncio.run(worker_shell.render_show_many(["df", "fig", "mfig"]))
+    with pytest.raises(ValueError, match="Invalid output type"):
+        asyncio.run(worker_shell.render_show_many(["df", "missing"]))
+
+    assert "101" in text
+    # The figure JSON exceeds the inline limit and came through the exchange dir.
+    assert fig_png == "png:2000"
+    assert isinstance(mpl_png, BinaryContent)
+    assert mpl_png.data.startswith(b"\x89PNG")
+    assert len(worker_shell.get_user_ns_item("fig").data[0].x) == 2000
+    assert list(worker_shell._exchange_dir.iterdir()) == []
+
+
+def test_cell_only_invalidates_host_copies_of_names_it_changed(worker_shell, monkeypatch):
+    sandbox = importlib.import_module("varro.agent.sandbox")
+    renders = []
+
+    async def fake_show_element(fig):
+        renders.append(fig)
+        return "png"
+
+    monkeypatch.setattr(sandbox, "show_element", fake_show_element)
+    worker_shell.run_cell(
+        "df = pd.DataFrame({'x': [1, 2]})\nfig = go.Figure(go.Bar(y=[1]))\nview = df"
+    )
+    asyncio.run(worker_shell.render_show_many(["df", "fig"]))
+    assert worker_shell.get_user_ns_item("fig") is worker_shell._cache["fig"]
+
+    # Reading and rebinding leave the other cached copies in place.
+    worker_shell.get_user_ns_item("view")
+    worker_shell.run_cell("print(df.x.sum())\nn = 1")
+    assert set(worker_shell._cache) == {"fig", "view"}
+    worker_shell.run_cell("df = df.assign(y=1)")
+    assert set(worker_shell._cache) == {"fig", "view"}
+    assert set(worker_shell._render_cache) == {"fig"}
+
+    # A mutation through a container reaches fig without naming it, so any
+    # in-place change drops every host copy.
+    worker_shell.run_cell("figs = {'a': fig}")
+    worker_shell.run_cell("figs['a'].update_layout(title='Ny titel')")
+    assert worker_shell._cache == {} and worker_shell._render_cache == {}
+
+    text, _ = asyncio.run(worker_shell.render_show_many(["df", "fig"]))
+    assert "y" in text
+    assert len(renders) == 2
+    assert renders[-1].layout.title.text == "Ny titel"
+
+
+def test_reader_failure_is_logged_and_fails_pending_requests(caplog):
+    sandbox = importlib.import_module("varro.agent.sandbox")
+    shell = object.__new__(sandbox.SandboxShellProxy)
+    shell.user_id = 1
+    shell._proc = SimpleNamespace(stdout=io.BytesIO(b"\x00\x00\x00\x05garbage"))
+    shell._pending_lock = threading.Lock()
+    shell._stderr_lines = deque()
+    shell._stream_closed = False
+    future: Future = Future()
+    shell._pending = {7: future}
+
+    with caplog.at_level("ERROR", logger="varro.agent.sandbox"):
+        shell._read_responses()
+
+    assert "Reading sandbox worker responses failed" in caplog.text
+    with pytest.raises(RuntimeError, match="response stream failed") as excinfo:
+        future.result(timeout=0)
+    assert excinfo.value.__cause__ is not None
+    assert shell._stream_closed
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import dill
+import pandas as pd
+
+from varro.agent.shell_snapshot import (
+    NamespaceTracker,
+    SnapshotStore,
+    load_snapshot,
+    remove_snapshot,
+    save_snapshot,
+    snapshot_vars_dir,
+)
+
+
+def _run(tracker: NamespaceTracker, code: str) -> set[str]:
+    tracker.before_cell(code)
+    exec(code, tracker.user_ns)
+    return tracker.after_cell(code)
+
+
+def test_tracker_reports_created_rebound_mutated_and_deleted_names():
+    ns = {"__builtins__": __builtins__}
+    tracker = NamespaceTracker(ns)
+    assert _run(tracker, "import pandas as pd\ndf = pd.DataFrame({'x': [1, 2]})\nn = 1") == {
+        "pd",
+        "df",
+        "n",
+    }
+    exec("other = pd.DataFrame({'y': [1]})\nitems = []", ns)
+    tracker.before_cell()
+
+    # Reading a frame is not a change (even one restored outside a cell);
+    # mutating it in place is.
+    assert _run(tracker, "total = df.x.sum() + other.y.sum()") == {"total"}
+    assert not tracker.mutated
+    assert _run(tracker, "df.loc[0, 'x'] = 5") == {"df"}
+    assert tracker.mutated
+    # Unreferenced objects are not considered mutated; referenced mutable ones are.
+    assert _run(tracker, "items.append(1)") == {"items"}
+    assert tracker.mutated
+    assert _run(tracker, "_ = 3\ndel n\nn2 = total") == {"n", "n2"}
+    assert not tracker.mutated
+
+
+def test_store_saves_only_changed_variables_and_restores_frames_lazily(tmp_path):
+    fp = tmp_path / "5" / "shell.pkl"
+    df = pd.DataFrame({"indhold": [1.5, 2.0]}, index=pd.Index(["0", "101"], name="omrade"))
+    ns = {"df": df, "meta": {"tabel": "folk1a"}, "In": ["hidden"]}
+    save_snapshot(ns, fp, hidden={"In"})
+    files = {p.name for p in snapshot_vars_dir(fp).iterdir()}
+    assert len(files) == 2
+
+    restored: dict = {}
+    store = SnapshotStore(fp)
+    store.load(restored)
+    assert restored == {"meta": {"tabel": "folk1a"}}
+    assert store.pending == {"df"}
+
+    # Only the changed variable is rewritten; the pending frame keeps its file.
+    restored["meta"]["tabel"] = "bef5"
+    store.mark_changed({"meta"})
+    store.save(restored)
+    new_files = {p.name for p in snapshot_vars_dir(fp).iterdir()}
+    assert len(new_files & files) == 1
+    assert len(new_files) == 2
+
+    assert store.ensure_loaded(restored, {"df", "x"}) == ["df"]
+    pd.testing.assert_frame_equal(restored["df"], df)
+    assert restored["meta"] == {"tabel": "bef5"}
+
+    store.clear()
+    restored.clear()
+    store.save(restored)
+    assert list(snapshot_vars_dir(fp).iterdir()) == []
+    remove_snapshot(fp)
+    assert not fp.exists() and not snapshot_vars_dir(fp).exists()
+
+
+def test_legacy_pickled_snapshot_is_loaded(tmp_path):
+    fp = tmp_path / "shell.pkl"
+    fp.write_bytes(dill.dumps({"answer": 42, "df": pd.DataFrame({"x": [1]})}))
+    ns: dict = {}
+    load_snapshot(ns, fp)
+    assert ns["answer"] == 42
+    assert ns["df"].x.tolist() == [1]
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pandas as pd
+import pytest
+
+from varro.agent import sql_guard
+from varro.agent.sql import QueryResult
+
+
+def _scan(table: str, alias: str, rows: float, **extra) -> dict:
+    schema, name = table.split(".")
+    return {
+        "Node Type": "Seq Scan",
+        "Schema": schema,
+        "Relation Name": name,
+        "Alias": alias,
+        "Plan Rows": rows,
+        "Total Cost": rows / 100,
+        **extra,
+    }
+
+
+def _plan(cost: float, rows: float, *children: dict) -> list[dict]:
+    return [
+        {
+            "Plan": {
+                "Node Type": "Nested Loop",
+                "Total Cost": cost,
+                "Plan Rows": rows,
+                "Plans": list(children),
+            }
+        }
+    ]
+
+
+def test_parse_plan_finds_unfiltered_fact_scans_and_exploding_joins():
+    plan = sql_guard.parse_plan(
+        _plan(
+            5e9,
+            2e11,
+            _scan("fact.folk1a", "f", 1e6, Filter="((f.tid >= '2020-01-01'::date))"),
+            _scan("fact.bef5", "b", 2e5),
+        )
+    )
+    assert plan.exceeds()
+    assert [s.table for s in plan.unfiltered_fact_scans] == ["fact.bef5"]
+    assert plan.exploding_joins == [(2e11, 1e6)]
+
+    hints = sql_guard.hints(plan)
+    assert any("fact.bef5 (b)" in h and "tid" in h for h in hints)
+    assert any("total code" in h for h in hints)
+    assert any("Join on all shared dimension columns" in h for h in hints)
+
+
+def test_sample_sql_keeps_aliases_and_only_touches_listed_tables():
+    query = (
+        "SELECT f.omrade, d.titel FROM fact.folk1a f JOIN dim.nuts d ON f.omrade = d.kode "
+        "JOIN fact.bef5 WHERE bef5.koen = 'TOT'"
+    )
+    sampled = sql_guard.sample_sql(query, {"fact.folk1a", "fact.bef5"}, 1.5)
+    assert "FROM fact.folk1a f TABLESAMPLE SYSTEM (1.5) REPEATABLE (0) JOIN" in sampled
+    assert "JOIN fact.bef5 TABLESAMPLE SYSTEM (1.5) REPEATABLE (0) WHERE" in sampled
+    assert "JOIN dim.nuts d" in sampled
+    assert sql_guard.sample_sql(query, {"fact.other"}, 1.5) == query
+
+
+def test_sample_sql_keeps_schema_qualified_column_references():
+    query = "SELECT fact.folk1a.indhold FROM fact.folk1a WHERE fact.folk1a.koen = 'TOT'"
+    sampled = sql_guard.sample_sql(query, {"fact.folk1a"}, 2)
+    assert sampled == (
+        "SELECT fact.folk1a.indhold FROM fact.folk1a TABLESAMPLE SYSTEM (2) REPEATABLE (0) "
+        "WHERE fact.folk1a.koen = 'TOT'"
+    )
+
+
+def _fake_db(monkeypatch, plans: dict[str, list[dict]], rows: int):
+    seen = []
+    conn = object()
+
+    @asynccontextmanager
+    async def fake_transaction(timeout_s):
+        yield conn
+
+    async def fake_explain(query, conn=None):
+        assert conn is not None, "EXPLAIN must share the query's transaction"
+        for marker, plan in plans.items():
+            if marker in query:
+                return plan
+        raise AssertionError(query)
+
+    async def fake_preview(query, preview_rows=30, conn=None):
+        assert conn is not None
+        seen.append(query)
+        df = pd.DataFrame({"x": range(rows)})
+        return QueryResult(df=df, elapsed_s=0.1, rows_fetched=rows, bytes_fetched=0, row_count=rows)
+
+    monkeypatch.setattr(sql_guard, "read_transaction", fake_transaction)
+    monkeypatch.setattr(sql_guard, "explain", fake_explain)
+    monkeypatch.setattr(sql_guard, "run_preview", fake_preview)
+    return seen
+
+
+def test_expensive_preview_is_limited_with_estimated_row_count(monkeypatch):
+    seen = _fake_db(
+        monkeypatch,
+        {"LIMIT 30": _plan(10, 30), "SELECT": _plan(5e9, 2e11, _scan("fact.bef5", "b", 2e5))},
+        rows=30,
+    )
+    result = asyncio.run(sql_guard.guarded_preview("SELECT * FROM fact.bef5 b, fact.bef5 c"))
+    assert seen == ["SELECT * FROM (\nSELECT * FROM fact.bef5 b, fact.bef5 c\n) AS q LIMIT 30"]
+    assert result.row_count == 200_000_000_000
+    assert "LIMIT 30" in result.summary()
+
+
+def test_expensive_preview_falls_back_to_sample_then_refuses(monkeypatch):
+    expensive = _plan(5e9, 99, _scan("fact.bef5", "b", 2e5))
+    seen = _fake_db(
+        monkeypatch, {"TABLESAMPLE": _plan(1e5, 99), "SELECT": expensive}, rows=5
+    )
+    query = "SELECT koen, count(*) FROM fact.bef5 b CROSS JOIN fact.bef5 c GROUP BY 1"
+    result = asyncio.run(sql_guard.guarded_preview(query))
+    assert "TABLESAMPLE SYSTEM (0.02)" in seen[0]
+    assert "0.02% TABLESAMPLE of fact.bef5" in result.note
+
+    _fake_db(monkeypatch, {"SELECT": expensive}, rows=5)
+    with pytest.raises(sql_guard.QueryTooExpensiveError, match="refused before running"):
+        asyncio.run(sql_guard.guarded_preview("SELECT koen, count(*) FROM dim.x GROUP BY 1"))
+
+
+def test_expensive_stored_query_is_refused(monkeypatch):
+    _fake_db(monkeypatch, {"SELECT": _plan(5e9, 2e11, _scan("fact.bef5", "b", 2e5))}, rows=5)
+
+    async def fail_run_query(query, conn=None):
+        raise AssertionError("expensive query must not run")
+
+    monkeypatch.setattr(sql_guard, "run_query", fail_run_query)
+    with pytest.raises(sql_guard.QueryTooExpensiveError, match="fact.bef5"):
+        asyncio.run(sql_guard.guarded_query("SELECT * FROM fact.bef5 b, fact.bef5 c"))
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+
+import pytest
+
+from varro import startup
+from varro.config import PROJECT_ROOT
+
+
+def test_app_import_defers_plotting_and_markdown_libraries() -> None:
+    code = (
+        "import sys, app.main; "
+        "print(sorted(m for m in ('matplotlib', 'geopandas', 'mistletoe', "
+        "'varro.agent.assistant') if m in sys.modules))"
+    )
+    res = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+
+    assert res.returncode == 0, res.stderr
+    assert res.stdout.strip() == "[]"
+
+
+def test_startup_metadata_serves_snapshot_and_survives_failed_refresh(
+    tmp_path, monkeypatch
+) -> None:
+    monkeypatch.setattr(startup, "STARTUP_METADATA_DIR", tmp_path)
+    calls = []
+
+    def load():
+        calls.append(1)
+        return ["a", "b"]
+
+    def fail():
+        raise ConnectionError("db down")
+
+    assert startup.startup_metadata("dims", load) == ["a", "b"]
+    assert startup.startup_metadata("dims", fail) == ["a", "b"]
+    assert startup.startup_metadata("dims", fail, ttl_s=-1) == ["a", "b"]
+    assert len(calls) == 1
+    with pytest.raises(ConnectionError):
+        startup.startup_metadata("other", fail)
+
+
+def test_loading_a_dim_table_refreshes_the_dim_table_list(tmp_path, monkeypatch) -> None:
+    from varro.agent import utils
+    from varro.db import result_cache
+
+    monkeypatch.setattr(startup, "STARTUP_METADATA_DIR", tmp_path)
+    monkeypatch.setattr(result_cache, "result_cache", result_cache.ResultCache(tmp_path / "sql"))
+    monkeypatch.setattr(utils, "_dim_tables", None)
+    tables = [["nuts"]]
+    monkeypatch.setattr(utils, "_query_dim_tables", lambda: tables[-1])
+
+    assert utils.get_dim_tables() == ("nuts",)
+    tables.append(["nuts", "kon"])
+    result_cache.bump_table_version("fact", "folk1a")
+    monkeypatch.setattr(utils, "_dim_tables", None)
+    assert utils.get_dim_tables() == ("nuts",)
+
+    result_cache.bump_table_version("dim", "kon")
+    assert utils.get_dim_tables() == ("nuts",)  # within this process's TTL
+    monkeypatch.setattr(utils, "DIM_TABLES_TTL_S", -1.0)
+    assert utils.get_dim_tables() == ("nuts", "kon")
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+
+import pytest
+from fasthtml.common import to_xml
+from pydantic_ai.messages import (
+    PartDeltaEvent,
+    PartStartEvent,
+    TextPart,
+    TextPartDelta,
+    ThinkingPart,
+    ThinkingPartDelta,
+    ToolCallPart,
+)
+
+
+@pytest.fixture
+def agent_run_module(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+
+    import logfire
+
+    monkeypatch.setattr(logfire, "configure", lambda **kwargs: None)
+    monkeypatch.setattr(logfire, "instrument_pydantic_ai", lambda: None)
+
+    utils = importlib.import_module("varro.agent.utils")
+    monkeypatch.setattr(utils, "get_dim_tables", lambda: ())
+
+    return importlib.import_module("varro.chat.agent_run")
+
+
+class _FakeStream:
+    def __init__(self, events):
+        self.events = events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+
+
+class _FakeNode:
+    def __init__(self, events):
+        self.events = events
+
+    def stream(self, ctx):
+        return _FakeStream(self.events)
+
+
+def test_stream_model_response_publishes_parts_and_deltas(agent_run_module, monkeypatch):
+    monkeypatch.setattr(agent_run_module.LiveResponse, "flush_seconds", 0.0)
+    events = [
+        PartStartEvent(index=0, part=ThinkingPart(content="")),
+        PartDeltaEvent(index=0, delta=ThinkingPartDelta(content_delta="Looking ")),
+        PartDeltaEvent(index=0, delta=ThinkingPartDelta(content_delta="at <data>")),
+        PartStartEvent(index=1, part=TextPart(content="Hej")),
+        PartDeltaEvent(index=1, delta=TextPartDelta(content_delta=" verden")),
+        PartStartEvent(index=2, part=ToolCallPart(tool_name="Sql", args="{}")),
+    ]
+
+    async def collect():
+        return [
+            to_xml(block)
+            async for block in agent_run_module.stream_model_response(
+                _FakeNode(events), None, "live-response-0-0"
+            )
+        ]
+
+    html = asyncio.run(collect())
+
+    assert 'id="live-response-0-0"' in html[0] and "hx-swap-oob" not in html[0]
+    assert 'hx-swap-oob="beforeend:#live-response-0-0"' in html[1]
+    assert 'id="live-response-0-0-part-0"' in html[1]
+    deltas = [h for h in html if 'beforeend:#live-response-0-0-part-0"' in h]
+    assert [d.split(">", 1)[1].rsplit("<", 1)[0] for d in deltas] == [
+        "Looking ",
+        "at &lt;data&gt;",
+    ]
+    assert any('beforeend:#live-response-0-0-part-1"' in h and " verden" in h for h in html)
+    assert "Sql" in html[-2]
+    assert 'hx-swap-oob="delete"' in html[-1] and 'id="live-response-0-0"' in html[-1]
+
+
+def test_live_response_coalesces_deltas_within_flush_interval(agent_run_module):
+    live = agent_run_module.LiveResponse("live-response-0-0")
+    live.flush_seconds = 60.0
+    live.on_event(PartStartEvent(index=0, part=TextPart(content="")))
+    first = live.on_event(PartDeltaEvent(index=0, delta=TextPartDelta(content_delta="a")))
+    assert first == []
+    live.on_event(PartDeltaEvent(index=0, delta=TextPartDelta(content_delta="b")))
+
+    blocks = live.on_event(PartStartEvent(index=1, part=TextPart(content="")))
+
+    assert ">ab<" in to_xml(blocks[0])
+
+
+def test_reasoning_state_sends_only_new_steps_and_status_changes(agent_run_module):
+    from pydantic_ai.messages import ToolReturnPart
+
+    from varro.chat.tool_results import ToolRenderRecord
+
+    state = agent_run_module.ReasoningState(turn_idx=3)
+    state.sequence.extend(
+        [
+            {"kind": "thinking", "content": "Plan"},
+            {"kind": "tool_call", "tool": "Sql", "args": {"query": "SELECT 1"}, "call_id": "c1"},
+        ]
+    )
+    first = [to_xml(block) for block in state.build_blocks(None)]
+    assert len(first) == 1
+    assert 'id="reasoning-3"' in first[0] and "hx-swap-oob" not in first[0]
+    assert 'id="reasoning-3-steps"' in first[0]
+    assert 'id="tool-step-c1"' in first[0] and 'data-status="running"' in first[0]
+
+    state.returns.append(
+        ToolRenderRecord(part=ToolReturnPart(tool_name="Sql", content="x|1", tool_call_id="c1"))
+    )
+    state.sequence.append(
+        {"kind": "tool_call", "tool": "Jupyter", "args": {"code": "1"}, "call_id": "c2"}
+    )
+    second = [to_xml(block) for block in state.build_blocks(None)]
+
+    assert len(second) == 3
+    status, append, count = second
+    assert 'id="tool-step-c1"' in status and 'hx-swap-oob="true"' in status
+    assert 'data-status="success"' in status and "Plan" not in status
+    assert 'hx-swap-oob="beforeend:#reasoning-3-steps"' in append
+    assert 'id="tool-step-c2"' in append and "tool-step-c1" not in append
+    assert 'id="reasoning-3-count"' in count and ">2 steps<" in count
+
+    assert state.build_blocks(None) == []
+
+
+def test_reasoning_state_abort_blocks_remove_live_response_and_stop_running_steps(
+    agent_run_module,
+):
+    from pydantic_ai.messages import ToolReturnPart
+
+    from varro.chat.tool_results import ToolRenderRecord
+
+    state = agent_run_module.ReasoningState(turn_idx=2)
+    state.sequence.extend(
+        [
+            {"kind": "tool_call", "tool": "Sql", "args": {"query": "SELECT 1"}, "call_id": "c1"},
+            {"kind": "tool_call", "tool": "Jupyter", "args": {"code": "1"}, "call_id": "c2"},
+        ]
+    )
+    state.returns.append(
+        ToolRenderRecord(part=ToolReturnPart(tool_name="Sql", content="x|1", tool_call_id="c1"))
+    )
+    state.build_blocks(None)
+    state.live_response_id = "live-response-2-1"
+
+    html = [to_xml(block) for block in state.abort_blocks()]
+
+    assert len(html) == 2
+    assert 'hx-swap-oob="delete"' in html[0] and 'id="live-response-2-1"' in html[0]
+    assert 'id="tool-step-c2"' in html[1] and 'hx-swap-oob="true"' in html[1]
+    assert 'data-status="error"' in html[1]
+    assert state.abort_blocks() == []
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import asyncio
+import time
 from datetime import timedelta
 
 import dill
+import pytest
 import varro.chat.shell_pool as shell_pool_mod
 
 
@@ -112,3 +114,278 @@ def test_shell_pool_remove_chat_evicts_entry_and_snapshot(tmp_path, monkeypatch)
         assert not snapshot_fp.exists()
 
     asyncio.run(scenario())
+
+
+def test_shell_pool_leases_prewarmed_shell_and_refills(tmp_path, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(shell_pool_mod, "DATA_DIR", tmp_path)
+        spawned: list[_DummyShell] = []
+        attached: list[tuple[_DummyShell, int]] = []
+        closed: list[_DummyShell] = []
+
+        def fake_spawn_shell(*, user_id: int, state_root):
+            assert state_root == tmp_path / "chat" / str(user_id)
+            shell = _DummyShell()
+            spawned.append(shell)
+            return shell
+
+        def fake_attach_shell(shell, *, chat_id: int, snapshot_fp):
+            attached.append((shell, chat_id))
+
+        def fail_create_shell(**kwargs):
+            raise AssertionError("a warm shell should have been used")
+
+        monkeypatch.setattr(shell_pool_mod, "spawn_shell", fake_spawn_shell)
+        monkeypatch.setattr(shell_pool_mod, "attach_shell", fake_attach_shell)
+        monkeypatch.setattr(shell_pool_mod, "create_shell", fail_create_shell)
+        monkeypatch.setattr(
+            shell_pool_mod, "close_shell", lambda shell, **kwargs: closed.append(shell)
+        )
+
+        pool = shell_pool_mod.ShellPool(warm_per_user=1, warm_max=1)
+        pool.prewarm(3)
+        pool.prewarm(3)
+        await asyncio.gather(*pool._warming.values())
+        assert len(spawned) == 1
+
+        async with pool.lease(user_id=3, chat_id=11) as shell:
+            assert shell is spawned[0]
+        assert attached == [(spawned[0], 11)]
+
+        # The lease started a replacement spare for the next chat.
+        await asyncio.gather(*pool._warming.values())
+        assert [s.shell for s in pool._spares[3]] == [spawned[1]]
+
+        # warm_max=1: a spare for another user pushes out the oldest one.
+        pool.prewarm(4)
+        await asyncio.gather(*pool._warming.values())
+        assert closed == [spawned[1]]
+        assert list(pool._spares) == [4]
+
+        await pool.evict_idle(ttl=timedelta(seconds=-1))
+        assert closed[-1] is spawned[2]
+        assert pool._spares == {}
+
+    asyncio.run(scenario())
+
+
+def test_shell_pool_creates_shells_for_different_chats_concurrently(tmp_path, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(shell_pool_mod, "DATA_DIR", tmp_path)
+        created: list[tuple[int, int]] = []
+
+        def slow_create_shell(*, user_id: int, chat_id: int, snapshot_fp):
+            time.sleep(0.2)
+            created.append((user_id, chat_id))
+            return _DummyShell()
+
+        monkeypatch.setattr(shell_pool_mod, "create_shell", slow_create_shell)
+        monkeypatch.setattr(shell_pool_mod, "close_shell", lambda shell, **kwargs: None)
+        pool = shell_pool_mod.ShellPool()
+
+        async def use(user_id: int, chat_id: int):
+            async with pool.lease(user_id=user_id, chat_id=chat_id) as shell:
+                return shell
+
+        start = time.perf_counter()
+        shells = await asyncio.gather(use(1, 1), use(2, 7), use(1, 1), use(1, 1))
+        elapsed = time.perf_counter() - start
+
+        # One creation per chat, and the two chats did not wait for each other.
+        assert sorted(created) == [(1, 1), (2, 7)]
+        assert shells[0] is shells[2] is shells[3]
+        assert elapsed < 0.35
+        assert pool._entries[(1, 1)].in_use_count == 0
+
+        await pool.invalidate(1, 1)
+        stats = pool.stats()
+        assert stats["entries"] == 1
+        assert stats["cold_spawns"] == 2
+        assert stats["timings"]["spawn"]["count"] == 2
+        assert stats["timings"]["spawn"]["max_s"] >= 0.2
+        assert stats["timings"]["teardown"]["count"] == 1
+        assert stats["timings"]["lock_wait"]["count"] > 0
+
+    asyncio.run(scenario())
+
+
+def test_shell_pool_failed_creation_is_retried_by_waiting_lease(tmp_path, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(shell_pool_mod, "DATA_DIR", tmp_path)
+        attempts = []
+
+        def flaky_create_shell(*, user_id: int, chat_id: int, snapshot_fp):
+            attempts.append(chat_id)
+            time.sleep(0.05)
+            if len(attempts) == 1:
+                raise RuntimeError("worker did not start")
+            return _DummyShell()
+
+        monkeypatch.setattr(shell_pool_mod, "create_shell", flaky_create_shell)
+        pool = shell_pool_mod.ShellPool()
+
+        async def use():
+            async with pool.lease(user_id=1, chat_id=2) as shell:
+                return shell
+
+        first, second = await asyncio.gather(use(), use(), return_exceptions=True)
+        assert isinstance(first, RuntimeError)
+        assert isinstance(second, _DummyShell)
+        assert attempts == [2, 2]
+        assert pool.stats()["creating"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_shell_pool_lease_waits_for_the_chat_shell_that_is_closing(tmp_path, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(shell_pool_mod, "DATA_DIR", tmp_path)
+        events: list[str] = []
+
+        def fake_create_shell(*, user_id: int, chat_id: int, snapshot_fp):
+            events.append("create")
+            return _DummyShell()
+
+        def slow_close_shell(shell, *, save_snapshot: bool, snapshot_fp):
+            time.sleep(0.2)
+            events.append("closed")
+
+        monkeypatch.setattr(shell_pool_mod, "create_shell", fake_create_shell)
+        monkeypatch.setattr(shell_pool_mod, "close_shell", slow_close_shell)
+        pool = shell_pool_mod.ShellPool()
+
+        async with pool.lease(user_id=1, chat_id=2):
+            pass
+        pool._entries[(1, 2)].last_active -= timedelta(minutes=1)
+        eviction = asyncio.create_task(pool.evict_idle(ttl=timedelta(seconds=0)))
+        await asyncio.sleep(0.05)
+        assert pool.stats()["closing"] == 1
+
+        async with pool.lease(user_id=1, chat_id=2):
+            pass
+        await eviction
+
+        # The new shell was only created after the old one saved its snapshot.
+        assert events == ["create", "closed", "create"]
+        assert pool.stats()["closing"] == 0
+
+    asyncio.run(scenario())
+
+
+def _budget_pool(monkeypatch, tmp_path, closed: list, **kwargs):
+    monkeypatch.setattr(shell_pool_mod, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(
+        shell_pool_mod, "create_shell", lambda *, user_id, chat_id, snapshot_fp: _DummyShell()
+    )
+    monkeypatch.setattr(
+        shell_pool_mod,
+        "close_shell",
+        lambda shell, *, save_snapshot, snapshot_fp=None: closed.append(
+            (snapshot_fp.parent.name if snapshot_fp else None, save_snapshot)
+        ),
+    )
+    monkeypatch.setattr(
+        shell_pool_mod, "shell_rss_bytes", lambda shell: getattr(shell, "rss_mb", 0) * 2**20
+    )
+    return shell_pool_mod.ShellPool(spawn_estimate_mb=100, **kwargs)
+
+
+def test_shell_pool_evicts_least_recently_used_idle_shell_at_worker_cap(tmp_path, monkeypatch):
+    async def scenario():
+        closed: list = []
+        pool = _budget_pool(monkeypatch, tmp_path, closed, max_workers=2, memory_budget_mb=10_000)
+        for chat_id in (1, 2):
+            async with pool.lease(user_id=1, chat_id=chat_id):
+                pass
+        pool._entries[(1, 2)].last_active -= timedelta(minutes=5)
+        async with pool.lease(user_id=1, chat_id=1):
+            async with pool.lease(user_id=1, chat_id=3):
+                pass
+        # Chat 2 was idle longest, so it is snapshotted and closed to make room.
+        assert closed == [("2", True)]
+        assert set(pool._entries) == {(1, 1), (1, 3)}
+        assert pool.stats()["pressure_evictions"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_shell_pool_queues_then_rejects_leases_when_memory_is_leased_out(tmp_path, monkeypatch):
+    async def scenario():
+        closed: list = []
+        pool = _budget_pool(
+            monkeypatch,
+            tmp_path,
+            closed,
+            memory_budget_mb=1000,
+            admission_timeout_s=0.2,
+            rss_sample_s=0,
+        )
+        release = asyncio.Event()
+
+        async def hold(chat_id: int, rss_mb: int):
+            async with pool.lease(user_id=1, chat_id=chat_id) as shell:
+                shell.rss_mb = rss_mb
+                await release.wait()
+
+        holder = asyncio.create_task(hold(1, 950))
+        await asyncio.sleep(0.01)
+
+        # The only shell is leased and uses the budget: the lease is rejected.
+        with pytest.raises(shell_pool_mod.ShellPoolBusy):
+            async with pool.lease(user_id=1, chat_id=2):
+                pass
+        assert pool.stats()["rejections"] == 1
+
+        # A lease that is waiting gets in once the big shell is released (and evicted).
+        waiter = asyncio.create_task(hold(2, 10))
+        await asyncio.sleep(0.05)
+        assert (1, 2) not in pool._entries
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert closed == [("1", True)]
+        assert set(pool._entries) == {(1, 2)}
+
+    asyncio.run(scenario())
+
+
+def test_shell_pool_enforce_budget_evicts_idle_shells_that_grew(tmp_path, monkeypatch):
+    async def scenario():
+        closed: list = []
+        pool = _budget_pool(monkeypatch, tmp_path, closed, memory_budget_mb=1000)
+        for chat_id, rss_mb in ((1, 600), (2, 600)):
+            async with pool.lease(user_id=1, chat_id=chat_id) as shell:
+                pass
+            shell.rss_mb = rss_mb
+        pool._entries[(1, 1)].last_active -= timedelta(minutes=1)
+
+        await pool.enforce_budget()
+        assert closed == [("1", True)]
+        assert pool.stats()["rss_bytes"] == 600 * 2**20
+
+    asyncio.run(scenario())
+
+
+def test_shell_pool_leases_reuse_recent_rss_samples(tmp_path, monkeypatch):
+    async def scenario():
+        closed: list = []
+        pool = _budget_pool(monkeypatch, tmp_path, closed, memory_budget_mb=10_000)
+        samples = []
+
+        def counting_rss(shell):
+            samples.append(shell)
+            return 50 * 2**20
+
+        monkeypatch.setattr(shell_pool_mod, "shell_rss_bytes", counting_rss)
+        for chat_id in (1, 2, 3):
+            async with pool.lease(user_id=1, chat_id=chat_id):
+                pass
+        # Only the first lease sampled (before any shell existed); later ones
+        # used the spawn estimate of the new shells.
+        assert samples == []
+        assert pool.stats()["rss_bytes"] == 3 * 100 * 2**20
+
+        await pool.enforce_budget()
+        assert len(samples) == 3
+        assert pool.stats()["rss_bytes"] == 3 * 50 * 2**20
+
+    asyncio.run(scenario())
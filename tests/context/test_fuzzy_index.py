@@ -0,0 +1,91 @@
+import importlib
+import os
+
+import pandas as pd
+
+
+def test_fold_text_folds_danish_letters_and_accents():
+    fuzzy_index = importlib.import_module("varro.context.fuzzy_index")
+
+    assert fuzzy_index.fold_text("Århus  Kommune") == "aarhus kommune"
+    assert fuzzy_index.fold_text("Færøerne") == "faeroeerne"
+    assert fuzzy_index.fold_text("Café") == "cafe"
+
+
+def test_search_matches_across_case_and_diacritics():
+    fuzzy_index = importlib.import_module("varro.context.fuzzy_index")
+    df = pd.DataFrame(
+        {"kode": [101, 751, 461], "titel": ["København", "Århus", "Odense"]}
+    )
+    index = fuzzy_index.build_index(df, "dim")
+
+    [hits] = index.search(["aarhus"], limit=1)
+
+    assert index.labels[hits[0][0]] == "Århus"
+
+
+def test_search_batches_queries_and_uses_prefilter_on_large_tables():
+    fuzzy_index = importlib.import_module("varro.context.fuzzy_index")
+    titles = [f"Område nummer {i}" for i in range(1000)] + ["Aarhus", "Odense"]
+    df = pd.DataFrame({"id": [str(i) for i in range(len(titles))], "text": titles})
+    index = fuzzy_index.build_index(df, "fact")
+
+    assert index.postings
+    aarhus_hits, odense_hits = index.search(["Århus", "odense"], limit=3)
+
+    assert index.labels[aarhus_hits[0][0]] == "Aarhus"
+    assert index.labels[odense_hits[0][0]] == "Odense"
+    assert len(aarhus_hits) == 3
+
+
+def test_search_respects_allowed_mask():
+    fuzzy_index = importlib.import_module("varro.context.fuzzy_index")
+    df = pd.DataFrame(
+        {"kode": [1, 2, 3], "titel": ["Straffelov", "Faerdselslov", "Saerlov"]}
+    )
+    index = fuzzy_index.build_index(df, "dim")
+
+    [hits] = index.search(["lov"], limit=5, allowed=index.allowed_mask({"1", "3"}))
+
+    assert {index.labels[pos] for pos, _ in hits} == {"Straffelov", "Saerlov"}
+
+
+def test_search_applies_allowed_mask_before_prefilter():
+    fuzzy_index = importlib.import_module("varro.context.fuzzy_index")
+    titles = [f"Aarhus Kommune {i}" for i in range(1000)]
+    titles += [f"Sogn {i}" for i in range(600)] + ["Aarhus"]
+    df = pd.DataFrame({"id": [str(i) for i in range(len(titles))], "text": titles})
+    index = fuzzy_index.build_index(df, "fact")
+    subset = {str(i) for i in range(1000, len(titles))}
+
+    [hits] = index.search(["aarhus kommune"], limit=1, allowed=index.allowed_mask(subset))
+
+    assert index.labels[hits[0][0]] == "Aarhus"
+
+
+def test_load_column_values_caches_until_file_changes(tmp_path):
+    fuzzy_index = importlib.import_module("varro.context.fuzzy_index")
+    path = tmp_path / "kon.parquet"
+    pd.DataFrame({"id": ["M", "K"], "text": ["Mænd", "Kvinder"]}).to_parquet(path)
+
+    _, index = fuzzy_index.load_column_values(path, "fact")
+    assert fuzzy_index.load_column_values(path, "fact")[1] is index
+
+    pd.DataFrame({"id": ["TOT"], "text": ["I alt"]}).to_parquet(path)
+    mtime_ns = path.stat().st_mtime_ns + 1_000_000_000
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    _, reloaded = fuzzy_index.load_column_values(path, "fact")
+    assert list(reloaded.labels) == ["I alt"]
+
+
+def test_fuzzy_match_returns_matches_per_query():
+    utils = importlib.import_module("varro.context.utils")
+    df = pd.DataFrame(
+        {"id": ["TOT", "M", "K"], "text": ["I alt", "Mænd", "Kvinder"]}
+    )
+
+    result = utils.fuzzy_match(["maend", "kvinde"], df=df, limit=1, name="df_kon")
+
+    assert result.startswith("df_kon.head(2)\nquery|id|label\n")
+    assert "maend|M|Mænd" in result
+    assert "kvinde|K|Kvinder" in result
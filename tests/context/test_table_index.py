@@ -0,0 +1,64 @@
+import importlib
+
+
+def write_fact_doc(facts_dir, rel_path, text):
+    path = facts_dir / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def setup_facts(tmp_path):
+    facts_dir = tmp_path / "fact"
+    write_fact_doc(
+        facts_dir,
+        "borgere/befolkning/befolkningstal/folk1a.md",
+        "table: fact.folk1a\n"
+        "description: Befolkningen den 1. i kvartalet efter område, køn, alder og tid\n"
+        "measure: indhold (unit Antal)\n"
+        "columns:\n- omrade: join dim.nuts on omrade=kode; levels [1, 3]\n",
+    )
+    write_fact_doc(
+        facts_dir,
+        "transport/bilpark/nye_biler/bil5.md",
+        "table: fact.bil5\n"
+        "description: Import af personbiler efter drivmiddel og tid\n"
+        "measure: indhold (unit Antal)\n"
+        "columns:\n- driv: values [1=Benzin, 2=Diesel]\n"
+        "notes:\n- Brug driv=1 for benzinbiler.\n",
+    )
+    return facts_dir
+
+
+def test_danish_stem_strips_inflections():
+    table_index = importlib.import_module("varro.context.table_index")
+
+    assert table_index.danish_stem("bilerne") == table_index.danish_stem("biler") == "bil"
+    assert table_index.danish_stem("kommunerne") == table_index.danish_stem("kommuner")
+    assert table_index.danish_stem("befolkningen") == "befolkning"
+
+
+def test_build_table_index_ranks_tables_with_snippets(tmp_path):
+    table_index = importlib.import_module("varro.context.table_index")
+    facts_dir = setup_facts(tmp_path)
+    output_path = tmp_path / "search_index" / "table_index.pkl"
+
+    table_index.build_table_index(facts_dir, output_path)
+    index = table_index.load_table_index(output_path)
+    hits = index.search("befolkningens alder", k=5)
+
+    assert [doc.table for doc, _ in hits] == ["folk1a"]
+    doc = hits[0][0]
+    assert doc.path == "/fact/borgere/befolkning/befolkningstal/folk1a.md"
+    assert doc.snippet.startswith("table: fact.folk1a\ndescription: Befolkningen")
+    assert "columns:" not in doc.snippet
+
+
+def test_search_splits_compound_query_terms(tmp_path):
+    table_index = importlib.import_module("varro.context.table_index")
+    facts_dir = setup_facts(tmp_path)
+
+    index = table_index.build_table_index(facts_dir, tmp_path / "table_index.pkl")
+    hits = index.search("bilimport", k=5)
+
+    assert hits[0][0].table == "bil5"
+    assert "/fact/transport/bilpark/nye_biler/bil5.md" in table_index.format_table_hits(hits)
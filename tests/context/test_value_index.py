@@ -0,0 +1,76 @@
+import importlib
+import pickle
+
+import pandas as pd
+
+
+def setup_catalog(tmp_path):
+    tables_info_dir = tmp_path / "tables_info_raw_da"
+    column_values_dir = tmp_path / "column_values"
+    tables_info_dir.mkdir()
+    column_values_dir.mkdir()
+
+    table_infos = {
+        "FOLK1A": {
+            "id": "FOLK1A",
+            "text": "Befolkningen den 1. i kvartalet",
+            "description": "Befolkningen efter område, køn, alder og tid",
+            "variables": [
+                {"id": "OMRÅDE", "text": "område"},
+                {"id": "Tid", "text": "tid"},
+            ],
+        },
+        "BIL5": {
+            "id": "BIL5",
+            "text": "Import af biler",
+            "description": "Import af personbiler efter drivmiddel og tid",
+            "variables": [{"id": "DRIV", "text": "drivmiddel"}],
+        },
+    }
+    for table_id, info in table_infos.items():
+        with open(tables_info_dir / f"{table_id}.pkl", "wb") as f:
+            pickle.dump(info, f)
+
+    pd.DataFrame(
+        {"kode": [101, 751], "niveau": [3, 3], "titel": ["København", "Århus"]}
+    ).to_parquet(column_values_dir / "nuts.parquet")
+    folk_dir = column_values_dir / "folk1a"
+    folk_dir.mkdir()
+    pd.DataFrame(
+        {"id": ["000", "751"], "text": ["Hele landet", "Aarhus"]}
+    ).to_parquet(folk_dir / "omrade.parquet")
+    pd.DataFrame({"id": ["2024K1"], "text": ["2024K1"]}).to_parquet(folk_dir / "tid.parquet")
+    return tables_info_dir, column_values_dir
+
+
+def test_build_value_index_returns_value_hits_across_tables(tmp_path):
+    value_index = importlib.import_module("varro.context.value_index")
+    tables_info_dir, column_values_dir = setup_catalog(tmp_path)
+    output_path = tmp_path / "search_index" / "value_index.pkl"
+
+    value_index.build_value_index(tables_info_dir, column_values_dir, output_path)
+    index = value_index.load_value_index(output_path)
+    hits = index.hits_frame(["Aarhus"], limit=5)
+
+    top = {(row.table, row.column, row.code) for row in hits.head(2).itertuples()}
+    assert top == {("nuts", "kode", "751"), ("folk1a", "omrade", "751")}
+    assert "tid" not in set(hits["column"].dropna())
+
+
+def test_search_matches_compound_words_in_table_texts(tmp_path):
+    value_index = importlib.import_module("varro.context.value_index")
+    tables_info_dir, column_values_dir = setup_catalog(tmp_path)
+
+    index = value_index.build_value_index(
+        tables_info_dir, column_values_dir, tmp_path / "value_index.pkl"
+    )
+    hits = index.hits_frame(["bilimport"], limit=3)
+
+    assert hits.iloc[0]["table"] == "bil5"
+    assert hits.iloc[0]["column"] is None
+
+
+def test_load_value_index_returns_none_when_missing(tmp_path):
+    value_index = importlib.import_module("varro.context.value_index")
+
+    assert value_index.load_value_index(tmp_path / "missing.pkl") is None
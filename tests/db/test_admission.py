@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from varro.db.admission import (
+    AdmissionController,
+    AdmissionTimeout,
+    Priority,
+    current_query_class,
+    query_class,
+)
+
+DEADLINES = {p: 2.0 for p in Priority}
+
+
+def _hold(controller, priority, user_id, started, done, order):
+    with controller.slot(priority, user_id):
+        order.append(priority)
+        started.set()
+        done.wait(5)
+
+
+def test_waiters_are_admitted_in_priority_order():
+    controller = AdmissionController(slots=1, user_limit=5, deadlines_s=DEADLINES)
+    order: list[Priority] = []
+    release = threading.Event()
+
+    blocker_started = threading.Event()
+    blocker = threading.Thread(
+        target=_hold, args=(controller, Priority.DASHBOARD, None, blocker_started, release, order)
+    )
+    blocker.start()
+    blocker_started.wait(1)
+
+    threads = []
+    for priority in (Priority.BACKGROUND, Priority.AGENT, Priority.DASHBOARD):
+        done = threading.Event()
+        done.set()
+        t = threading.Thread(
+            target=_hold, args=(controller, priority, None, threading.Event(), done, order)
+        )
+        t.start()
+        threads.append(t)
+    while controller.stats()["queue_depth"] < 3:
+        time.sleep(0.01)
+
+    release.set()
+    for t in [blocker, *threads]:
+        t.join(5)
+    assert order == [
+        Priority.DASHBOARD,
+        Priority.DASHBOARD,
+        Priority.AGENT,
+        Priority.BACKGROUND,
+    ]
+
+
+def test_reserved_slot_is_only_used_by_dashboards():
+    controller = AdmissionController(slots=2, user_limit=5, deadlines_s={p: 0.05 for p in Priority})
+
+    async def run():
+        async with controller.slot_async(Priority.AGENT, 1):
+            with pytest.raises(AdmissionTimeout):
+                async with controller.slot_async(Priority.AGENT, 2):
+                    pass
+            async with controller.slot_async(Priority.DASHBOARD):
+                assert controller.stats()["active"] == 2
+
+    asyncio.run(run())
+    stats = controller.stats()
+    assert stats["active"] == 0
+    assert stats["classes"]["agent"]["timeouts"] == 1
+    assert stats["classes"]["dashboard"]["admitted"] == 1
+
+
+def test_user_limit_caps_concurrent_queries_per_user():
+    controller = AdmissionController(slots=4, user_limit=1, deadlines_s={p: 0.05 for p in Priority})
+
+    async def run():
+        async with controller.slot_async(Priority.AGENT, "a"):
+            async with controller.slot_async(Priority.AGENT, "b"):
+                with pytest.raises(AdmissionTimeout, match="agent queue"):
+                    async with controller.slot_async(Priority.AGENT, "a"):
+                        pass
+
+    asyncio.run(run())
+    assert controller.stats()["active"] == 0
+
+
+def test_async_waiter_is_woken_by_sync_release():
+    controller = AdmissionController(slots=1, user_limit=5, deadlines_s=DEADLINES)
+    release = threading.Event()
+    started = threading.Event()
+    blocker = threading.Thread(
+        target=_hold, args=(controller, Priority.DASHBOARD, None, started, release, [])
+    )
+    blocker.start()
+    started.wait(1)
+
+    async def run():
+        threading.Timer(0.05, release.set).start()
+        async with controller.slot_async(Priority.AGENT, 1):
+            return controller.stats()["active"]
+
+    assert asyncio.run(run()) == 1
+    blocker.join(5)
+    stats = controller.stats()
+    assert stats["active"] == 0
+    assert stats["classes"]["agent"]["wait_s_max"] > 0
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    controller = AdmissionController(slots=1, user_limit=5, deadlines_s=DEADLINES)
+
+    async def run():
+        async with controller.slot_async(Priority.DASHBOARD):
+            task = asyncio.create_task(controller.slot_async(Priority.AGENT, 1).__aenter__())
+            await asyncio.sleep(0.01)
+            assert controller.stats()["queue_depth"] == 1
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["queue_depth"] == 0
+    assert stats["active"] == 0
+    assert stats["classes"]["agent"]["timeouts"] == 0
+
+
+def test_query_class_propagates_into_threads():
+    async def run():
+        with query_class(Priority.AGENT, 7):
+            return await asyncio.to_thread(current_query_class)
+
+    assert asyncio.run(run()) == (Priority.AGENT, 7)
+    assert current_query_class() == (Priority.DASHBOARD, None)
+
+
+def test_connection_pools_split_the_worker_slots():
+    from varro.db import admission
+
+    if admission.QUERY_SLOTS > 1:
+        assert admission.AGENT_POOL_SIZE + admission.SYNC_POOL_SIZE == admission.QUERY_SLOTS
+    assert admission.AGENT_POOL_SIZE >= 1 and admission.SYNC_POOL_SIZE >= 1
+
+
+def test_get_pool_closes_the_pool_of_a_previous_event_loop(monkeypatch):
+    from varro.agent import sql
+
+    class FakePool:
+        terminated = False
+
+        def terminate(self):
+            self.terminated = True
+
+    pools = []
+
+    async def fake_create_pool():
+        pools.append(FakePool())
+        return pools[-1]
+
+    monkeypatch.setattr(sql, "_create_pool", fake_create_pool)
+    monkeypatch.setattr(sql, "_pool_task", None)
+    monkeypatch.setattr(sql, "_pool_loop", None)
+
+    first = asyncio.run(sql.get_pool())
+    second = asyncio.run(sql.get_pool())
+
+    assert first is not second
+    assert first.terminated and not second.terminated
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta, timezone
+from types import SimpleNamespace
+
+import pandas as pd
+import pyarrow as pa
+from asyncpg import Range
+
+from varro.agent import sql as sql_module
+from varro.db import pg_arrow
+
+COLUMNS = [
+    ("omrade", "int2"),
+    ("titel", "varchar"),
+    ("alder", "int4range"),
+    ("tid", "date"),
+    ("indhold", "numeric"),
+    ("koder", "_int4"),
+]
+
+
+def test_csv_to_table_decodes_postgres_types_column_wise():
+    data = (
+        b'101,NA,"[0,5)",2024-01-01,1.5,"{1,2}"\n'
+        b'147,"",,2024-04-01,,{3}\n'
+        b',,"[95,)",,2.0,\n'
+    )
+    df = pg_arrow.table_to_frame(pg_arrow.csv_to_table(data, COLUMNS))
+
+    assert str(df["tid"].dtype) == "datetime64[ns]"
+    assert df["tid"].iloc[1] == pd.Timestamp("2024-04-01")
+    assert pd.isna(df["tid"].iloc[2])
+    # int2 with a NULL becomes float, like pd.read_sql.
+    assert df["omrade"].tolist()[:2] == [101, 147]
+    # "NA" and "" are values; only unquoted empty fields are NULL.
+    assert df["titel"].tolist()[:2] == ["NA", ""]
+    assert pd.isna(df["titel"].iloc[2])
+    # Ranges and arrays keep the Python values a row fetch gives them.
+    assert df["alder"].tolist() == [Range(0, 5), None, Range(95, None)]
+    assert df["koder"].tolist() == [[1, 2], [3], None]
+
+
+def test_csv_to_table_keeps_duplicate_column_names():
+    columns = [("kode", "text"), ("kode", "int4")]
+    table = pg_arrow.csv_to_table(b"a,1\n", columns)
+    assert table.column_names == ["kode", "kode"]
+    assert table.schema.types == [pa.string(), pa.int32()]
+
+
+def test_empty_result_keeps_column_types():
+    df = pg_arrow.table_to_frame(pg_arrow.csv_to_table(b"", COLUMNS))
+    assert len(df) == 0
+    assert str(df["tid"].dtype) == "datetime64[ns]"
+    assert df["alder"].dtype == object
+
+
+def test_records_to_table_matches_csv_decoding():
+    records = [
+        (101, "NA", Range(0, 5), date(2024, 1, 1), 1.5, [1, 2]),
+        (None, None, Range(95, None), None, None, None),
+    ]
+    from_records = pg_arrow.records_to_table(records, COLUMNS)
+    from_csv = pg_arrow.csv_to_table(
+        b'101,NA,"[0,5)",2024-01-01,1.5,"{1,2}"\n,,"[95,)",,,\n', COLUMNS
+    )
+    assert from_records.equals(from_csv)
+
+
+def test_less_common_types_decode_like_a_row_fetch():
+    columns = [
+        ("ts", "timestamptz"),
+        ("t", "time"),
+        ("iv", "interval"),
+        ("navne", "_text"),
+        ("alder", "int4range"),
+    ]
+    records = [
+        (
+            datetime(2024, 1, 1, 11, 0, tzinfo=timezone.utc),
+            time(12, 34, 56, 500000),
+            timedelta(days=33, hours=-2, minutes=-30),
+            ["a b", 'c"d', None, "NULL"],
+            Range(empty=True),
+        )
+    ]
+    # COPY output of the same row with TimeZone = 'Europe/Copenhagen'.
+    data = (
+        b'2024-01-01 12:00:00+01,12:34:56.5,1 mon 3 days -02:30:00,'
+        b'"{""a b"",""c\\""d"",NULL,""NULL""}",empty\n'
+    )
+    from_csv = pg_arrow.csv_to_table(data, columns)
+    assert from_csv.equals(pg_arrow.records_to_table(records, columns))
+
+    df = pg_arrow.table_to_frame(from_csv)
+    assert str(df["ts"].dtype).endswith("UTC]")
+    assert df["ts"].iloc[0] == pd.Timestamp("2024-01-01 11:00", tz="UTC")
+    assert df["t"].iloc[0] == time(12, 34, 56, 500000)
+    assert df["iv"].iloc[0] == pd.Timedelta(days=33, hours=-2, minutes=-30)
+    assert df["navne"].iloc[0] == ["a b", 'c"d', None, "NULL"]
+    assert df["alder"].iloc[0].isempty
+
+
+def test_frame_to_table_round_trips_range_objects():
+    df = pd.DataFrame({"alder": [Range(0, 5), None, Range(95, None)], "x": [1, 2, 3]})
+    table = pg_arrow.frame_to_table(df)
+    assert pg_arrow.is_range_struct(table.schema.field("alder").type)
+    pd.testing.assert_frame_equal(pg_arrow.table_to_frame(table), df)
+
+
+def test_complete_csv_rows_ignores_newlines_in_quoted_fields():
+    data = b'1,"first\nline"\n2,"cut ""mid\nway'
+    assert pg_arrow.complete_csv_rows(data) == b'1,"first\nline"\n'
+    assert pg_arrow.complete_csv_rows(b'1,"no\nrow') == b""
+
+
+def test_is_select_only_accepts_wrappable_statements():
+    assert pg_arrow.is_select("  -- top\n(SELECT 1)")
+    assert pg_arrow.is_select("WITH x AS (SELECT 1) SELECT * FROM x")
+    assert not pg_arrow.is_select("EXPLAIN SELECT 1")
+    assert not pg_arrow.is_select("show statement_timeout")
+
+
+def _fake_transaction(monkeypatch, conn):
+    @asynccontextmanager
+    async def fake_transaction(timeout_s, outer=None):
+        yield conn
+
+    monkeypatch.setattr(sql_module, "read_transaction", fake_transaction)
+
+
+def test_run_query_cuts_copy_stream_at_a_row_boundary(monkeypatch):
+    rows = [f'{i},"line {i}\nwith ""quoted"" text"\n'.encode() for i in range(50)]
+    stream = b"".join(rows)
+
+    class FakeConn:
+        async def prepare(self, query):
+            assert query.endswith("LIMIT 1001")
+            attrs = [("id", "int4"), ("note", "text")]
+            return SimpleNamespace(
+                get_attributes=lambda: [
+                    SimpleNamespace(name=n, type=SimpleNamespace(name=t)) for n, t in attrs
+                ]
+            )
+
+        async def copy_from_query(self, query, output, format):
+            for pos in range(0, len(stream), 7):
+                await output(stream[pos : pos + 7])
+
+    _fake_transaction(monkeypatch, FakeConn())
+    result = asyncio.run(
+        sql_module.run_query("SELECT id, note FROM t", max_rows=1000, max_bytes=200)
+    )
+
+    assert result.truncated
+    assert 0 < len(result.df) < 50
+    assert result.df["id"].tolist() == list(range(len(result.df)))
+    assert result.df["note"].iloc[-1] == f'line {len(result.df) - 1}\nwith "quoted" text'
+
+
+def test_run_query_decodes_the_result_off_the_event_loop_thread(monkeypatch):
+    import threading
+
+    class FakeConn:
+        async def prepare(self, query):
+            return SimpleNamespace(
+                get_attributes=lambda: [
+                    SimpleNamespace(name="id", type=SimpleNamespace(name="int4"))
+                ]
+            )
+
+        async def copy_from_query(self, query, output, format):
+            await output(b"1\n2\n")
+
+    decode_threads = []
+    csv_to_table = pg_arrow.csv_to_table
+
+    def recording_csv_to_table(data, columns):
+        decode_threads.append(threading.get_ident())
+        return csv_to_table(data, columns)
+
+    monkeypatch.setattr(pg_arrow, "csv_to_table", recording_csv_to_table)
+    _fake_transaction(monkeypatch, FakeConn())
+
+    async def run():
+        return threading.get_ident(), await sql_module.run_query("SELECT id FROM t")
+
+    loop_thread, result = asyncio.run(run())
+
+    assert result.df["id"].tolist() == [1, 2]
+    assert result.bytes_fetched == 4
+    assert decode_threads and decode_threads[0] != loop_thread
+
+
+def test_run_query_fetches_non_select_statements_as_rows(monkeypatch):
+    class FakeCursor:
+        async def fetch(self, n):
+            return [("60s",)]
+
+    class FakeConn:
+        async def prepare(self, query):
+            assert query == "SHOW statement_timeout"
+            return SimpleNamespace(
+                get_attributes=lambda: [
+                    SimpleNamespace(name="statement_timeout", type=SimpleNamespace(name="text"))
+                ],
+                cursor=lambda: asyncio.sleep(0, FakeCursor()),
+            )
+
+    _fake_transaction(monkeypatch, FakeConn())
+    result = asyncio.run(sql_module.run_query("SHOW statement_timeout"))
+
+    assert result.df["statement_timeout"].tolist() == ["60s"]
+    assert result.row_count == 1
+
+
+def test_limit_sql_wraps_query_without_trailing_semicolon():
+    sql = pg_arrow.limit_sql("SELECT 1 -- one\n;", 10)
+    assert sql == "SELECT * FROM (\nSELECT 1 -- one\n) AS q LIMIT 10"
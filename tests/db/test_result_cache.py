@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import date
+
+import pandas as pd
+
+from varro.agent import sql as sql_module
+from varro.db.result_cache import ResultCache, normalize_sql, referenced_tables
+
+
+def test_normalize_sql_ignores_formatting_but_keeps_literals():
+    a = "SELECT omrade  -- regions\nFROM fact.folk1a\nWHERE koen = 'Mænd  og'; "
+    b = "select omrade FROM fact.folk1a /* x */ WHERE koen = 'Mænd  og'"
+    assert normalize_sql(a) == "select omrade from fact.folk1a where koen = 'Mænd  og'"
+    assert normalize_sql(b) == normalize_sql(a)
+
+
+def test_referenced_tables_finds_fact_and_dim_tables():
+    query = 'SELECT * FROM fact.FOLK1A f JOIN "dim"."nuts" d ON f.omrade = d.kode'
+    assert referenced_tables(query) == ["dim.nuts", "fact.folk1a"]
+    assert referenced_tables("SELECT 1") == []
+
+
+def test_version_bump_invalidates_only_referencing_queries(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=10**8)
+    df = pd.DataFrame({"omrade": ["0", "101"], "tid": [date(2024, 1, 1), date(2024, 4, 1)]})
+    folk_key = cache.key("SELECT DISTINCT omrade FROM fact.folk1a", "preview")
+    nuts_key = cache.key("SELECT kode FROM dim.nuts", "preview")
+    assert cache.put(folk_key, df, {"row_count": 2})
+    assert cache.put(nuts_key, df, {"row_count": 2})
+
+    hit_df, meta = cache.get(cache.key("select distinct omrade\nfrom fact.folk1a;", "preview"))
+    pd.testing.assert_frame_equal(hit_df, df)
+    assert meta == {"row_count": 2}
+    assert cache.key("SELECT DISTINCT omrade FROM fact.folk1a", "full") != folk_key
+
+    cache.bump_version("fact.folk1a")
+    assert cache.key("SELECT DISTINCT omrade FROM fact.folk1a", "preview") != folk_key
+    assert cache.key("SELECT kode FROM dim.nuts", "preview") == nuts_key
+    assert cache.get(cache.key("SELECT DISTINCT omrade FROM fact.folk1a", "preview")) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["stores"] == 2
+
+
+def test_lru_eviction_keeps_cache_under_size_bound(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=10**8)
+    df = pd.DataFrame({"x": range(1000)})
+    keys = [cache.key(f"SELECT {i} FROM fact.t", "full") for i in range(3)]
+    for key in keys:
+        cache.put(key, df, {})
+    entry_size = cache.stats()["bytes"] // 3
+
+    cache.get(keys[0])
+    cache.max_bytes = entry_size * 2
+    cache.put(cache.key("SELECT 3 FROM fact.t", "full"), df.head(1), {})
+
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 2
+    assert stats["bytes"] <= cache.max_bytes
+
+
+def test_uncacheable_results_are_counted_and_skipped(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=10**8)
+    df = pd.DataFrame({"alder": [object(), object()]})
+    assert not cache.put(cache.key("SELECT alder FROM fact.folk1a", "full"), df, {})
+    assert cache.stats()["uncacheable"] == 1
+
+
+def test_run_cached_serves_repeated_query_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(sql_module, "result_cache", ResultCache(tmp_path, max_bytes=10**8))
+    calls = []
+
+    async def fake_run(query):
+        calls.append(query)
+        df = pd.DataFrame({"omrade": ["0", "101"]})
+        return sql_module.QueryResult(
+            df=df, elapsed_s=1.0, rows_fetched=2, bytes_fetched=100, row_count=98
+        )
+
+    query = "SELECT DISTINCT omrade FROM fact.folk1a"
+    first = asyncio.run(sql_module.run_cached(query, "preview", fake_run))
+    second = asyncio.run(sql_module.run_cached(query + ";", "preview", fake_run))
+    asyncio.run(sql_module.run_cached("SELECT 1", "preview", fake_run))
+
+    assert len(calls) == 2
+    assert not first.cached
+    assert second.cached
+    assert second.row_count == 98
+    assert "(cached)" in second.summary()
+    pd.testing.assert_frame_equal(second.df, first.df)
+
+
+def test_run_cached_runs_the_query_when_the_cache_is_broken(tmp_path, monkeypatch):
+    # The index path is a directory, so SQLite cannot open it.
+    (tmp_path / "index.sqlite").mkdir()
+    monkeypatch.setattr(sql_module, "result_cache", ResultCache(tmp_path, max_bytes=10**8))
+
+    async def fake_run(query):
+        return sql_module.QueryResult(
+            df=pd.DataFrame({"x": [1]}), elapsed_s=0.1, rows_fetched=1, bytes_fetched=8
+        )
+
+    result = asyncio.run(sql_module.run_cached("SELECT x FROM fact.folk1a", "full", fake_run))
+    assert not result.cached
+    assert result.rows_fetched == 1
+
+
+def test_volatile_queries_are_not_cached(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=10**8)
+    assert cache.key("SELECT now(), omrade FROM fact.folk1a", "full") is None
+    assert cache.key("SELECT * FROM fact.folk1a ORDER BY RANDOM () LIMIT 5", "full") is None
+    assert cache.key("SELECT * FROM fact.folk1a WHERE tid < current_date", "full") is None
+    assert cache.key("SELECT nownow FROM fact.folk1a", "full") is not None
+
+
+def test_index_connection_is_reused_per_thread(tmp_path, monkeypatch):
+    import sqlite3
+
+    from varro.db import file_cache
+
+    opened = []
+    real_connect = sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        opened.append(args)
+        return real_connect(*args, **kwargs)
+
+    monkeypatch.setattr(file_cache.sqlite3, "connect", counting_connect)
+    cache = ResultCache(tmp_path, max_bytes=10**8)
+    key = cache.key("SELECT omrade FROM fact.folk1a", "full")
+    cache.put(key, pd.DataFrame({"omrade": ["0"]}), {})
+    assert cache.get(key) is not None
+
+    assert len(opened) == 1
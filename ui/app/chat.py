@@ -2,7 +2,6 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-import mistletoe
 import pandas as pd
 from pandas.io.formats.style import Styler
 from fasthtml.common import (
@@ -32,6 +31,7 @@ from pydantic_ai.messages import (
 from ui.app.tool import (
     ReasoningBlock,
     ThinkingBlock,
+    ToolCallStep,
     ToolCallsGroup,
     ToolResultsGroup,
     _tool_call_item,
@@ -46,6 +46,9 @@ from varro.dashboard.parser import (
     MarkdownNode,
     parse_dashboard_md,
 )
+from varro.startup import LazyModule
+
+mistletoe = LazyModule("mistletoe")
 
 if TYPE_CHECKING:
     from varro.agent.shell import TerminalInteractiveShell
@@ -381,6 +384,39 @@ def ErrorBlock(message: str):
     return Div(f"Error: {message}", cls="text-error text-sm mb-4")
 
 
+def LiveResponseBlock(response_id: str):
+    """Placeholder a streaming model response is appended into, replaced once it completes."""
+    return Div(id=response_id, cls="live-response mb-4 flex flex-col gap-2")
+
+
+def LivePart(response_id: str, part_id: str, kind: str, content: str = ""):
+    if kind == "thinking":
+        body = Div(
+            content,
+            id=part_id,
+            cls="tool-note-body tool-note-thinking whitespace-pre-wrap",
+        )
+        part = Div(Span("Thinking", cls="tool-note-label"), body, cls="tool-step-note")
+    else:
+        part = Div(content, id=part_id, cls="whitespace-pre-wrap")
+    return Div(part, hx_swap_oob=f"beforeend:#{response_id}")
+
+
+def LiveToolCall(response_id: str, tool: str):
+    return Div(
+        ToolCallStep(tool=tool, status="running"),
+        hx_swap_oob=f"beforeend:#{response_id}",
+    )
+
+
+def LiveDelta(part_id: str, text: str):
+    return Div(text, hx_swap_oob=f"beforeend:#{part_id}")
+
+
+def LiveResponseEnd(response_id: str):
+    return Div(id=response_id, hx_swap_oob="delete")
+
+
 def ChatProgressStart():
     return Div(
         GameOfLifeAnimation(run=True, text="V", cell_size=1.5, size=60),
@@ -145,73 +145,97 @@ def ReasoningBlock(
     tool_parts: list[ToolRenderRecord],
     shell: "TerminalInteractiveShell | None" = None,
     block_id: str | None = None,
-    swap_oob: bool = False,
 ):
     if not sequence:
         return None
     results = {record.part.tool_call_id: record for record in tool_parts}
-    steps = []
-    tool_count = 0
-    for item in sequence:
-        kind = item.get("kind")
-        if kind == "tool_call":
-            tool_count += 1
-            call_id = item.get("call_id")
-            record = results.get(call_id) if call_id else None
-            output = (
-                _build_tool_output_payload(record.part.content, record.tool_content)
-                if record
-                else ToolOutputPayload(text="", binaries=[])
-            )
-            status = _tool_result_status(output.text) if record else "running"
-            steps.append(
-                ToolCallStep(
-                    tool=item["tool"],
-                    args=item["args"],
-                    result=output.text,
-                    binary_outputs=output.binaries,
-                    status=status,
-                    call_id=call_id,
-                )
-            )
-        elif kind == "thinking":
-            steps.append(ReasoningNoteStep("Thinking", item.get("content", ""), shell))
-        elif kind == "text":
-            steps.append(ReasoningNoteStep(None, item.get("content", ""), shell))
-    if not steps:
+    steps = [
+        ReasoningStep(
+            item,
+            results,
+            shell=shell,
+            step_id=f"{block_id}-step-{idx}" if block_id else None,
+        )
+        for idx, item in enumerate(sequence)
+    ]
+    if not any(steps):
         return None
-    return ReasoningGroup(steps, tool_count, block_id=block_id, swap_oob=swap_oob)
+    tool_count = sum(1 for item in sequence if item.get("kind") == "tool_call")
+    return ReasoningGroup(steps, tool_count, block_id=block_id)
+
+
+def ReasoningStep(
+    item: dict,
+    results: dict[str, ToolRenderRecord],
+    shell: "TerminalInteractiveShell | None" = None,
+    step_id: str | None = None,
+    swap_oob: bool = False,
+):
+    """One step of a reasoning block. Tool steps are keyed by their call id."""
+    kind = item.get("kind")
+    if kind == "tool_call":
+        call_id = item.get("call_id")
+        record = results.get(call_id) if call_id else None
+        output = (
+            _build_tool_output_payload(record.part.content, record.tool_content)
+            if record
+            else ToolOutputPayload(text="", binaries=[])
+        )
+        return ToolCallStep(
+            tool=item["tool"],
+            args=item["args"],
+            result=output.text,
+            binary_outputs=output.binaries,
+            status=_tool_result_status(output.text) if record else "running",
+            call_id=call_id,
+            swap_oob=swap_oob,
+        )
+    if kind == "thinking":
+        return ReasoningNoteStep("Thinking", item.get("content", ""), shell, step_id=step_id)
+    if kind == "text":
+        return ReasoningNoteStep(None, item.get("content", ""), shell, step_id=step_id)
+    return None
 
 
 def ReasoningGroup(
     steps: list,
     count: int,
     block_id: str | None = None,
-    swap_oob: bool = False,
 ):
-    attrs = {}
-    if block_id:
-        attrs["id"] = block_id
-    if swap_oob:
-        if block_id:
-            attrs["hx-swap-oob"] = f"outerHTML:#{block_id}"
-        else:
-            attrs["hx-swap-oob"] = "outerHTML"
     return Div(
-        ToolGroupHeader("Reasoning", count),
+        ToolGroupHeader(
+            "Reasoning",
+            count,
+            count_id=f"{block_id}-count" if block_id else None,
+        ),
         Div(
             *steps,
+            id=f"{block_id}-steps" if block_id else None,
             cls="tool-steps tool-steps-connected",
             x_show="open",
             x_collapse=True,
         ),
         x_data="{open: true}",
         cls="tool-call-group mb-4",
-        **attrs,
+        id=block_id,
     )
 
 
-def ReasoningNoteStep(label: str | None, content: str, shell=None):
+def ReasoningStepsAppend(block_id: str, steps: list):
+    """Append new steps to a reasoning block already on the page."""
+    return Div(*steps, hx_swap_oob=f"beforeend:#{block_id}-steps")
+
+
+def ReasoningCountUpdate(block_id: str, count: int):
+    return ToolGroupCount(count, count_id=f"{block_id}-count", swap_oob=True)
+
+
+def ReasoningNoteStep(
+    label: str | None,
+    content: str,
+    shell=None,
+    step_id: str | None = None,
+):
     if not content or not content.strip():
         return None
     if label == "Thinking":
@@ -225,14 +249,15 @@ def ReasoningNoteStep(label: str | None, content: str, shell=None):
         body,
         cls="tool-step tool-step-note",
         data_status="note",
+        id=step_id,
     )
 
 
-def ToolGroupHeader(title: str, count: int):
+def ToolGroupHeader(title: str, count: int, count_id: str | None = None):
     return Div(
         Div(
             Span(title, cls="tool-call-title"),
-            Span(f"{count} steps", cls="tool-call-meta"),
+            ToolGroupCount(count, count_id=count_id),
             cls="flex items-center gap-2",
         ),
         Div(
@@ -253,6 +278,11 @@ def ToolGroupHeader(title: str, count: int):
     )
 
 
+def ToolGroupCount(count: int, count_id: str | None = None, swap_oob: bool = False):
+    attrs = {"hx-swap-oob": "true"} if swap_oob else {}
+    return Span(f"{count} steps", id=count_id, cls="tool-call-meta", **attrs)
+
+
 def ToolCallStep(
     tool: str,
     args: dict | None = None,
@@ -260,6 +290,7 @@ def ToolCallStep(
     binary_outputs: list[BinaryContent] | None = None,
     status: str = "running",
     call_id: str | None = None,
+    swap_oob: bool = False,
 ):
     label = _format_tool_label(tool)
     summary = _tool_arg_summary(args) if args else _tool_result_summary_text(result)
@@ -268,6 +299,8 @@ def ToolCallStep(
     attrs = {"data_status": status}
     if call_id:
         attrs["id"] = f"tool-step-{call_id}"
+        if swap_oob:
+            attrs["hx-swap-oob"] = "true"
     return Div(
         Div(
             Div(
@@ -1,8 +1,9 @@
+import asyncio
 from datetime import datetime
 import json
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-import pandas as pd
 from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from typing import Callable
 
@@ -14,17 +15,22 @@ from pydantic_ai import (
     ModelRetry,
 )
 from pydantic_ai.messages import ToolReturn
+from anthropic.types.beta import BetaTextBlockParam
 from pydantic_ai.models.anthropic import AnthropicModel, AnthropicModelSettings
-from varro.data.utils import df_preview, df_dtypes, df_dtype_map
+from varro.data.utils import df_preview, df_dtypes
 from varro.context.utils import fuzzy_match
+from varro.context.fuzzy_index import load_column_values
+from varro.context.value_index import load_value_index
+from varro.context.table_index import load_table_index, format_table_hits
 from varro.agent.utils import show_element, get_dim_tables, generate_hierarchy
 from varro.agent.filesystem import read_file, write_file, edit_file
-from varro.agent.skills import build_available_skills_prompt
+from varro.agent.skills import build_available_skills_prompt, skills_signature
 from varro.agent.columns import normalize_table_name, filter_dimension_values_for_table
-from varro.db.db import dst_read_engine
+from varro.agent.sql import run_cached
+from varro.agent.sql_guard import guarded_preview, guarded_query
+from varro.db.admission import Priority, query_class
 from varro.config import COLUMN_VALUES_DIR
 from varro.db import crud
-from sqlalchemy import text
 from varro.chat.runtime_state import load_bash_cwd, save_bash_cwd
 from varro.agent.sandbox import run_bash_command
 from varro.dashboard.verify import (
@@ -42,10 +48,43 @@ import logfire
 logfire.configure(scrubbing=False)
 logfire.instrument_pydantic_ai()
 
-DIM_TABLES = get_dim_tables()
+SESSION_TAG = "<session>"
+
+
+class SessionSplitAnthropicModel(AnthropicModel):
+    """Sends the per-run `<session>` suffix of the instructions as its own system block.
+
+    pydantic-ai puts all instructions in one cached block, and the provider only
+    matches cached prefixes at block boundaries, so a new date or URL would miss
+    the cache for the whole prompt. Splitting keeps the cache point on the
+    static prefix.
+    """
+
+    async def _map_message(self, messages, model_request_parameters, model_settings):
+        system_prompt, anthropic_messages = await super()._map_message(
+            messages, model_request_parameters, model_settings
+        )
+        if isinstance(system_prompt, list) and len(system_prompt) == 1:
+            block = system_prompt[0]
+            prefix, tag, suffix = block["text"].rpartition(SESSION_TAG)
+            if tag and prefix.strip():
+                system_prompt = [
+                    {**block, "text": prefix.rstrip()},
+                    BetaTextBlockParam(type="text", text=tag + suffix),
+                ]
+        return system_prompt, anthropic_messages
+
+
+@lru_cache(maxsize=None)
+def resolve_model(provider_model_name: str) -> SessionSplitAnthropicModel | str:
+    provider, _, model_name = provider_model_name.partition(":")
+    if provider != "anthropic":
+        return provider_model_name
+    return SessionSplitAnthropicModel(model_name)
+
 
 default_chat_model = get_chat_model(DEFAULT_CHAT_MODEL_KEY)
-default_model = AnthropicModel(default_chat_model.billing_model_name)
+default_model = SessionSplitAnthropicModel(default_chat_model.billing_model_name)
 default_model_settings = AnthropicModelSettings(
     max_tokens=16000,
     anthropic_thinking={"type": "adaptive"},
@@ -90,13 +129,29 @@ agent = Agent(
 
 @agent.instructions
 async def get_system_prompt(ctx: RunContext[AssistantRunDeps]) -> str:
-    prompts = {
-        "CURRENT_DATE": datetime.now().strftime("%Y-%m-%d"),
-        "CURRENT_URL": ctx.deps.request_current_url() or "/",
-        "AVAILABLE_SKILLS": build_available_skills_prompt(ctx.deps.user_id),
+    user_id = ctx.deps.user_id
+    prefix = render_instructions_prefix(
+        user_id,
+        skills_signature(user_id),
+        crud.prompt.template_version("rigsstatistiker"),
+    )
+    # Per-run values go last so the prefix is byte-identical between runs.
+    suffix = crud.prompt.render_prompt(
+        name="rigsstatistiker_session",
+        CURRENT_DATE=datetime.now().strftime("%Y-%m-%d"),
+        CURRENT_URL=ctx.deps.request_current_url() or "/",
+    )
+    return f"{prefix.rstrip()}\n\n{suffix.strip()}"
+
+
+@lru_cache(maxsize=256)
+def render_instructions_prefix(user_id: int, skills_key: tuple, template_version: int) -> str:
+    """Static part of the instructions, re-rendered only when skills or the template change."""
+    return crud.prompt.render_prompt(
+        name="rigsstatistiker",
+        AVAILABLE_SKILLS=build_available_skills_prompt(user_id),
         **get_static_prompts(),
-    }
-    return crud.prompt.render_prompt(name="rigsstatistiker", **prompts)
+    )
 
 
 _STATIC_PROMPTS: dict[str, str] | None = None
@@ -113,7 +168,7 @@ def get_static_prompts() -> dict[str, str]:
 def ColumnValues(
     table: str,
     column: str,
-    fuzzy_match_str: str | None = None,
+    fuzzy_match_str: str | list[str] | None = None,
     n: int | None = 5,
     for_table: str | None = None,
 ):
@@ -123,56 +178,101 @@ def ColumnValues(
     Args:
         table: The name of the table.
         column: The name of the column.
-        fuzzy_match_str: A string to fuzzy match against the unique values.
+        fuzzy_match_str: A string, or a list of strings, to fuzzy match against the unique values. With a list the n best matches are returned for each string.
         n: The maximum number of unique values to return.
         for_table: Optional fact table for filtering dimension values to rows present in that fact table.
     """
     table = normalize_table_name(table)
     for_table = normalize_table_name(for_table) if for_table else None
-    if table in DIM_TABLES:
-        df = pd.read_parquet(COLUMN_VALUES_DIR / f"{table}.parquet")
+    if table in get_dim_tables():
+        path = COLUMN_VALUES_DIR / f"{table}.parquet"
+        schema = "dim"
+        df, index = load_column_values(path, schema)
         if for_table:
             df = filter_dimension_values_for_table(df, table, for_table)
         name = f"df_{table}_titel"
-        schema = "dim"
     else:
-        df = pd.read_parquet(COLUMN_VALUES_DIR / f"{table}/{column}.parquet")
-        name = f"df_{table}_{column}"
+        path = COLUMN_VALUES_DIR / f"{table}/{column}.parquet"
         schema = "fact"
+        df, index = load_column_values(path, schema)
+        name = f"df_{table}_{column}"
     if fuzzy_match_str:
-        return fuzzy_match(fuzzy_match_str, df=df, limit=n, schema=schema, name=name)
+        return fuzzy_match(
+            fuzzy_match_str, df=df, limit=n, schema=schema, name=name, index=index
+        )
     else:
         return df_preview(df, max_rows=n, name=name)
 
 
+@agent.tool_plain(docstring_format="google")
+def SearchTables(query: str, k: int = 10):
+    """
+    Full-text search over the fact table docs (descriptions, columns, units and notes) with Danish stemming. Returns the top k tables with their doc path and overview snippet. Use it as the first step of table discovery instead of grepping /subjects and /fact.
+
+    Args:
+        query: What the data should describe, e.g. "befolkning i kommunerne" or "bilimport".
+        k: The maximum number of tables to return.
+    """
+    index = load_table_index()
+    if index is None:
+        raise ModelRetry(
+            "The table search index has not been built. Search the docs with Bash instead."
+        )
+    hits = index.search(query, k=k)
+    if not hits:
+        return "No matching tables. Try other words or browse /subjects with Bash."
+    return format_table_hits(hits)
+
+
+@agent.tool_plain(docstring_format="google")
+def SearchValues(phrases: list[str], n: int = 20):
+    """
+    Search every fact and dimension table for column values, column titles and table descriptions matching each phrase. Use it to find which tables and columns contain a value (e.g. a municipality, a product or an industry) before reading table docs or calling ColumnValues.
+
+    Args:
+        phrases: The phrases to search for, e.g. ["Aarhus", "bilimport"]. Each phrase is searched separately.
+        n: The maximum number of hits to return per phrase.
+    """
+    index = load_value_index()
+    if index is None:
+        raise ModelRetry(
+            "The value search index has not been built. Search the docs with Bash instead."
+        )
+    hits = index.hits_frame(phrases, limit=n)
+    if hits.empty:
+        return "No matches. Try a shorter phrase or a synonym."
+    return df_preview(hits, max_rows=len(hits), name="hits")
+
+
 @agent.tool(docstring_format="google")
-def Sql(ctx: RunContext[AssistantRunDeps], query: str, df_name: str | None = None):
+async def Sql(ctx: RunContext[AssistantRunDeps], query: str, df_name: str | None = None):
     """
-    Execute a SQL query against the PostgreSQL database containing the dimension and fact tables. If df_name is provided then the result is stored in the <session_store> with the name specified by df_name.
+    Execute a SQL query against the PostgreSQL database containing the dimension and fact tables. If df_name is provided then the result is stored in the <session_store> with the name specified by df_name. Without df_name only a preview of the first rows and the total row count are returned. Date columns are returned as datetime64 and range columns (e.g. alder) as Range objects with .lower/.upper attributes. Queries the planner estimates as too expensive are refused with hints when df_name is given, and previewed with a LIMIT or a TABLESAMPLE otherwise (the result then says so).
 
     Args:
         query: The SQL query to execute.
         df_name: The name of the dataframe containing the data from the query.
     """
     try:
-        with dst_read_engine.connect() as conn:
-            df = pd.read_sql(text(query), conn)
+        with query_class(Priority.AGENT, ctx.deps.user_id):
+            if df_name:
+                query_result = await run_cached(query, "full", guarded_query)
+            else:
+                query_result = await run_cached(query, "preview", guarded_preview)
     except Exception as e:
         raise ModelRetry(str(e))
 
-    row_count = len(df)
-    result_parts = [f"row_count: {row_count}"]
+    df = query_result.df
+    row_count = query_result.row_count if query_result.row_count is not None else len(df)
+    result_parts = [f"row_count: {row_count}", query_result.summary()]
     if row_count == 0:
         result_parts.insert(
             0,
             "Warning: query returned 0 rows. Check filter codes with ColumnValues(table, column).",
         )
     if df_name:
-        dtype_map = df_dtype_map(df)
-        for col, type_name in dtype_map.items():
-            if type_name in {"date", "datetime", "Timestamp"}:
-                df[col] = pd.to_datetime(df[col])
-        ctx.deps.shell.user_ns[df_name] = df
+        # The sandbox proxy writes the frame to the worker over IPC; keep that off the loop.
+        await asyncio.to_thread(ctx.deps.shell.user_ns.__setitem__, df_name, df)
         max_rows = 20 if len(df) < 21 else 5
         result_parts.insert(0, f"Stored as {df_name}")
         result_parts.append(df_dtypes(df))
@@ -222,19 +322,23 @@ async def Jupyter(ctx: RunContext[AssistantRunDeps], code: str, show: list[str]
         )
 
     elements_rendered = []
+    render_show_many = getattr(ctx.deps.shell, "render_show_many", None)
     render_show = getattr(ctx.deps.shell, "render_show", None)
-    for name in show:
-        try:
-            if callable(render_show):
-                rendered = await render_show(name)
-            else:
-                element = ctx.deps.shell.user_ns.get(name)
-                rendered = await show_element(element)
-        except ValueError as e:
-            raise ModelRetry(
-                f"{e}. show must reference a pandas DataFrame/Styler, plotly Figure, or matplotlib Figure."
-            )
-        elements_rendered.append(rendered)
+    try:
+        if callable(render_show_many):
+            elements_rendered = await render_show_many(show)
+        else:
+            for name in show:
+                if callable(render_show):
+                    rendered = await render_show(name)
+                else:
+                    element = ctx.deps.shell.user_ns.get(name)
+                    rendered = await show_element(element)
+                elements_rendered.append(rendered)
+    except ValueError as e:
+        raise ModelRetry(
+            f"{e}. show must reference a pandas DataFrame/Styler, plotly Figure, or matplotlib Figure."
+        )
 
     return ToolReturn(
         return_value=res.stdout,
@@ -259,6 +363,7 @@ def Read(
     - By default, it reads up to 2000 lines starting from the beginning of the file
     - You can optionally specify a line offset and limit (especially handy for long files), but it's recommended to read the whole file by not providing these parameters
     - Any lines longer than 2000 characters will be truncated
+    - Parquet files show the row count, column dtypes and 30 rows; offset and limit select rows instead of lines
     - Results are returned using cat -n format, with line numbers starting at 1
     - This tool allows Claude Code to read images (eg PNG, JPG, etc). When reading an image file the contents are presented visually as Claude Code is a multimodal LLM.
     - This tool can only read files, not directories. To read a directory, use an ls command via the Bash tool.
@@ -380,7 +485,9 @@ def Bash(
         description: Clear, concise description of what this command does in active voice. Never use words like complex or risk in the description - just describe what it does. For simple commands (git, npm, standard CLI tools), keep it brief (5-10 words). For commands that are harder to parse at a glance (piped commands, obscure flags, etc.), add enough context to clarify what it does.
     """
     cwd_rel = load_bash_cwd(ctx.deps.user_id, ctx.deps.chat_id)
-    output, new_cwd = run_bash_command(ctx.deps.user_id, cwd_rel, command)
+    output, new_cwd = run_bash_command(
+        ctx.deps.user_id, cwd_rel, command, chat_id=ctx.deps.chat_id
+    )
     save_bash_cwd(ctx.deps.user_id, ctx.deps.chat_id, new_cwd)
     return output
 
@@ -0,0 +1,37 @@
+"""Arrow IPC files for moving DataFrames between the sandbox host and worker.
+
+Frames are written as uncompressed Arrow IPC into the per-chat exchange dir
+(a tmpfs under /dev/shm when available) and memory-mapped by the reader, so a
+transfer costs one buffer copy instead of a parquet encode/compress/decode.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from varro.db.pg_arrow import frame_to_table, table_to_frame
+
+
+def write_frame(df: pd.DataFrame, fp: Path, *, compression: str | None = None) -> None:
+    """Write df as an Arrow IPC file; compress ("zstd") only for files kept on disk."""
+    table = frame_to_table(df, preserve_index=True)
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.OSFile(str(fp), "wb") as sink, pa.ipc.new_file(
+        sink, table.schema, options=options
+    ) as writer:
+        writer.write_table(table)
+
+
+def read_frame(fp: Path, *, writable: bool = True) -> pd.DataFrame:
+    """Memory-map an exchange file into a DataFrame.
+
+    With writable=False the columns are views on the mapping where Arrow allows
+    it (read-only numpy arrays); the file can be unlinked right away either way.
+    """
+    table = pa.ipc.open_file(pa.memory_map(str(fp))).read_all()
+    if writable:
+        return table_to_frame(table)
+    return table_to_frame(table, split_blocks=True)
@@ -1,9 +1,13 @@
+import codecs
 from pathlib import Path
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pydantic_ai import BinaryContent
 from pydantic_ai.messages import ToolReturn
-from varro.data.utils import df_preview
+from varro.agent.line_index import CHUNK_SIZE, seek_line
+from varro.data.utils import df_dtypes, df_preview
 from varro.agent.workspace import (
     is_readonly_user_path,
     resolve_user_path,
@@ -13,12 +17,53 @@ IMAGE_EXTENSIONS = {".png"}
 PARQUET_EXTENSIONS = {".parquet"}
 MAX_LINES_DEFAULT = 2000
 MAX_LINE_LENGTH = 2000
+PARQUET_PREVIEW_ROWS = 30
 
 
 def _error(message: str) -> str:
     return f"Error: {message}"
 
 
+def _parquet_rows(pf: pq.ParquetFile, start: int, limit: int) -> pd.DataFrame:
+    """Decode rows [start, start + limit) using only the row groups that hold them."""
+    groups, skip, first = [], 0, 0
+    for i in range(pf.metadata.num_row_groups):
+        n = pf.metadata.row_group(i).num_rows
+        if first + n > start and first < start + limit:
+            if not groups:
+                skip = start - first
+            groups.append(i)
+        first += n
+    batches, wanted = [], limit
+    if groups and limit:
+        for batch in pf.iter_batches(batch_size=min(skip + limit, 65536), row_groups=groups):
+            if skip >= batch.num_rows:
+                skip -= batch.num_rows
+                continue
+            batch = batch.slice(skip, wanted)
+            skip = 0
+            batches.append(batch)
+            wanted -= batch.num_rows
+            if wanted <= 0:
+                break
+    if not batches:
+        return pf.schema_arrow.empty_table().to_pandas()
+    return pa.Table.from_batches(batches).to_pandas()
+
+
+def _parquet_preview(path: Path, offset: int | None, limit: int | None) -> str:
+    pf = pq.ParquetFile(path)
+    meta = pf.metadata
+    start = max(1, offset or 1) - 1
+    n_rows = PARQUET_PREVIEW_ROWS if limit is None else min(max(0, limit), MAX_LINES_DEFAULT)
+    df = _parquet_rows(pf, start, n_rows)
+    header = (
+        f"{path.name}: {meta.num_rows} rows, {meta.num_columns} columns, "
+        f"{meta.num_row_groups} row groups\n{df_dtypes(df)}"
+    )
+    return header + "\n" + df_preview(df, max_rows=n_rows, name=path.stem, start=start)
+
+
 def read_file(
     file_path: str,
     user_id: int,
@@ -52,10 +97,9 @@ def read_file(
         )
     if suffix in PARQUET_EXTENSIONS:
         try:
-            df = pd.read_parquet(path)
+            return _parquet_preview(path, offset, limit)
         except Exception as exc:
             return _error(str(exc))
-        return df_preview(df, max_rows=30, name=path.stem)
 
     if path.stat().st_size == 0:
         return "Warning: file is empty."
@@ -63,20 +107,37 @@ def read_file(
     start = max(1, offset or 1)
     max_lines = MAX_LINES_DEFAULT if limit is None else max(0, limit)
     try:
-        lines = []
-        with path.open("r", encoding="utf-8") as handle:
-            for line_no, line in enumerate(handle, start=1):
-                if line_no < start:
-                    continue
-                if len(lines) >= max_lines:
-                    break
-                lines.append(f"{line_no:>6}\t{line.rstrip('\n')[:MAX_LINE_LENGTH]}")
+        lines = _read_lines(path, start, max_lines)
     except (OSError, UnicodeDecodeError) as exc:
         return _error(str(exc))
 
     return "\n".join(lines)
 
 
+def _read_lines(path: Path, start: int, max_lines: int) -> list[str]:
+    byte_offset, line_no = seek_line(path, start)
+    max_bytes = MAX_LINE_LENGTH * 4
+    lines = []
+    with path.open("rb") as handle:
+        handle.seek(byte_offset)
+        while len(lines) < max_lines:
+            raw = handle.readline(max_bytes)
+            if not raw:
+                break
+            truncated = not raw.endswith(b"\n")
+            if truncated:
+                # Skip the rest of an overlong line without reading it into memory.
+                while (rest := handle.readline(CHUNK_SIZE)) and not rest.endswith(b"\n"):
+                    pass
+            if line_no >= start:
+                # An incremental decoder tolerates a character cut off by the byte limit.
+                text = codecs.getincrementaldecoder("utf-8")().decode(raw, final=not truncated)
+                text = text.removesuffix("\n").removesuffix("\r")
+                lines.append(f"{line_no:>6}\t{text[:MAX_LINE_LENGTH]}")
+            line_no += 1
+    return lines
+
+
 def write_file(file_path: str, user_id: int, content: str) -> str:
     if is_readonly_user_path(file_path):
         return _error("file_path is read-only")
@@ -1,74 +1,96 @@
 from __future__ import annotations
 
 import argparse
-import json
+import io
+import os
+import sys
 from pathlib import Path
+from typing import BinaryIO
 from uuid import uuid4
 
-import dill
 import pandas as pd
 import plotly.graph_objects as go
 from pandas.io.formats.style import Styler
 import matplotlib.pyplot as plt
+from varro.agent.exchange import read_frame, write_frame
 from varro.agent.shell import JUPYTER_INITIAL_IMPORTS, get_shell
+from varro.agent.shell_snapshot import NamespaceTracker, SnapshotStore, referenced_names
+from varro.agent.worker_rpc import BLOB_INLINE_MAX, recv_message, send_message
 from varro.data.utils import df_preview
 
-EXCHANGE_DIR = Path("/.varro_exchange")
+EXCHANGE_DIR = Path("/varro_exchange")
+# Set when the host attaches a chat.
+STORE: SnapshotStore | None = None
+TRACKER: NamespaceTracker | None = None
 
 
-def _send_response(payload: dict) -> None:
-    print(json.dumps(payload, ensure_ascii=False), flush=True)
+def _protocol_streams() -> tuple[BinaryIO, BinaryIO]:
+    """Take over stdin/stdout for the protocol and point fd 1 at stderr.
 
+    Output that bypasses IPython's capture (C extensions, subprocesses) then
+    lands in stderr instead of corrupting the framed response stream.
+    """
+    rpc_in = os.fdopen(os.dup(sys.stdin.fileno()), "rb")
+    rpc_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return rpc_in, rpc_out
 
-def _read_request() -> dict | None:
-    line = input()
-    if not line:
-        return None
-    return json.loads(line)
 
+def _attach(shell, snapshot_path: Path) -> None:
+    global STORE, TRACKER
+    STORE = SnapshotStore(snapshot_path)
+    STORE.load(shell.user_ns)
+    TRACKER = NamespaceTracker(shell.user_ns, shell.user_ns_hidden)
+
+
+def _ensure_loaded(shell, names) -> None:
+    """Read snapshot DataFrames that are about to be used from disk."""
+    if STORE is not None and STORE.pending:
+        STORE.ensure_loaded(shell.user_ns, names)
 
-def _save_snapshot(shell, snapshot_path: Path) -> None:
-    snapshot_path.parent.mkdir(parents=True, exist_ok=True)
-    user_ns = getattr(shell, "user_ns", {})
-    serializable = {}
-    for key, value in user_ns.items():
-        if key.startswith("__"):
-            continue
-        try:
-            dill.dumps(value)
-        except Exception:
-            continue
-        serializable[key] = value
-    tmp_path = snapshot_path.with_suffix(".tmp")
-    with tmp_path.open("wb") as f:
-        dill.dump(serializable, f)
-    tmp_path.replace(snapshot_path)
 
+def _mark_changed(names) -> None:
+    if STORE is not None:
+        STORE.mark_changed(names)
 
-def _load_snapshot(shell, snapshot_path: Path) -> None:
-    if not snapshot_path.exists():
-        return
-    with snapshot_path.open("rb") as f:
-        value = dill.load(f)
-    if isinstance(value, dict):
-        shell.user_ns.update(value)
+
+def _run_cell(shell, code: str, timeout: int | None) -> tuple[object, set[str] | None]:
+    """Run a cell; also returns the names it changed (None if not tracked)."""
+    _ensure_loaded(shell, referenced_names(code, shell.user_ns))
+    if TRACKER is None:
+        return shell.run_cell(code, timeout=timeout), None
+    TRACKER.before_cell(code)
+    result = shell.run_cell(code, timeout=timeout)
+    changed = TRACKER.after_cell(code)
+    _mark_changed(changed)
+    return result, changed
 
 
 def _export_dataframe(df: pd.DataFrame) -> str:
     EXCHANGE_DIR.mkdir(parents=True, exist_ok=True)
-    fp = EXCHANGE_DIR / f"df_{uuid4().hex}.parquet"
-    df.to_parquet(fp, index=True)
+    fp = EXCHANGE_DIR / f"df_{uuid4().hex}.arrow"
+    write_frame(df, fp)
     return fp.as_posix()
 
 
-def _export_png(fig: plt.Figure) -> str:
+def _blob(data: bytes) -> dict:
+    """Inline small payloads; hand large ones over through the exchange dir."""
+    if len(data) <= BLOB_INLINE_MAX:
+        return {"data": data}
     EXCHANGE_DIR.mkdir(parents=True, exist_ok=True)
-    fp = EXCHANGE_DIR / f"fig_{uuid4().hex}.png"
-    fig.savefig(fp, format="png")
-    return fp.as_posix()
+    fp = EXCHANGE_DIR / f"blob_{uuid4().hex}.bin"
+    fp.write_bytes(data)
+    return {"path": fp.as_posix()}
+
+
+def _png_bytes(fig: plt.Figure) -> bytes:
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
 
 
 def _handle_get_object(shell, name: str) -> dict:
+    _ensure_loaded(shell, [name])
     value = shell.user_ns.get(name)
     if value is None:
         return {"ok": True, "kind": "missing"}
@@ -77,11 +99,12 @@ def _handle_get_object(shell, name: str) -> dict:
     if isinstance(value, Styler):
         return {"ok": True, "kind": "styler_df", "path": _export_dataframe(value.data)}
     if isinstance(value, go.Figure):
-        return {"ok": True, "kind": "plotly", "json": value.to_json()}
+        return {"ok": True, "kind": "plotly", **_blob(value.to_json().encode())}
     return {"ok": True, "kind": "unsupported"}
 
 
 def _handle_render_show(shell, name: str) -> dict:
+    _ensure_loaded(shell, [name])
     value = shell.user_ns.get(name)
     if value is None:
         return {"ok": False, "error": f"Invalid output type: {type(value)}"}
@@ -90,83 +113,84 @@ def _handle_render_show(shell, name: str) -> dict:
     if isinstance(value, Styler):
         return {"ok": True, "kind": "text", "text": df_preview(value.data, max_rows=30)}
     if isinstance(value, go.Figure):
-        return {"ok": True, "kind": "plotly", "json": value.to_json()}
+        return {"ok": True, "kind": "plotly", **_blob(value.to_json().encode())}
     if isinstance(value, plt.Figure):
-        return {"ok": True, "kind": "png", "path": _export_png(value)}
+        return {"ok": True, "kind": "png", **_blob(_png_bytes(value))}
     return {"ok": False, "error": f"Invalid output type: {type(value)}"}
 
 
-def serve(snapshot_path: Path, exchange_dir: Path) -> int:
+def _handle(shell, request: dict) -> dict:
+    global EXCHANGE_DIR
+    op = request.get("op")
+    if op == "ping":
+        return {"ok": True}
+    if op == "attach":
+        EXCHANGE_DIR = Path(request["exchange_dir"])
+        _attach(shell, Path(request["snapshot_path"]))
+        return {"ok": True}
+    if op == "run_cell":
+        result, changed = _run_cell(shell, request.get("code", ""), request.get("timeout"))
+        return {
+            "ok": True,
+            "changed": sorted(changed) if changed is not None else None,
+            "mutated": TRACKER.mutated if TRACKER is not None else True,
+            "stdout": getattr(result, "stdout", ""),
+            "error_before_exec": repr(result.error_before_exec)
+            if result.error_before_exec
+            else None,
+            "error_in_exec": repr(result.error_in_exec) if result.error_in_exec else None,
+        }
+    if op == "set_dataframe":
+        shell.user_ns[request["name"]] = read_frame(Path(request["path"]))
+        _mark_changed([request["name"]])
+        return {"ok": True}
+    if op == "set_literal":
+        shell.user_ns[request["name"]] = request.get("value")
+        _mark_changed([request["name"]])
+        return {"ok": True}
+    if op == "get_object":
+        return _handle_get_object(shell, request["name"])
+    if op == "render_show":
+        return _handle_render_show(shell, request["name"])
+    if op == "reset":
+        shell.reset(new_session=bool(request.get("new_session", False)))
+        if STORE is not None:
+            STORE.clear()
+        return {"ok": True}
+    if op == "shutdown":
+        if request.get("save_snapshot") and STORE is not None:
+            STORE.save(shell.user_ns, shell.user_ns_hidden)
+        return {"ok": True}
+    return {"ok": False, "error": f"unknown op: {op}"}
+
+
+def serve(exchange_dir: Path) -> int:
+    """Serve requests; the snapshot is loaded when the host attaches a chat."""
     global EXCHANGE_DIR
     EXCHANGE_DIR = exchange_dir
+    rpc_in, rpc_out = _protocol_streams()
     shell = get_shell()
     shell.run_cell(JUPYTER_INITIAL_IMPORTS)
-    _load_snapshot(shell, snapshot_path)
     while True:
-        try:
-            request = _read_request()
-        except EOFError:
-            break
+        request = recv_message(rpc_in)
         if request is None:
             break
-        op = request.get("op")
         try:
-            if op == "ping":
-                _send_response({"ok": True})
-                continue
-            if op == "run_cell":
-                result = shell.run_cell(
-                    request.get("code", ""),
-                    timeout=request.get("timeout"),
-                )
-                _send_response(
-                    {
-                        "ok": True,
-                        "stdout": getattr(result, "stdout", ""),
-                        "error_before_exec": repr(result.error_before_exec)
-                        if result.error_before_exec
-                        else None,
-                        "error_in_exec": repr(result.error_in_exec)
-                        if result.error_in_exec
-                        else None,
-                    }
-                )
-                continue
-            if op == "set_dataframe":
-                shell.user_ns[request["name"]] = pd.read_parquet(request["path"])
-                _send_response({"ok": True})
-                continue
-            if op == "set_literal":
-                shell.user_ns[request["name"]] = request.get("value")
-                _send_response({"ok": True})
-                continue
-            if op == "get_object":
-                _send_response(_handle_get_object(shell, request["name"]))
-                continue
-            if op == "render_show":
-                _send_response(_handle_render_show(shell, request["name"]))
-                continue
-            if op == "reset":
-                shell.reset(new_session=bool(request.get("new_session", False)))
-                _send_response({"ok": True})
-                continue
-            if op == "shutdown":
-                if request.get("save_snapshot"):
-                    _save_snapshot(shell, snapshot_path)
-                _send_response({"ok": True})
-                break
-            _send_response({"ok": False, "error": f"unknown op: {op}"})
+            response = _handle(shell, request)
         except Exception as exc:
-            _send_response({"ok": False, "error": str(exc)})
+            response = {"ok": False, "error": str(exc)}
+        send_message(rpc_out, {**response, "id": request.get("id")})
+        rpc_out.flush()
+        if request.get("op") == "shutdown":
+            break
     return 0
 
 
 def main() -> int:
     parser = argparse.ArgumentParser()
-    parser.add_argument("--snapshot-path", required=True)
     parser.add_argument("--exchange-dir", required=True)
     args = parser.parse_args()
-    return serve(Path(args.snapshot_path), Path(args.exchange_dir))
+    return serve(Path(args.exchange_dir))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+"""Sparse line-offset index for paging through large text files.
+
+Every LINE_INDEX_STRIDE-th line start is recorded as a byte offset, so a page
+at any `offset` seeks to the nearest checkpoint and skips at most a stride of
+lines instead of re-reading the file from byte 0. An index is built on the
+first page that needs it, kept in memory and on disk keyed by path, mtime and
+size, and rebuilt when the file changes.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from varro.config import LINE_INDEX_DIR, settings
+
+LINE_INDEX_STRIDE = int(settings.get("LINE_INDEX_STRIDE", "1000"))
+CHUNK_SIZE = 1 << 20
+
+
+def _index_path(path: Path, mtime_ns: int, size: int) -> Path:
+    path_key = hashlib.sha256(str(path).encode()).hexdigest()[:32]
+    return LINE_INDEX_DIR / path_key / f"{mtime_ns}_{size}_{LINE_INDEX_STRIDE}.npy"
+
+
+def _build(path: Path) -> np.ndarray:
+    checkpoints = [0]
+    lines = 0
+    base = 0
+    with path.open("rb") as handle:
+        while chunk := handle.read(CHUNK_SIZE):
+            newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10)
+            # Line number (1-based) that starts after each newline.
+            starts = lines + 2 + np.arange(len(newlines))
+            hits = newlines[(starts - 1) % LINE_INDEX_STRIDE == 0]
+            checkpoints.extend((base + hits + 1).tolist())
+            lines += len(newlines)
+            base += len(chunk)
+    return np.asarray(checkpoints, dtype=np.uint64)
+
+
+def _store(index_fp: Path, index: np.ndarray) -> None:
+    index_fp.parent.mkdir(parents=True, exist_ok=True)
+    for stale in index_fp.parent.glob("*.npy"):
+        stale.unlink(missing_ok=True)
+    tmp_fp = index_fp.with_name(f".{index_fp.name}.{os.getpid()}.tmp")
+    with tmp_fp.open("wb") as handle:
+        np.save(handle, index)
+    os.replace(tmp_fp, index_fp)
+
+
+@lru_cache(maxsize=64)
+def _load(path: Path, mtime_ns: int, size: int) -> np.ndarray:
+    index_fp = _index_path(path, mtime_ns, size)
+    try:
+        return np.load(index_fp)
+    except (OSError, ValueError):
+        pass
+    index = _build(path)
+    try:
+        _store(index_fp, index)
+    except OSError:
+        pass
+    return index
+
+
+def seek_line(path: Path, line_no: int) -> tuple[int, int]:
+    """Return (byte offset, line number) of the nearest indexed line at or before `line_no`."""
+    if line_no <= LINE_INDEX_STRIDE:
+        return 0, 1
+    stat = path.stat()
+    index = _load(path, stat.st_mtime_ns, stat.st_size)
+    slot = min((line_no - 1) // LINE_INDEX_STRIDE, len(index) - 1)
+    return int(index[slot]), slot * LINE_INDEX_STRIDE + 1
@@ -1,5 +1,17 @@
 import asyncio
-from playwright.async_api import async_playwright, Browser
+import logging
+from pathlib import Path
+
+from playwright.async_api import async_playwright, Browser, Page
+
+from varro.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Figures rendered at once (one pooled page each); map tiles get a bounded wait.
+PLOTLY_RENDER_CONCURRENCY = int(settings.get("PLOTLY_RENDER_CONCURRENCY", "2"))
+PLOTLY_MAP_TIMEOUT_MS = int(settings.get("PLOTLY_MAP_TIMEOUT_MS", "5000"))
+RENDER_TIMEOUT_MS = 10_000
 
 
 # Global singletons
@@ -45,6 +57,7 @@ async def start_browser() -> None:
 async def stop_browser() -> None:
     """Cleanly close Chromium & Playwright (call from shutdown event)."""
     global _playwright, _browser
+    await figure_rasterizer.close()
     async with _lock:
         if _browser:
             await _browser.close()
@@ -54,41 +67,137 @@ async def stop_browser() -> None:
             _playwright = None
 
 
-async def html_to_png(html: str, *, width: int = 600, height: int = 400) -> bytes:
-    """
-    Render a Plotly HTML string to PNG bytes.
-    - Waits until Plotly's graph SVG/canvas is present
+FIGURE_PAGE_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"></head>
+<body style="margin:0;background:white"><div id="figure"></div></body></html>"""
+
+# Runs in the page: draw a figure spec and resolve once it is fully painted.
+RENDER_FIGURE_JS = """
+async ({figure, width, height, mapTimeoutMs}) => {
+  const gd = document.getElementById("figure");
+  const spec = JSON.parse(figure);
+  const layout = spec.layout || {};
+  gd.style.width = (layout.width || width) + "px";
+  gd.style.height = (layout.height || height) + "px";
+  await Plotly.react(gd, spec.data || [], layout, {staticPlot: true, displayModeBar: false});
+  // Map subplots (maplibre/mapbox) keep loading tiles after Plotly has drawn.
+  const maps = Object.keys(gd._fullLayout || {})
+    .filter((k) => /^(map|mapbox)\\d*$/.test(k))
+    .map((k) => gd._fullLayout[k]._subplot && gd._fullLayout[k]._subplot.map)
+    .filter(Boolean);
+  await Promise.all(maps.map((m) => new Promise((resolve) => {
+    if (m.loaded() && m.areTilesLoaded()) return resolve();
+    m.once("idle", resolve);
+    setTimeout(resolve, mapTimeoutMs);
+  })));
+  await new Promise((r) => requestAnimationFrame(() => requestAnimationFrame(r)));
+  return [gd.offsetWidth, gd.offsetHeight];
+}
+"""
+
+
+def _plotly_js_path() -> Path:
+    import plotly
+
+    return Path(plotly.__file__).parent / "package_data" / "plotly.min.js"
+
+
+class FigureRasterizer:
+    """A pool of browser pages with plotly.js loaded, rendering figures via Plotly.react.
+
+    Pages are created on first use, up to `concurrency`, and reused for later
+    figures; a page that fails a render is closed and replaced. plotly.js is
+    the bundle shipped with the plotly package, so no network is needed.
     """
-    if _browser is None:  # safety net (should be started already)
-        await start_browser()
 
-    page = await _browser.new_page(  # type: ignore[arg-type]
-        viewport={"width": width, "height": height},
-        device_scale_factor=1,
-    )
+    def __init__(self, *, concurrency: int = PLOTLY_RENDER_CONCURRENCY):
+        self._concurrency = max(1, concurrency)
+        self._idle: list[Page] = []
+        self._created = 0
+        self._available = asyncio.Condition()
 
-    try:
-        # Just load the HTML
-        await page.set_content(html)
-
-        # Wait until the Plotly graph actually rendered something:
-        # either an SVG with class .main-svg or a canvas inside the plot container.
-        await page.wait_for_selector(
-            ".plotly-graph-div .main-svg, .plotly-graph-div canvas",
-            timeout=10_000,  # ms
-            state="visible",
+    async def _new_page(self) -> Page:
+        if _browser is None:
+            await start_browser()
+        page = await _browser.new_page(  # type: ignore[union-attr]
+            viewport={"width": 600, "height": 600},
+            device_scale_factor=1,
         )
+        try:
+            await page.set_content(FIGURE_PAGE_HTML)
+            await page.add_script_tag(path=str(_plotly_js_path()))
+        except BaseException:
+            await page.close()
+            raise
+        return page
 
-        # Map-based charts (choropleth_map, scattermap) use a maplibre WebGL canvas
-        # that needs extra time to load tiles and render polygons.
-        map_canvas = page.locator(".maplibregl-canvas, .mapboxgl-canvas")
-        if await map_canvas.count():
-            await page.wait_for_timeout(2000)
+    async def _checkout(self) -> Page:
+        async with self._available:
+            while not self._idle and self._created >= self._concurrency:
+                await self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            return await self._new_page()
+        except BaseException:
+            await self._discard(None)
+            raise
 
-        png_bytes = await page.screenshot(type="png", scale="css")
+    async def _checkin(self, page: Page) -> None:
+        async with self._available:
+            self._idle.append(page)
+            self._available.notify()
+
+    async def _discard(self, page: Page | None) -> None:
+        if page is not None:
+            try:
+                await page.close()
+            except Exception:
+                pass
+        async with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    async def render(self, figure_json: str, *, width: int = 600, height: int = 600) -> bytes:
+        """PNG of a figure (as plotly JSON); layout width/height win over the defaults."""
+        page = await self._checkout()
+        try:
+            size = await page.evaluate(
+                RENDER_FIGURE_JS,
+                {
+                    "figure": figure_json,
+                    "width": width,
+                    "height": height,
+                    "mapTimeoutMs": PLOTLY_MAP_TIMEOUT_MS,
+                },
+            )
+            png_bytes = await page.locator("#figure").screenshot(
+                type="png", scale="css", timeout=RENDER_TIMEOUT_MS
+            )
+        except BaseException:
+            await self._discard(page)
+            raise
+        await self._checkin(page)
+        logger.debug("Rendered %sx%s figure", *size)
         return png_bytes
-    finally:
-        await page.close()
+
+    async def close(self) -> None:
+        async with self._available:
+            pages, self._idle = self._idle, []
+            self._created -= len(pages)
+        for page in pages:
+            try:
+                await page.close()
+            except Exception:
+                pass
+
+
+figure_rasterizer = FigureRasterizer()
+
+
+async def figure_to_png(figure_json: str, *, width: int = 600, height: int = 600) -> bytes:
+    return await figure_rasterizer.render(figure_json, width=width, height=height)
 
 
 async def url_to_png(
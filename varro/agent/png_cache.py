@@ -0,0 +1,65 @@
+"""Content-addressed cache of rasterized Plotly figures, shared by all workers.
+
+A key is the hash of the canonical figure JSON (keys sorted, so dict order
+does not matter), the viewport, the max_pixels cap and the plotly version;
+the value is the already optimized PNG. The same figure shown by the agent,
+re-shown later and rendered again in a dashboard snapshot goes through
+Chromium and the PNG optimizer once. It is a FileCache, like the SQL result
+cache.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import plotly
+
+from varro.config import PNG_CACHE_DIR, settings
+from varro.db.file_cache import FileCache
+
+PNG_CACHE_MAX_BYTES = int(settings.get("PNG_CACHE_MAX_BYTES", str(256 * 1024**2)))
+
+
+def figure_key(figure_json: str, *, width: int, height: int, max_pixels: int) -> str:
+    canonical = json.dumps(json.loads(figure_json), sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256(canonical.encode())
+    digest.update(f"|{width}x{height}|{max_pixels}|{plotly.__version__}".encode())
+    return digest.hexdigest()
+
+
+class PngCache(FileCache):
+    files_dir_name = "png"
+    suffix = ".png"
+
+    def __init__(self, cache_dir: Path = PNG_CACHE_DIR, max_bytes: int = PNG_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def get(self, key: str) -> bytes | None:
+        """Return the stored PNG and mark it recently used."""
+        if not self.enabled:
+            return None
+        with self._connect() as conn:
+            try:
+                data = self._path(key).read_bytes() if self._has(conn, key) else None
+            except OSError:
+                data = None
+            if data is None:
+                self._count(conn, "misses")
+                return None
+            self._hit(conn, key)
+        return data
+
+    def put(self, key: str, png_bytes: bytes) -> None:
+        if not self.enabled or len(png_bytes) > self.max_bytes:
+            return
+        with self._connect() as conn:
+            tmp_path = self._tmp_path(key)
+            tmp_path.write_bytes(png_bytes)
+            os.replace(tmp_path, self._path(key))
+            self._stored(conn, key, len(png_bytes))
+
+
+png_cache = PngCache()
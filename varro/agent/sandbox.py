@@ -1,25 +1,33 @@
 from __future__ import annotations
 
+import asyncio
+import itertools
 import json
+import logging
+import os
 import re
 from collections import deque
+from concurrent.futures import Future
 from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path, PurePosixPath
 import posixpath
 import resource
+import selectors
 import shutil
+import signal
 import subprocess
 import sys
 import threading
+import time
 from types import SimpleNamespace
 from uuid import uuid4
 
-import dill
 import pandas as pd
 import plotly.graph_objects as go
 from pydantic_ai import BinaryContent
 from safecmd.bashxtract import extract_commands
+from varro.agent.exchange import read_frame, write_frame
 from varro.agent.shell import (
     BASH_TIMEOUT,
     JUPYTER_INITIAL_IMPORTS,
@@ -28,10 +36,19 @@ from varro.agent.shell import (
     get_shell,
     run_bash_command as run_bash_command_vanilla,
 )
+from varro.agent.shell_snapshot import (
+    load_snapshot,
+    remove_snapshot,
+    save_snapshot,
+    snapshot_vars_dir,
+)
 from varro.agent.utils import show_element
+from varro.agent.worker_rpc import recv_message, send_message
 from varro.agent.workspace import user_workspace_root
 from varro.config import AGENT_DATA_DIR, PROJECT_ROOT, settings
 
+logger = logging.getLogger(__name__)
+
 SHELL_MODE = (settings.get("BASH_MODE") or "BWRAP").upper()
 READONLY_DOCS_ROOTS = ("/subjects", "/fact", "/dim", "/geo")
 BASH_ALLOWED_COMMANDS = {
@@ -82,6 +99,8 @@ BASH_ALLOWED_COMMANDS = {
 }
 BASH_ALLOWED_BINARIES = [
     "sh",
+    # Not a user command: BashSession runs each command in its own session.
+    "setsid",
     "awk",
     "basename",
     "cat",
@@ -122,7 +141,15 @@ BASH_ALLOWED_BINARIES = [
 BASH_DELETE_COMMANDS = {"rm", "rmdir", "unlink"}
 LIB_DIRS = (Path("/lib"), Path("/lib64"), Path("/usr/lib"), Path("/usr/lib64"))
 EXCHANGE_ROOT_NAME = ".varro_exchange"
+EXCHANGE_GUEST_DIR = "/varro_exchange"
+# Per-worker state dirs, under the state root the worker was spawned with.
+WORKER_STATE_DIR_NAME = ".workers"
+# Next to each worker state dir (outside the worker's view): the snapshot path
+# it holds, so a sweep can put the snapshot back.
+WORKER_TARGET_SUFFIX = ".attached"
+EXCHANGE_SHM_ROOT = Path(settings.get("SANDBOX_EXCHANGE_SHM_DIR") or "/dev/shm/varro_exchange")
 _MISSING = object()
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
 
 
 def _int_setting(name: str, default: int) -> int:
@@ -344,8 +371,8 @@ def _build_bwrap_bash_args(user_root: Path, cwd_rel: str) -> list[str]:
 
 def _build_bwrap_worker_args(
     user_root: Path,
-    snapshot_dir: Path,
-    exchange_dir_guest: str,
+    state_dir: Path,
+    exchange_dir: Path,
 ) -> list[str]:
     args = _bwrap_base_args(user_root, "/")
     args += [
@@ -360,8 +387,13 @@ def _build_bwrap_worker_args(
         "--dir",
         "/varro_state",
         "--bind",
-        str(snapshot_dir),
+        str(state_dir),
         "/varro_state",
+        "--dir",
+        EXCHANGE_GUEST_DIR,
+        "--bind",
+        str(exchange_dir),
+        EXCHANGE_GUEST_DIR,
     ]
     for bind_path in (
         Path("/bin"),
@@ -378,10 +410,8 @@ def _build_bwrap_worker_args(
         sys.executable,
         "-m",
         "varro.agent.ipython_worker",
-        "--snapshot-path",
-        "/varro_state/shell.pkl",
         "--exchange-dir",
-        exchange_dir_guest,
+        EXCHANGE_GUEST_DIR,
     ]
     return args
 
@@ -412,13 +442,7 @@ def _worker_env() -> dict[str, str]:
     return env
 
 
-def run_bash_command(user_id: int, cwd_rel: str, command: str) -> tuple[str, str]:
-    if not _use_bwrap():
-        return run_bash_command_vanilla(user_id, cwd_rel, re.sub(r'(?:(?<=^)|(?<=[\s\(\)\'";|&]))/(?!\*)', f"{user_workspace_root(user_id)}/", command))
-    if not command or not command.strip():
-        return "Error: command is empty", _sanitize_cwd_rel(cwd_rel)
-
-    user_root = user_workspace_root(user_id)
+def _check_bash_command(user_root: Path, cwd_rel: str, command: str) -> tuple[str | None, str]:
     cwd_rel = _normalize_existing_cwd(user_root, cwd_rel)
     commands, _, _ = extract_commands(command)
 
@@ -427,6 +451,32 @@ def run_bash_command(user_id: int, cwd_rel: str, command: str) -> tuple[str, str
         return f"Error: command not allowed: {bad}", cwd_rel
     if _delete_targets_readonly(commands, cwd_rel):
         return "Error: path is read-only", cwd_rel
+    return None, cwd_rel
+
+
+def _bash_result(returncode: int, output: str, cwd_rel: str) -> tuple[str, str]:
+    if returncode != 0:
+        return (
+            f"Error: command failed with exit code {returncode}\n{output}".rstrip(),
+            cwd_rel,
+        )
+    return output, cwd_rel
+
+
+def run_bash_command(
+    user_id: int, cwd_rel: str, command: str, *, chat_id: int | None = None
+) -> tuple[str, str]:
+    if not _use_bwrap():
+        return run_bash_command_vanilla(user_id, cwd_rel, re.sub(r'(?:(?<=^)|(?<=[\s\(\)\'";|&]))/(?!\*)', f"{user_workspace_root(user_id)}/", command))
+    if not command or not command.strip():
+        return "Error: command is empty", _sanitize_cwd_rel(cwd_rel)
+
+    user_root = user_workspace_root(user_id)
+    error, cwd_rel = _check_bash_command(user_root, cwd_rel, command)
+    if error:
+        return error, cwd_rel
+    if chat_id is not None:
+        return bash_sessions.run(user_id, chat_id, cwd_rel, command)
 
     sentinel = f"__VARRO_PWD_{uuid4().hex}__"
     wrapped = (
@@ -450,13 +500,183 @@ def run_bash_command(user_id: int, cwd_rel: str, command: str) -> tuple[str, str
     output = _combine_output(stdout, res.stderr)
     if reported_pwd:
         cwd_rel = _sanitize_cwd_rel(reported_pwd)
+    return _bash_result(res.returncode, output, cwd_rel)
 
-    if res.returncode != 0:
-        return (
-            f"Error: command failed with exit code {res.returncode}\n{output}".rstrip(),
-            cwd_rel,
+
+def _sh_quote(value: str) -> str:
+    return "'" + value.replace("'", "'\\''") + "'"
+
+
+class BashSession:
+    """A long-lived sandboxed `sh` that runs one command at a time over stdin.
+
+    The bwrap namespace and the shell are set up once per chat; each command is
+    written to the shell's stdin and run by `setsid sh -c` in its own process
+    group, followed by sentinel lines on stdout and stderr carrying the exit
+    code and the new working directory. Once the command exits its process
+    group is killed, so background jobs (`cmd &`) do not outlive the command.
+    A command that times out kills the session; the next call spawns a fresh
+    one.
+    """
+
+    def __init__(self, user_root: Path):
+        self.user_root = user_root
+        self.last_active = time.monotonic()
+        self._lock = threading.Lock()
+        self._proc = subprocess.Popen(
+            _build_bwrap_bash_args(user_root, "/") + ["sh"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=_minimal_env(),
+            preexec_fn=_apply_limits(BASH_LIMITS),
+            start_new_session=True,
         )
-    return output, cwd_rel
+
+    @property
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    @property
+    def busy(self) -> bool:
+        """True while a command is running."""
+        return self._lock.locked()
+
+    def run(self, cwd_rel: str, command: str, *, timeout: float = BASH_TIMEOUT) -> tuple[str, str]:
+        with self._lock:
+            self.last_active = time.monotonic()
+            try:
+                return self._run(cwd_rel, command, timeout)
+            finally:
+                self.last_active = time.monotonic()
+
+    def _run(self, cwd_rel: str, command: str, timeout: float) -> tuple[str, str]:
+        sentinel = f"__VARRO_DONE_{uuid4().hex}__"
+        pwd_sentinel = f"__VARRO_PWD_{uuid4().hex}__"
+        # The command runs in a child shell so `exit`, `set -e` or a parse error
+        # end that command only, not the session shell. setsid makes the child
+        # a process group leader (a background job is not one already, so its
+        # pid is kept), and killing that group afterwards ends any jobs it left.
+        inner = (
+            f"eval \"$1\"; varro_rc=$?; "
+            f"printf '\\n{pwd_sentinel}%s\\n' \"$PWD\"; exit $varro_rc"
+        )
+        script = (
+            f"cd -- {_sh_quote(cwd_rel)} 2>/dev/null || cd /\n"
+            f"setsid sh -c {_sh_quote(inner)} sh {_sh_quote(command + chr(10))} </dev/null &\n"
+            "varro_pid=$!; wait $varro_pid; varro_rc=$?; kill -9 -$varro_pid 2>/dev/null\n"
+            f"printf '\\n{sentinel}%s\\n' \"$varro_rc\"; printf '\\n{sentinel}\\n' >&2\n"
+        )
+        try:
+            self._proc.stdin.write(script.encode())
+            self._proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.close()
+            return "Error: bash session exited", cwd_rel
+
+        marker = sentinel.encode()
+        streams = {self._proc.stdout.fileno(): bytearray(), self._proc.stderr.fileno(): bytearray()}
+        deadline = time.monotonic() + timeout
+        with selectors.DefaultSelector() as selector:
+            for fd in streams:
+                selector.register(fd, selectors.EVENT_READ)
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.close()
+                    return f"Error: command timed out after {timeout:g}s", cwd_rel
+                for key, _ in selector.select(remaining):
+                    chunk = os.read(key.fd, 65536)
+                    buf = streams[key.fd]
+                    buf += chunk
+                    tail = bytes(buf[-(len(chunk) + len(marker) + 8) :])
+                    if not chunk or (marker in tail and tail.endswith(b"\n")):
+                        selector.unregister(key.fd)
+
+        stdout, stderr = (bytes(b).decode(errors="replace") for b in streams.values())
+        if sentinel not in stdout or sentinel not in stderr:
+            self.close()
+            output = _combine_output(stdout, stderr)
+            return f"Error: bash session exited\n{output}".rstrip(), cwd_rel
+
+        stdout, _, trailer = stdout.rpartition(sentinel)
+        stdout, reported_pwd = _split_output_pwd(stdout, pwd_sentinel)
+        stderr = stderr.rpartition(sentinel)[0]
+        rc = trailer.strip()
+        if reported_pwd:
+            cwd_rel = _sanitize_cwd_rel(reported_pwd)
+        return _bash_result(int(rc) if rc.isdigit() else 1, _combine_output(stdout, stderr), cwd_rel)
+
+    def close(self) -> None:
+        if self._proc.poll() is None:
+            try:
+                os.killpg(self._proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self._proc.wait()
+        for stream in (self._proc.stdin, self._proc.stdout, self._proc.stderr):
+            stream.close()
+
+
+class BashSessions:
+    """Per-chat `BashSession`s, spawned on first use and closed when idle."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: dict[tuple[int, int], BashSession] = {}
+        self.spawns = 0
+
+    def _lease(self, user_id: int, chat_id: int) -> BashSession:
+        key = (user_id, chat_id)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and session.alive:
+                return session
+            self._sessions.pop(key, None)
+        if session is not None:
+            session.close()
+        session = BashSession(user_workspace_root(user_id))
+        with self._lock:
+            current = self._sessions.setdefault(key, session)
+            if current is session:
+                self.spawns += 1
+        if current is not session:
+            session.close()
+        return current
+
+    def run(self, user_id: int, chat_id: int, cwd_rel: str, command: str) -> tuple[str, str]:
+        return self._lease(user_id, chat_id).run(cwd_rel, command)
+
+    def close(self, user_id: int, chat_id: int) -> None:
+        with self._lock:
+            session = self._sessions.pop((user_id, chat_id), None)
+        if session is not None:
+            session.close()
+
+    def evict_idle(self, ttl_seconds: float) -> None:
+        cutoff = time.monotonic() - ttl_seconds
+        with self._lock:
+            stale = [
+                key
+                for key, session in self._sessions.items()
+                if session.last_active < cutoff and not session.busy
+            ]
+            sessions = [self._sessions.pop(key) for key in stale]
+        for session in sessions:
+            session.close()
+
+    def close_all(self) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+bash_sessions = BashSessions()
 
 
 class _SandboxNamespace:
@@ -477,47 +697,178 @@ class _SandboxNamespace:
             self[key] = value
 
 
+def _link_or_copy(src, dst) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _target_file(state_dir: Path) -> Path:
+    return state_dir.with_name(state_dir.name + WORKER_TARGET_SUFFIX)
+
+
+def _return_snapshot(state_dir: Path, snapshot_fp: Path) -> None:
+    """Move a worker's copy of a chat's snapshot back to snapshot_fp."""
+    remove_snapshot(snapshot_fp)
+    snapshot_fp.parent.mkdir(parents=True, exist_ok=True)
+    for dst in (snapshot_fp, snapshot_vars_dir(snapshot_fp)):
+        src = state_dir / dst.name
+        if src.exists():
+            shutil.move(src, dst)
+
+
+def _worker_dir_owner_alive(path: Path) -> bool:
+    _, _, rest = path.name.partition("-")
+    pid, _, _ = rest.partition("-")
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _sweep_worker_dirs(root: Path, *, recover: bool = False) -> None:
+    """Remove the worker-* dirs under root whose owning process has exited.
+
+    With recover, a state dir whose chat snapshot is missing (the process died
+    while moving it back) is moved back first.
+    """
+    try:
+        paths = [p for p in root.iterdir() if p.name.startswith("worker-") and p.is_dir()]
+    except OSError:
+        return
+    for path in paths:
+        if _worker_dir_owner_alive(path):
+            continue
+        target = _target_file(path)
+        if recover and target.exists():
+            snapshot_fp = Path(target.read_text())
+            if not snapshot_fp.exists() and (path / snapshot_fp.name).exists():
+                try:
+                    _return_snapshot(path, snapshot_fp)
+                except OSError:
+                    logger.exception("Could not recover the shell snapshot in %s", path)
+                    continue
+                logger.warning("Recovered a shell snapshot left in %s", path)
+        elif recover and any(path.glob("*.pkl")):
+            # A snapshot with no record of its chat: keep it for a person to place.
+            logger.warning("Keeping unclaimed shell snapshot in %s", path)
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        target.unlink(missing_ok=True)
+
+
 class SandboxShellProxy:
     is_sandbox_proxy = True
 
-    def __init__(self, *, user_id: int, chat_id: int, snapshot_fp: Path):
+    def __init__(
+        self,
+        *,
+        user_id: int,
+        chat_id: int | None = None,
+        snapshot_fp: Path | None = None,
+        state_root: Path | None = None,
+    ):
+        """Spawn a worker for user_id; attach it to chat_id now or later via attach().
+
+        The worker only sees its own state and exchange dirs: a fresh dir under
+        state_root (default: snapshot_fp's dir) bound at /varro_state, into
+        which attach() links the chat's snapshot, and a fresh dir under the
+        user's exchange root bound at /varro_exchange. close() moves the
+        snapshot back and removes both dirs. Dirs left behind by a process
+        that died without closing its shells are removed here.
+        """
         self.user_id = user_id
-        self.chat_id = chat_id
+        self.chat_id: int | None = None
+        self.snapshot_fp: Path | None = None
         self.user_root = user_workspace_root(user_id).resolve()
-        self.snapshot_fp = snapshot_fp
-        self._exchange_root = self.user_root / EXCHANGE_ROOT_NAME
-        self._exchange_root.mkdir(parents=True, exist_ok=True)
-        self._exchange_dir = self._exchange_root / str(chat_id)
-        if self._exchange_dir.exists():
-            if self._exchange_dir.is_dir():
-                shutil.rmtree(self._exchange_dir, ignore_errors=True)
-            else:
-                self._exchange_dir.unlink(missing_ok=True)
-        self._exchange_dir.mkdir(parents=True, exist_ok=True)
-        self._exchange_dir_guest = self._host_path_to_worker(self._exchange_dir)
+        # The owning pid in the name tells a later sweep whether the dir is live.
+        worker_dir = f"worker-{os.getpid()}-{uuid4().hex[:12]}"
+        state_root = state_root if state_root is not None else snapshot_fp.parent
+        self.state_dir = state_root / WORKER_STATE_DIR_NAME / worker_dir
+        self._exchange_dir = self._exchange_location() / worker_dir
+        _sweep_worker_dirs(self.state_dir.parent, recover=True)
+        _sweep_worker_dirs(self._exchange_dir.parent)
+        self._exchange_dir_guest = EXCHANGE_GUEST_DIR
+        # Host copies of namespace objects and rendered show output, by name.
+        # A cell that only rebinds names invalidates just those names.
         self._cache: dict[str, object] = {}
-        self._io_lock = threading.Lock()
+        self._render_cache: dict[str, object] = {}
+        self._send_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending: dict[int, Future] = {}
+        self._request_ids = itertools.count(1)
+        self._stream_closed = False
         self._stderr_lines: deque[str] = deque(maxlen=40)
         self.user_ns = _SandboxNamespace(self)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._exchange_dir.mkdir(parents=True, exist_ok=True)
         self._proc = self._spawn_worker()
         self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
         self._stderr_thread.start()
+        self._reader_thread = threading.Thread(target=self._read_responses, daemon=True)
+        self._reader_thread.start()
         self._request({"op": "ping"})
+        if chat_id is not None:
+            self.attach(chat_id=chat_id, snapshot_fp=snapshot_fp)
+
+    def _exchange_location(self) -> Path:
+        """Per-user exchange root: tmpfs if available, else the workspace."""
+        shm_root = EXCHANGE_SHM_ROOT
+        try:
+            shm_root.mkdir(mode=0o700, parents=True, exist_ok=True)
+        except OSError:
+            pass
+        if shm_root.is_dir() and os.access(shm_root, os.W_OK):
+            return shm_root / str(self.user_id)
+        return self.user_root / EXCHANGE_ROOT_NAME
+
+    def attach(self, *, chat_id: int, snapshot_fp: Path) -> None:
+        """Bind a warm worker to a chat: link its snapshot in, then load it.
+
+        The chat's own snapshot files stay where they are until close() puts
+        the worker's back, so a process that dies with the shell leased does
+        not take the chat's namespace with it. Snapshots never rewrite a file
+        in place, which makes hard links safe to share.
+        """
+        _target_file(self.state_dir).write_text(str(snapshot_fp))
+        if snapshot_fp.exists():
+            _link_or_copy(snapshot_fp, self.state_dir / snapshot_fp.name)
+        vars_dir = snapshot_vars_dir(snapshot_fp)
+        if vars_dir.is_dir():
+            shutil.copytree(
+                vars_dir, self.state_dir / vars_dir.name, copy_function=_link_or_copy
+            )
+        self.chat_id = chat_id
+        self.snapshot_fp = snapshot_fp
+        self._request(
+            {
+                "op": "attach",
+                "snapshot_path": f"/varro_state/{snapshot_fp.name}",
+                "exchange_dir": self._exchange_dir_guest,
+            }
+        )
+
+    def _return_snapshot(self) -> None:
+        if self.snapshot_fp is not None:
+            _return_snapshot(self.state_dir, self.snapshot_fp)
 
     def _spawn_worker(self) -> subprocess.Popen:
-        snapshot_dir = self.snapshot_fp.parent
-        snapshot_dir.mkdir(parents=True, exist_ok=True)
         args = _build_bwrap_worker_args(
             self.user_root,
-            snapshot_dir,
-            self._exchange_dir_guest,
+            self.state_dir,
+            self._exchange_dir,
         )
         return subprocess.Popen(
             args,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True,
             env=_worker_env(),
             preexec_fn=_apply_limits(WORKER_LIMITS),
         )
@@ -526,49 +877,120 @@ class SandboxShellProxy:
         if self._proc.stderr is None:
             return
         for line in self._proc.stderr:
-            self._stderr_lines.append(line.rstrip("\n"))
+            self._stderr_lines.append(line.decode("utf-8", "replace").rstrip("\n"))
 
     def _stderr_tail(self) -> str:
         if not self._stderr_lines:
             return ""
         return "\n".join(self._stderr_lines)
 
-    def _request(self, payload: dict) -> dict:
-        with self._io_lock:
+    def _stream_error(self, message: str) -> RuntimeError:
+        detail = self._stderr_tail()
+        suffix = f"\n{detail}" if detail else ""
+        return RuntimeError(f"{message}{suffix}")
+
+    def _read_responses(self) -> None:
+        """Resolve pending requests by id as responses arrive from the worker."""
+        if self._proc.stdout is None:
+            return
+        error: Exception | None = None
+        try:
+            while (message := recv_message(self._proc.stdout)) is not None:
+                with self._pending_lock:
+                    future = self._pending.pop(message.get("id"), None)
+                if future is not None:
+                    future.set_result(message)
+        except Exception as exc:
+            logger.exception("Reading sandbox worker responses failed (user %s)", self.user_id)
+            error = exc
+        with self._pending_lock:
+            self._stream_closed = True
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if error is None:
+                future.set_exception(self._stream_error("sandbox worker closed response stream"))
+            else:
+                failure = self._stream_error(f"sandbox worker response stream failed: {error!r}")
+                failure.__cause__ = error
+                future.set_exception(failure)
+
+    def _submit(self, payloads: list[dict]) -> list[Future]:
+        """Write payloads as one pipelined batch; responses resolve the returned futures."""
+        with self._send_lock:
             if self._proc.poll() is not None:
-                detail = self._stderr_tail()
-                suffix = f"\n{detail}" if detail else ""
-                raise RuntimeError(f"sandbox worker exited before request{suffix}")
+                raise self._stream_error("sandbox worker exited before request")
             if self._proc.stdin is None or self._proc.stdout is None:
                 raise RuntimeError("sandbox worker I/O is unavailable")
-            self._proc.stdin.write(json.dumps(payload, ensure_ascii=False) + "\n")
-            self._proc.stdin.flush()
-            line = self._proc.stdout.readline()
-            if not line:
-                detail = self._stderr_tail()
-                suffix = f"\n{detail}" if detail else ""
-                raise RuntimeError(f"sandbox worker closed response stream{suffix}")
-        response = json.loads(line)
+            batch = []
+            with self._pending_lock:
+                if self._stream_closed:
+                    raise self._stream_error("sandbox worker closed response stream")
+                for payload in payloads:
+                    request_id = next(self._request_ids)
+                    future: Future = Future()
+                    self._pending[request_id] = future
+                    batch.append((request_id, payload, future))
+            try:
+                for request_id, payload, _ in batch:
+                    send_message(self._proc.stdin, {**payload, "id": request_id})
+                self._proc.stdin.flush()
+            except OSError as exc:
+                with self._pending_lock:
+                    for request_id, _, _ in batch:
+                        self._pending.pop(request_id, None)
+                raise self._stream_error(f"sandbox worker request failed: {exc}") from exc
+        return [future for _, _, future in batch]
+
+    @staticmethod
+    def _checked(response: dict) -> dict:
         if not response.get("ok", False):
             raise RuntimeError(response.get("error", "sandbox worker error"))
         return response
 
-    def _host_path_to_worker(self, host_path: Path) -> str:
-        host_resolved = host_path.resolve()
-        rel = host_resolved.relative_to(self.user_root)
-        return "/" if rel.as_posix() == "." else f"/{rel.as_posix()}"
+    def _request(self, payload: dict) -> dict:
+        return self._checked(self._submit([payload])[0].result())
+
+    async def _request_many(self, payloads: list[dict]) -> list[dict]:
+        """Pipeline payloads in one round trip; responses are returned unchecked."""
+        futures = self._submit(payloads)
+        return list(await asyncio.gather(*(asyncio.wrap_future(f) for f in futures)))
+
+    def _exchange_path_to_worker(self, host_path: Path) -> str:
+        return f"{self._exchange_dir_guest}/{host_path.name}"
 
     def _worker_path_to_host(self, worker_path: str) -> Path:
         path = PurePosixPath(worker_path)
-        if not path.is_absolute():
-            raise RuntimeError("worker returned non-absolute path")
-        host = (self.user_root / str(path).lstrip("/")).resolve()
-        host.relative_to(self.user_root)
-        return host
+        if str(path.parent) != self._exchange_dir_guest or path.name in ("", ".", ".."):
+            raise RuntimeError("worker returned a path outside the exchange dir")
+        return self._exchange_dir / path.name
+
+    def _take_exchange_file(self, worker_path: str, read):
+        """Read a file the worker left in the exchange dir and remove it."""
+        fp = self._worker_path_to_host(worker_path)
+        try:
+            return read(fp)
+        finally:
+            fp.unlink(missing_ok=True)
+
+    def _invalidate(self, names: list[str] | None = None) -> None:
+        """Drop cached copies of names, or of everything when names is None."""
+        if names is None:
+            self._cache.clear()
+            self._render_cache.clear()
+            return
+        for name in names:
+            self._cache.pop(name, None)
+            self._render_cache.pop(name, None)
 
     def run_cell(self, cell: str, timeout: int | None = None):
-        self._cache.clear()
-        response = self._request({"op": "run_cell", "code": cell, "timeout": timeout})
+        try:
+            response = self._request({"op": "run_cell", "code": cell, "timeout": timeout})
+        except Exception:
+            self._invalidate()
+            raise
+        # An in-place mutation can reach objects bound to other names (through
+        # containers or methods), so it drops every host copy.
+        self._invalidate(None if response.get("mutated", True) else response.get("changed"))
         error_before_exec = (
             RuntimeError(response["error_before_exec"])
             if response.get("error_before_exec")
@@ -585,21 +1007,24 @@ class SandboxShellProxy:
         )
 
     def reset(self, new_session: bool = False) -> None:
-        self._cache.clear()
+        self._invalidate()
         self._request({"op": "reset", "new_session": bool(new_session)})
 
     def set_user_ns_item(self, name: str, value) -> None:
-        self._cache.pop(name, None)
+        self._invalidate([name])
         if isinstance(value, pd.DataFrame):
-            fp = self._exchange_dir / f"df_{name}_{uuid4().hex}.parquet"
-            value.to_parquet(fp, index=True)
-            self._request(
-                {
-                    "op": "set_dataframe",
-                    "name": name,
-                    "path": self._host_path_to_worker(fp),
-                }
-            )
+            fp = self._exchange_dir / f"df_{uuid4().hex}.arrow"
+            try:
+                write_frame(value, fp)
+                self._request(
+                    {
+                        "op": "set_dataframe",
+                        "name": name,
+                        "path": self._exchange_path_to_worker(fp),
+                    }
+                )
+            finally:
+                fp.unlink(missing_ok=True)
             self._cache[name] = value
             return
         if isinstance(value, (str, int, float, bool)) or value is None:
@@ -616,37 +1041,75 @@ class SandboxShellProxy:
         if kind == "missing":
             return _MISSING
         if kind == "dataframe":
-            obj = pd.read_parquet(self._worker_path_to_host(response["path"]))
+            obj = self._take_exchange_file(response["path"], self._read_shared_frame)
         elif kind == "styler_df":
-            df = pd.read_parquet(self._worker_path_to_host(response["path"]))
+            df = self._take_exchange_file(response["path"], self._read_shared_frame)
             obj = df.style
         elif kind == "plotly":
-            obj = go.Figure(json.loads(response["json"]))
+            obj = go.Figure(json.loads(self._blob_bytes(response)))
         else:
             return _MISSING
         self._cache[name] = obj
         return obj
 
-    async def render_show(self, name: str):
-        response = self._request({"op": "render_show", "name": name})
+    @staticmethod
+    def _read_shared_frame(fp: Path) -> pd.DataFrame:
+        # Host-side frames are only rendered, so they can stay views on the mapping.
+        return read_frame(fp, writable=False)
+
+    def _blob_bytes(self, response: dict) -> bytes:
+        if "data" in response:
+            return response["data"]
+        return self._take_exchange_file(response["path"], Path.read_bytes)
+
+    async def _rendered(self, name: str, response: dict):
+        if not response.get("ok", False):
+            raise ValueError(response.get("error", "Invalid output type"))
         kind = response.get("kind")
         if kind == "text":
             return response.get("text", "")
         if kind == "plotly":
-            fig = go.Figure(json.loads(response["json"]))
+            fig = go.Figure(json.loads(self._blob_bytes(response)))
+            # The turn's render cache wants the figure itself later on.
+            self._cache[name] = fig
             return await show_element(fig)
         if kind == "png":
-            fp = self._worker_path_to_host(response["path"])
-            return BinaryContent(data=fp.read_bytes(), media_type="image/png")
+            return BinaryContent(data=self._blob_bytes(response), media_type="image/png")
         raise ValueError(response.get("error", "Invalid output type"))
 
+    async def render_show_many(self, names: list[str]) -> list:
+        """Render several show names with one pipelined round trip to the worker.
+
+        Names rendered before and not changed by a cell since are served from
+        the render cache without asking the worker.
+        """
+        missing = [n for n in dict.fromkeys(names) if n not in self._render_cache]
+        if missing:
+            responses = await self._request_many(
+                [{"op": "render_show", "name": n} for n in missing]
+            )
+            rendered = await asyncio.gather(
+                *(self._rendered(n, r) for n, r in zip(missing, responses))
+            )
+            self._render_cache.update(zip(missing, rendered))
+        return [self._render_cache[n] for n in names]
+
+    async def render_show(self, name: str):
+        return (await self.render_show_many([name]))[0]
+
+    def rss_bytes(self) -> int:
+        """Resident memory of the worker process tree (bwrap and the kernel)."""
+        if self._proc.poll() is not None:
+            return 0
+        return process_tree_rss(self._proc.pid)
+
     def close(self, *, save_snapshot: bool) -> None:
         try:
             self._request({"op": "shutdown", "save_snapshot": bool(save_snapshot)})
         except Exception:
             pass
         finally:
-            self._cache.clear()
+            self._invalidate()
             if self._proc.poll() is None:
                 self._proc.terminate()
                 try:
@@ -654,45 +1117,98 @@ class SandboxShellProxy:
                 except subprocess.TimeoutExpired:
                     self._proc.kill()
                     self._proc.wait(timeout=2)
+            # Only this worker's dirs: the user's exchange root is shared with
+            # their other shells and spares.
             shutil.rmtree(self._exchange_dir, ignore_errors=True)
             try:
-                self._exchange_root.rmdir()
+                self._return_snapshot()
             except OSError:
-                pass
+                # Leave the state dir in place rather than lose the snapshot.
+                logger.exception("Could not move the shell snapshot back to %s", self.snapshot_fp)
+            else:
+                shutil.rmtree(self.state_dir, ignore_errors=True)
+                _target_file(self.state_dir).unlink(missing_ok=True)
+
+
+def _proc_children(pid: int) -> list[int]:
+    children = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return children
+    for tid in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                children += [int(child) for child in f.read().split()]
+        except OSError:
+            continue
+    return children
+
+
+def process_tree_rss(pid: int) -> int:
+    """RSS in bytes of pid and all of its descendants, read from /proc (0 if gone)."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * _PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            continue
+        pending += _proc_children(current)
+    return total
+
+
+def shell_rss_bytes(shell) -> int | None:
+    """Resident memory of a shell's worker, or None for in-process shells."""
+    if isinstance(shell, SandboxShellProxy):
+        return shell.rss_bytes()
+    return None
 
 
 def _save_snapshot(shell, snapshot_fp: Path) -> None:
-    snapshot_fp.parent.mkdir(parents=True, exist_ok=True)
     try:
-        with snapshot_fp.open("wb") as f:
-            dill.dump(getattr(shell, "user_ns", {}), f)
+        save_snapshot(shell.user_ns, snapshot_fp, getattr(shell, "user_ns_hidden", ()))
     except Exception:
-        snapshot_fp.unlink(missing_ok=True)
+        remove_snapshot(snapshot_fp)
 
 
 def _load_snapshot(shell, snapshot_fp: Path) -> None:
-    if not snapshot_fp.exists():
-        return
-    with snapshot_fp.open("rb") as f:
-        value = dill.load(f)
-    if isinstance(value, dict):
-        shell.user_ns.update(value)
+    load_snapshot(shell.user_ns, snapshot_fp)
 
 
-def create_shell(*, user_id: int, chat_id: int, snapshot_fp: Path):
+def spawn_shell(*, user_id: int, state_root: Path):
+    """Start a shell with the initial imports done but no chat attached yet.
+
+    A sandboxed shell keeps its snapshot files in a private dir under
+    state_root, which must be on the same filesystem as the chats' snapshots.
+    """
     if _use_bwrap():
-        return SandboxShellProxy(user_id=user_id, chat_id=chat_id, snapshot_fp=snapshot_fp)
+        return SandboxShellProxy(user_id=user_id, state_root=state_root)
     shell = get_shell()
     shell.run_cell(JUPYTER_INITIAL_IMPORTS)
+    return shell
+
+
+def attach_shell(shell, *, chat_id: int, snapshot_fp: Path) -> None:
+    if isinstance(shell, SandboxShellProxy):
+        shell.attach(chat_id=chat_id, snapshot_fp=snapshot_fp)
+        return
     _load_snapshot(shell, snapshot_fp)
+
+
+def create_shell(*, user_id: int, chat_id: int, snapshot_fp: Path):
+    shell = spawn_shell(user_id=user_id, state_root=snapshot_fp.parent)
+    attach_shell(shell, chat_id=chat_id, snapshot_fp=snapshot_fp)
     return shell
 
 
-def close_shell(shell, *, save_snapshot: bool, snapshot_fp: Path) -> None:
+def close_shell(shell, *, save_snapshot: bool, snapshot_fp: Path | None = None) -> None:
     if isinstance(shell, SandboxShellProxy):
         shell.close(save_snapshot=save_snapshot)
         return
-    if save_snapshot:
+    if save_snapshot and snapshot_fp is not None:
         _save_snapshot(shell, snapshot_fp)
     try:
         shell.reset(new_session=False)
@@ -0,0 +1,277 @@
+"""Incremental namespace snapshots for sandbox shells.
+
+A snapshot is a JSON manifest (at the chat's ``shell.pkl`` path) plus one file
+per variable in a sibling ``shell.vars/`` dir: DataFrames as zstd-compressed
+Arrow IPC, everything else as a dill blob. NamespaceTracker records which
+names each cell created, rebound or mutated, so a save only rewrites those
+variables, and a restore leaves DataFrames on disk until a cell (or the host)
+first refers to them.
+
+Snapshots written before this format (a dill-pickled dict of the whole
+namespace) are still loaded, eagerly.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import shutil
+import types
+from pathlib import Path
+from uuid import uuid4
+
+import dill
+import numpy as np
+import pandas as pd
+
+from varro.agent.exchange import read_frame, write_frame
+
+SNAPSHOT_FORMAT = 1
+NAME_RE = re.compile(r"[A-Za-z_]\w*")
+# IPython's output/input history aliases (_, __, _i, _ii, _3, _i3, ...).
+HISTORY_NAME_RE = re.compile(r"_+|_i+|_i?\d+")
+# Values a cell can only change by rebinding the name.
+IMMUTABLE_TYPES = (
+    int,
+    float,
+    complex,
+    str,
+    bytes,
+    bool,
+    type(None),
+    np.generic,
+    types.ModuleType,
+    types.FunctionType,
+    type,
+)
+
+
+def snapshot_vars_dir(snapshot_path: Path) -> Path:
+    return snapshot_path.with_suffix(".vars")
+
+
+def remove_snapshot(snapshot_path: Path) -> None:
+    snapshot_path.unlink(missing_ok=True)
+    shutil.rmtree(snapshot_vars_dir(snapshot_path), ignore_errors=True)
+
+
+def is_internal_name(name: str, hidden=()) -> bool:
+    return name.startswith("__") or name in hidden or HISTORY_NAME_RE.fullmatch(name) is not None
+
+
+def frame_fingerprint(df: pd.DataFrame) -> tuple | None:
+    """Content fingerprint of a DataFrame, or None if it cannot be hashed."""
+    try:
+        values = int(pd.util.hash_pandas_object(df, index=True).sum())
+    except TypeError:
+        return None
+    return (df.shape, tuple(map(str, df.columns)), tuple(map(str, df.dtypes)), values)
+
+
+def _code_names(code: types.CodeType) -> set[str]:
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def referenced_names(code: str, user_ns: dict) -> set[str]:
+    """Identifiers in a cell, plus the globals used by functions it calls."""
+    names = set(NAME_RE.findall(code))
+    pending = list(names)
+    while pending:
+        value = user_ns.get(pending.pop())
+        if isinstance(value, types.FunctionType):
+            for name in _code_names(value.__code__) - names:
+                names.add(name)
+                pending.append(name)
+    return names
+
+
+class NamespaceTracker:
+    """Detects which namespace names a cell created, rebound, mutated or deleted.
+
+    Rebinding is caught by object identity for every name. In-place mutation
+    is only considered for names the cell refers to: DataFrames are compared
+    by content fingerprint, other mutable objects are assumed changed. Other
+    names bound to a changed object are reported too. Objects reachable from
+    a mutated one (container items, attributes) are not tracked, so
+    ``mutated`` records whether the last cell changed anything in place.
+    """
+
+    def __init__(self, user_ns: dict, hidden=()):
+        self.user_ns = user_ns
+        self.hidden = hidden
+        self._ids: dict[str, int] = {}
+        self._fingerprints: dict[str, tuple | None] = {}
+        self.mutated = False
+        self.before_cell()
+
+    def _visible(self) -> dict[str, object]:
+        return {
+            name: value
+            for name, value in self.user_ns.items()
+            if not is_internal_name(name, self.hidden)
+        }
+
+    def before_cell(self, code: str = "") -> None:
+        visible = self._visible()
+        self._ids = {name: id(value) for name, value in visible.items()}
+        # Frames the cell may mutate need a baseline to compare against.
+        for name in referenced_names(code, self.user_ns):
+            value = visible.get(name)
+            if isinstance(value, pd.DataFrame) and name not in self._fingerprints:
+                self._fingerprints[name] = frame_fingerprint(value)
+
+    def after_cell(self, code: str) -> set[str]:
+        visible = self._visible()
+        changed = set(self._ids) - set(visible)
+        referenced = referenced_names(code, self.user_ns)
+        mutated = set()
+        for name, value in visible.items():
+            if self._ids.get(name) != id(value):
+                changed.add(name)
+                if isinstance(value, pd.DataFrame):
+                    self._fingerprints[name] = frame_fingerprint(value)
+            elif name in referenced and not isinstance(value, IMMUTABLE_TYPES):
+                if isinstance(value, pd.DataFrame):
+                    fingerprint = frame_fingerprint(value)
+                    if fingerprint is None or fingerprint != self._fingerprints.get(name):
+                        mutated.add(name)
+                    self._fingerprints[name] = fingerprint
+                else:
+                    mutated.add(name)
+        self.mutated = bool(mutated)
+        changed |= mutated
+        # A mutated object changes every name bound to it, referenced or not.
+        changed_ids = {
+            id(visible[name])
+            for name in changed
+            if name in visible and not isinstance(visible[name], IMMUTABLE_TYPES)
+        }
+        changed |= {name for name, value in visible.items() if id(value) in changed_ids}
+        for name in set(self._fingerprints) - set(visible):
+            del self._fingerprints[name]
+        self._ids = {name: id(value) for name, value in visible.items()}
+        return changed
+
+    def forget(self, names) -> None:
+        """Treat names as unseen, e.g. after the host set or restored them."""
+        for name in names:
+            self._ids.pop(name, None)
+            self._fingerprints.pop(name, None)
+
+
+class SnapshotStore:
+    """The on-disk snapshot of one chat's namespace, synced incrementally."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.vars_dir = snapshot_vars_dir(path)
+        # name -> {"kind": "frame" | "dill", "file": ...}, as last written.
+        self.entries: dict[str, dict] = {}
+        # Entries whose file is not loaded into the namespace yet.
+        self.pending: set[str] = set()
+        # Loaded names whose in-memory value may differ from their file.
+        self.dirty: set[str] = set()
+
+    def load(self, user_ns: dict) -> None:
+        """Restore dill values now; leave DataFrames pending until first use."""
+        if not self.path.exists():
+            return
+        raw = self.path.read_bytes()
+        if not raw.lstrip().startswith(b"{"):
+            legacy = dill.loads(raw)
+            if isinstance(legacy, dict):
+                user_ns.update(legacy)
+                self.dirty |= set(legacy)
+            return
+        manifest = json.loads(raw)
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            return
+        self.entries = manifest["vars"]
+        for name, entry in self.entries.items():
+            if entry["kind"] == "frame":
+                self.pending.add(name)
+            else:
+                user_ns[name] = dill.loads((self.vars_dir / entry["file"]).read_bytes())
+
+    def ensure_loaded(self, user_ns: dict, names) -> list[str]:
+        """Load the pending variables among names; returns the ones loaded."""
+        loaded = []
+        for name in sorted(self.pending & set(names)):
+            self.pending.discard(name)
+            if name in user_ns:
+                # A cell rebound it before ever reading the stored value.
+                continue
+            user_ns[name] = read_frame(self.vars_dir / self.entries[name]["file"])
+            loaded.append(name)
+        return loaded
+
+    def mark_changed(self, names) -> None:
+        names = set(names)
+        self.dirty |= names
+        self.pending -= names
+
+    def clear(self) -> None:
+        """The namespace was reset: nothing stored survives the next save."""
+        self.dirty |= set(self.entries)
+        self.pending.clear()
+
+    def save(self, user_ns: dict, hidden=()) -> None:
+        """Write changed variables, then swap in the new manifest atomically."""
+        self.vars_dir.mkdir(parents=True, exist_ok=True)
+        entries = {}
+        for name, entry in self.entries.items():
+            if name in self.pending or (name not in self.dirty and name in user_ns):
+                entries[name] = entry
+        for name in self.dirty:
+            if name not in user_ns or is_internal_name(name, hidden):
+                continue
+            entry = self._write(name, user_ns[name])
+            if entry is not None:
+                entries[name] = entry
+
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"format": SNAPSHOT_FORMAT, "vars": entries}))
+        tmp_path.replace(self.path)
+        keep = {entry["file"] for entry in entries.values()}
+        for fp in self.vars_dir.iterdir():
+            if fp.name not in keep:
+                fp.unlink(missing_ok=True)
+        self.entries = entries
+        self.dirty.clear()
+
+    def _write(self, name: str, value) -> dict | None:
+        stem = uuid4().hex
+        if type(value) is pd.DataFrame:
+            fp = self.vars_dir / f"{stem}.arrow"
+            try:
+                write_frame(value, fp, compression="zstd")
+                return {"kind": "frame", "file": fp.name}
+            except Exception:
+                # Mixed-type object columns and the like; fall back to dill.
+                fp.unlink(missing_ok=True)
+        try:
+            data = dill.dumps(value)
+        except Exception:
+            return None
+        fp = self.vars_dir / f"{stem}.dill"
+        fp.write_bytes(data)
+        return {"kind": "dill", "file": fp.name}
+
+
+def save_snapshot(user_ns: dict, snapshot_path: Path, hidden=()) -> None:
+    """Write a full snapshot of user_ns (for shells without a tracker)."""
+    snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+    store = SnapshotStore(snapshot_path)
+    store.dirty = {name for name in user_ns if not is_internal_name(name, hidden)}
+    store.save(user_ns, hidden)
+
+
+def load_snapshot(user_ns: dict, snapshot_path: Path) -> None:
+    """Restore a snapshot eagerly, DataFrames included."""
+    store = SnapshotStore(snapshot_path)
+    store.load(user_ns)
+    store.ensure_loaded(user_ns, set(store.pending))
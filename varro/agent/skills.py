@@ -2,6 +2,21 @@ import frontmatter
 from varro.agent.workspace import user_workspace_root
 
 
+def skills_signature(user_id: int) -> tuple[tuple[str, int, int], ...]:
+    """Path, mtime and size of every SKILL.md; changes whenever the skills prompt would."""
+    skills_dir = user_workspace_root(user_id) / "skills"
+    if not skills_dir.exists():
+        return ()
+    signature = []
+    for skill_file in skills_dir.rglob("SKILL.md"):
+        try:
+            stat = skill_file.stat()
+        except OSError:
+            continue
+        signature.append((skill_file.relative_to(skills_dir).as_posix(), stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(signature))
+
+
 def build_available_skills_prompt(user_id: int) -> str:
     skills_dir = user_workspace_root(user_id) / "skills"
     if not skills_dir.exists():
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from dataclasses import dataclass
 from datetime import date
 import json
@@ -21,6 +22,7 @@ from varro.dashboard.executor import clear_query_cache, execute_output
 from varro.dashboard.loader import Dashboard, load_dashboard
 from varro.dashboard.models import Metric
 from varro.dashboard.snapshot_auth import make_snapshot_token
+from varro.db.admission import Priority, query_class
 from varro.db.db import dst_read_engine as default_engine
 
 DEFAULT_APP_BASE_URL = "http://127.0.0.1:5001"
@@ -167,17 +169,23 @@ async def snapshot_dashboard_url(
         _internal_snapshot_path(user_id, target_url),
         app_base_url=app_base_url,
     )
-    save_png(snapshot_dir / "dashboard.png", dashboard_png, max_pixels=max_pixels)
+    await asyncio.to_thread(
+        save_png, snapshot_dir / "dashboard.png", dashboard_png, max_pixels=max_pixels
+    )
 
     (snapshot_dir / f"{date.today().isoformat()}.date").touch()
 
     clear_query_cache()
     metrics: dict[str, Any] = {}
     for output_name in sorted(dash.outputs):
-        result = execute_output(dash, output_name, filters, db_engine)
+        with query_class(Priority.BACKGROUND, user_id):
+            result = await asyncio.to_thread(
+                execute_output, dash, output_name, filters, db_engine
+            )
         if isinstance(result, go.Figure):
             figure_png = await plotly_figure_to_png(result, max_pixels=max_pixels)
-            save_png(
+            await asyncio.to_thread(
+                save_png,
                 snapshot_dir / "figures" / f"{output_name}.png",
                 figure_png,
                 max_pixels=max_pixels,
@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable
+
+import asyncpg
+import pandas as pd
+
+from varro.config import settings
+from varro.db import pg_arrow
+from varro.db.admission import AGENT_POOL_SIZE, admitted_async
+from varro.db.db import POSTGRES_DST_READ
+from varro.db.file_cache import CACHE_ERRORS
+from varro.db.result_cache import result_cache
+
+logger = logging.getLogger(__name__)
+
+SQL_STATEMENT_TIMEOUT_S = float(settings.get("SQL_STATEMENT_TIMEOUT_S", "60"))
+SQL_MAX_ROWS = int(settings.get("SQL_MAX_ROWS", "2000000"))
+SQL_MAX_BYTES = int(settings.get("SQL_MAX_BYTES", str(512 * 1024 * 1024)))
+SQL_POOL_MAX_SIZE = AGENT_POOL_SIZE
+SQL_EXPLAIN_TIMEOUT_S = 10.0
+SQL_PREVIEW_ROWS = 30
+SQL_COUNT_STEP = 1_000_000
+
+
+class QueryTimeoutError(Exception):
+    pass
+
+
+@dataclass
+class QueryResult:
+    df: pd.DataFrame
+    elapsed_s: float
+    rows_fetched: int
+    bytes_fetched: int
+    truncated: bool = False
+    row_count: int | None = None
+    cached: bool = False
+    note: str | None = None
+
+    def summary(self) -> str:
+        elapsed = f"elapsed: {self.elapsed_s:.2f}s" + (" (cached)" if self.cached else "")
+        parts = [elapsed, f"rows_fetched: {self.rows_fetched}"]
+        if self.truncated:
+            parts.append(
+                "Warning: result truncated at the row/byte cap. Add filters or aggregate in SQL."
+            )
+        if self.note:
+            parts.append(self.note)
+        return "\n".join(parts)
+
+
+_pool_task: asyncio.Task | None = None
+_pool_loop: asyncio.AbstractEventLoop | None = None
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    # Match pd.read_sql(coerce_float=True): numeric columns arrive as floats.
+    await conn.set_type_codec(
+        "numeric", encoder=str, decoder=float, schema="pg_catalog", format="text"
+    )
+
+
+async def _create_pool() -> asyncpg.Pool:
+    return await asyncpg.create_pool(
+        POSTGRES_DST_READ,
+        min_size=0,
+        max_size=SQL_POOL_MAX_SIZE,
+        init=_init_connection,
+    )
+
+
+async def get_pool() -> asyncpg.Pool:
+    """Return the asyncpg pool for the read-only DST database on this event loop."""
+    global _pool_task, _pool_loop
+    loop = asyncio.get_running_loop()
+    if _pool_task is None or _pool_loop is not loop:
+        _discard_pool(_pool_task)
+        _pool_loop = loop
+        _pool_task = loop.create_task(_create_pool())
+    try:
+        return await asyncio.shield(_pool_task)
+    except Exception:
+        _pool_task = None
+        raise
+
+
+def _discard_pool(task: asyncio.Task | None) -> None:
+    """Close the connections of a pool created on an earlier event loop."""
+    if task is None or not task.done() or task.cancelled() or task.exception():
+        return
+    try:
+        task.result().terminate()
+    except Exception:
+        # Its loop may already be closed; the sockets are released with it.
+        pass
+
+
+class _ByteCapReached(Exception):
+    pass
+
+
+@asynccontextmanager
+async def read_transaction(
+    timeout_s: float, conn: asyncpg.Connection | None = None
+) -> AsyncIterator[asyncpg.Connection]:
+    """Acquire a connection in a read-only transaction with a statement timeout.
+
+    The connection is only acquired once admission control grants a query slot
+    for the current query class. Passing the conn of an enclosing
+    read_transaction reuses its slot and transaction and only changes the
+    statement timeout, so e.g. an EXPLAIN and the query it guards take one slot.
+    """
+    try:
+        if conn is not None:
+            await _set_timeout(conn, timeout_s)
+            yield conn
+            return
+        pool = await get_pool()
+        async with admitted_async(), pool.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                await _set_timeout(conn, timeout_s)
+                yield conn
+    except asyncpg.exceptions.QueryCanceledError as exc:
+        raise QueryTimeoutError(
+            f"Query cancelled after the {timeout_s:g}s statement timeout. "
+            "Add filters (e.g. on tid) or aggregate in SQL."
+        ) from exc
+
+
+async def _set_timeout(conn: asyncpg.Connection, timeout_s: float) -> None:
+    await conn.execute(f"SET LOCAL statement_timeout = {int(timeout_s * 1000)}")
+
+
+def _statement_columns(stmt: asyncpg.prepared_stmt.PreparedStatement) -> list[tuple[str, str]]:
+    return [(attr.name, attr.type.name) for attr in stmt.get_attributes()]
+
+
+async def explain(
+    query: str,
+    *,
+    timeout_s: float = SQL_EXPLAIN_TIMEOUT_S,
+    conn: asyncpg.Connection | None = None,
+) -> list[dict]:
+    """Planner output of EXPLAIN (FORMAT JSON, VERBOSE) for query, without running it."""
+    async with read_transaction(timeout_s, conn) as conn:
+        plan = await conn.fetchval(f"EXPLAIN (FORMAT JSON, VERBOSE)\n{pg_arrow.strip_query(query)}")
+    return json.loads(plan)
+
+
+async def run_query(
+    query: str,
+    *,
+    timeout_s: float = SQL_STATEMENT_TIMEOUT_S,
+    max_rows: int = SQL_MAX_ROWS,
+    max_bytes: int = SQL_MAX_BYTES,
+    conn: asyncpg.Connection | None = None,
+) -> QueryResult:
+    """Run a read-only query with a server-side statement timeout and fetch caps.
+
+    The result is streamed with COPY ... (FORMAT csv) and decoded column-wise
+    into Arrow, so no per-row Python objects are created. The row cap is pushed
+    into the query as a LIMIT and the byte cap stops the COPY stream. Cancelling
+    the calling task (e.g. via RunManager.cancel) cancels the statement on the
+    server as well.
+    """
+    start = time.perf_counter()
+    if not pg_arrow.is_select(query):
+        return await _run_rows(
+            query, timeout_s=timeout_s, max_rows=max_rows, start=start, conn=conn
+        )
+    limited = pg_arrow.limit_sql(query, max_rows + 1)
+    chunks: list[bytes] = []
+    bytes_fetched = 0
+    truncated = False
+
+    async def sink(data: bytes) -> None:
+        nonlocal bytes_fetched
+        chunks.append(data)
+        bytes_fetched += len(data)
+        if bytes_fetched >= max_bytes:
+            raise _ByteCapReached
+
+    async with read_transaction(timeout_s, conn) as conn:
+        columns = _statement_columns(await conn.prepare(limited))
+        try:
+            await conn.copy_from_query(limited, output=sink, format="csv")
+        except _ByteCapReached:
+            truncated = True
+
+    # Decoding a large result takes long enough to stall every other request
+    # sharing this event loop.
+    df, bytes_fetched, truncated = await asyncio.to_thread(
+        _decode_csv, chunks, columns, max_rows, truncated
+    )
+    return QueryResult(
+        df=df,
+        elapsed_s=time.perf_counter() - start,
+        rows_fetched=len(df),
+        bytes_fetched=bytes_fetched,
+        truncated=truncated,
+        row_count=None if truncated else len(df),
+    )
+
+
+def _decode_csv(
+    chunks: list[bytes], columns: list[tuple[str, str]], max_rows: int, truncated: bool
+) -> tuple[pd.DataFrame, int, bool]:
+    """Decode COPY csv chunks into a frame of at most max_rows rows.
+
+    Returns the frame, the number of bytes decoded and whether the result was cut short.
+    """
+    data = b"".join(chunks)
+    if truncated:
+        data = pg_arrow.complete_csv_rows(data)
+    table = pg_arrow.csv_to_table(data, columns)
+    if table.num_rows > max_rows:
+        table = table.slice(0, max_rows)
+        truncated = True
+    return pg_arrow.table_to_frame(table), len(data), truncated
+
+
+async def _run_rows(
+    query: str,
+    *,
+    timeout_s: float,
+    max_rows: int,
+    start: float,
+    conn: asyncpg.Connection | None,
+) -> QueryResult:
+    """Fetch a statement COPY cannot wrap (EXPLAIN, SHOW, ...) as rows."""
+    async with read_transaction(timeout_s, conn) as conn:
+        stmt = await conn.prepare(query)
+        columns = _statement_columns(stmt)
+        records = await (await stmt.cursor()).fetch(max_rows + 1)
+    truncated = len(records) > max_rows
+    df = pg_arrow.table_to_frame(pg_arrow.records_to_table(records[:max_rows], columns))
+    return QueryResult(
+        df=df,
+        elapsed_s=time.perf_counter() - start,
+        rows_fetched=len(df),
+        bytes_fetched=int(df.memory_usage(deep=True).sum()),
+        truncated=truncated,
+        row_count=None if truncated else len(df),
+    )
+
+
+async def run_preview(
+    query: str,
+    *,
+    preview_rows: int = SQL_PREVIEW_ROWS,
+    timeout_s: float = SQL_STATEMENT_TIMEOUT_S,
+    conn: asyncpg.Connection | None = None,
+) -> QueryResult:
+    """Fetch the first preview_rows rows of a query and count the rest server-side.
+
+    The remaining rows are skipped with MOVE FORWARD on the same cursor, so the
+    total row count is known without re-running the query or sending the rows
+    over the wire.
+    """
+    start = time.perf_counter()
+    async with read_transaction(timeout_s, conn) as conn:
+        stmt = await conn.prepare(query)
+        columns = _statement_columns(stmt)
+        cursor = await stmt.cursor()
+        records = await cursor.fetch(preview_rows)
+        row_count = len(records)
+        if row_count == preview_rows:
+            while True:
+                moved = await cursor.forward(SQL_COUNT_STEP)
+                row_count += moved
+                if moved < SQL_COUNT_STEP:
+                    break
+
+    df = pg_arrow.table_to_frame(pg_arrow.records_to_table(records, columns))
+    return QueryResult(
+        df=df,
+        elapsed_s=time.perf_counter() - start,
+        rows_fetched=len(df),
+        bytes_fetched=int(df.memory_usage(deep=True).sum()),
+        row_count=row_count,
+    )
+
+
+async def run_cached(
+    query: str, kind: str, run: Callable[[str], Awaitable[QueryResult]]
+) -> QueryResult:
+    """Serve query from the shared result cache, or run it and store the result.
+
+    kind separates results of the same SQL fetched differently (e.g. preview
+    vs. full). Queries that reference no fact/dim table, or that call now(),
+    random() or a sequence function, are never cached since nothing would
+    invalidate them. A cache that cannot be read or written (disk full, locked
+    or corrupt index) is skipped rather than failing the query.
+    """
+    if not result_cache.enabled:
+        return await run(query)
+    start = time.perf_counter()
+    try:
+        key = await asyncio.to_thread(result_cache.key, query, kind)
+        hit = await asyncio.to_thread(result_cache.get, key) if key is not None else None
+    except CACHE_ERRORS:
+        logger.warning("SQL result cache lookup failed; running the query", exc_info=True)
+        return await run(query)
+    if key is None:
+        return await run(query)
+
+    if hit is not None:
+        df, meta = hit
+        return QueryResult(
+            df=df,
+            elapsed_s=time.perf_counter() - start,
+            rows_fetched=meta["rows_fetched"],
+            bytes_fetched=meta["bytes_fetched"],
+            truncated=meta["truncated"],
+            row_count=meta["row_count"],
+            cached=True,
+            note=meta.get("note"),
+        )
+
+    result = await run(query)
+    meta = {
+        "rows_fetched": result.rows_fetched,
+        "bytes_fetched": result.bytes_fetched,
+        "truncated": result.truncated,
+        "row_count": result.row_count,
+        "note": result.note,
+    }
+    try:
+        await asyncio.to_thread(result_cache.put, key, result.df, meta)
+    except CACHE_ERRORS:
+        logger.warning("Could not store a SQL result in the cache", exc_info=True)
+    return result
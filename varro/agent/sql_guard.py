@@ -0,0 +1,251 @@
+"""Planner-based cost guard for agent SQL.
+
+Before a Sql tool query runs, ``EXPLAIN (FORMAT JSON)`` gives the planner's
+estimate of its total cost and result rows. Queries above the thresholds are
+not sent to the database as written:
+
+- Stored results (df_name) are refused with hints naming the unfiltered fact
+  scans and exploding joins, since a sampled or cut-off dataframe would be
+  silently wrong.
+- Previews are rewritten: first to a plain LIMIT (exact first rows, planner
+  estimate for the row count), and if the LIMIT plan is still too expensive
+  to a TABLESAMPLE of the unfiltered fact tables. Either way the result
+  carries a note telling the agent what was changed.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+
+import asyncpg
+
+from varro.agent.sql import (
+    SQL_PREVIEW_ROWS,
+    SQL_STATEMENT_TIMEOUT_S,
+    QueryResult,
+    explain,
+    read_transaction,
+    run_preview,
+    run_query,
+)
+from varro.config import settings
+from varro.db import pg_arrow
+
+# Planner cost units (sequential page reads ~ 1.0 each); 0 disables the guard.
+SQL_GUARD_MAX_COST = float(settings.get("SQL_GUARD_MAX_COST", "2000000"))
+SQL_GUARD_MAX_ROWS = float(settings.get("SQL_GUARD_MAX_ROWS", "10000000"))
+SQL_SAMPLE_MIN_PERCENT = 0.01
+SQL_SAMPLE_MAX_PERCENT = 50.0
+
+JOIN_NODES = {"Nested Loop", "Hash Join", "Merge Join"}
+SCAN_NODES = {"Seq Scan", "Index Scan", "Index Only Scan", "Bitmap Heap Scan"}
+# Words that can follow a table reference but are not an alias.
+NON_ALIAS_WORDS = (
+    "where|join|inner|left|right|full|cross|natural|on|using|group|order|limit"
+    "|offset|having|window|union|intersect|except|fetch|for|tablesample|lateral"
+)
+FACT_REF_RE = re.compile(
+    r"(?P<lead>\b(?:from|join)\s+)"
+    r'(?P<table>fact\s*\.\s*"?(?P<name>\w+)"?)'
+    rf"(?P<alias>\s+(?:as\s+)?(?!(?:{NON_ALIAS_WORDS})\b)(?P<alias_name>[a-z_]\w*))?",
+    re.IGNORECASE,
+)
+
+
+class QueryTooExpensiveError(Exception):
+    pass
+
+
+@dataclass
+class ScanEstimate:
+    table: str
+    alias: str
+    rows: float
+    filter: str | None
+
+    @property
+    def filters_tid(self) -> bool:
+        return self.filter is not None and re.search(r"\btid\b", self.filter) is not None
+
+
+@dataclass
+class PlanEstimate:
+    cost: float
+    rows: float
+    scans: list[ScanEstimate] = field(default_factory=list)
+    # (join rows, largest input rows) for joins that multiply their inputs.
+    exploding_joins: list[tuple[float, float]] = field(default_factory=list)
+
+    def exceeds(self) -> bool:
+        if SQL_GUARD_MAX_COST <= 0:
+            return False
+        return self.cost > SQL_GUARD_MAX_COST or self.rows > SQL_GUARD_MAX_ROWS
+
+    @property
+    def unfiltered_fact_scans(self) -> list[ScanEstimate]:
+        return [s for s in self.scans if s.table.startswith("fact.") and not s.filters_tid]
+
+
+def parse_plan(plan: list[dict]) -> PlanEstimate:
+    """Summarize EXPLAIN (FORMAT JSON, VERBOSE) output."""
+    root = plan[0]["Plan"]
+    estimate = PlanEstimate(cost=float(root["Total Cost"]), rows=float(root["Plan Rows"]))
+
+    def walk(node: dict, workers: int) -> None:
+        workers = node.get("Workers Planned", workers)
+        rows = float(node.get("Plan Rows", 0)) * (1 + workers if node.get("Parallel Aware") else 1)
+        children = node.get("Plans", [])
+        if node["Node Type"] in SCAN_NODES and node.get("Schema") and node.get("Relation Name"):
+            conditions = [node[k] for k in ("Filter", "Index Cond", "Recheck Cond") if k in node]
+            estimate.scans.append(
+                ScanEstimate(
+                    table=f"{node['Schema']}.{node['Relation Name']}",
+                    alias=node.get("Alias", node["Relation Name"]),
+                    rows=rows,
+                    filter=" AND ".join(conditions) or None,
+                )
+            )
+        if node["Node Type"] in JOIN_NODES and len(children) == 2:
+            largest = max(float(c.get("Plan Rows", 0)) for c in children)
+            if rows > 10 * max(largest, 1):
+                estimate.exploding_joins.append((rows, largest))
+        for child in children:
+            walk(child, workers)
+
+    walk(root, 0)
+    return estimate
+
+
+def _fmt(n: float) -> str:
+    return f"{n:,.0f}"
+
+
+def hints(estimate: PlanEstimate) -> list[str]:
+    out = []
+    for scan in estimate.unfiltered_fact_scans:
+        out.append(
+            f"{scan.table} ({scan.alias}) scans ~{_fmt(scan.rows)} rows without a filter on tid. "
+            "Restrict the period, e.g. WHERE tid >= '2020-01-01' or tid = (SELECT max(tid) ...)."
+        )
+    if estimate.unfiltered_fact_scans or estimate.rows > SQL_GUARD_MAX_ROWS:
+        out.append(
+            "Filter every dimension column to either its total code (e.g. 'TOT') or its "
+            "individual values; never keep both, and exclude totals you are not using."
+        )
+    for rows, largest in estimate.exploding_joins:
+        out.append(
+            f"A join produces ~{_fmt(rows)} rows from inputs of at most ~{_fmt(largest)} rows. "
+            "Join on all shared dimension columns (and tid), or aggregate before joining."
+        )
+    if not out:
+        out.append("Aggregate in SQL (GROUP BY) or add WHERE filters to reduce the rows scanned.")
+    return out
+
+
+def refusal(estimate: PlanEstimate) -> QueryTooExpensiveError:
+    lines = [
+        f"Query refused before running: the planner estimates cost {_fmt(estimate.cost)} "
+        f"and {_fmt(estimate.rows)} result rows (limits {_fmt(SQL_GUARD_MAX_COST)} / "
+        f"{_fmt(SQL_GUARD_MAX_ROWS)}).",
+        *[f"- {hint}" for hint in hints(estimate)],
+    ]
+    return QueryTooExpensiveError("\n".join(lines))
+
+
+def sample_sql(query: str, tables: set[str], percent: float) -> str:
+    """Add a TABLESAMPLE clause to FROM/JOIN references of the given fact tables.
+
+    The table reference itself is kept, so qualified column references such as
+    fact.folk1a.indhold still resolve.
+    """
+
+    def replace(match: re.Match) -> str:
+        name = match.group("name").lower()
+        if f"fact.{name}" not in tables:
+            return match.group(0)
+        return f"{match.group(0)} TABLESAMPLE SYSTEM ({percent:g}) REPEATABLE (0)"
+
+    return FACT_REF_RE.sub(replace, query)
+
+
+def _sample_percent(estimate: PlanEstimate) -> float:
+    percent = 100 * SQL_GUARD_MAX_COST / estimate.cost / 2
+    return min(SQL_SAMPLE_MAX_PERCENT, max(SQL_SAMPLE_MIN_PERCENT, round(percent, 2)))
+
+
+async def estimate(query: str, conn: asyncpg.Connection | None = None) -> PlanEstimate:
+    return parse_plan(await explain(query, conn=conn))
+
+
+async def guarded_query(query: str) -> QueryResult:
+    """run_query, refused with hints when the planner estimate is over the limits.
+
+    The EXPLAIN runs in the query's own transaction, so both share one
+    admission slot and connection.
+    """
+    if not pg_arrow.is_select(query):
+        # EXPLAIN, SHOW and the like cannot be explained themselves.
+        return await run_query(query)
+    async with read_transaction(SQL_STATEMENT_TIMEOUT_S) as conn:
+        plan = await estimate(query, conn)
+        if plan.exceeds():
+            raise refusal(plan)
+        return await run_query(query, conn=conn)
+
+
+async def guarded_preview(query: str, preview_rows: int = SQL_PREVIEW_ROWS) -> QueryResult:
+    """run_preview, rewritten to LIMIT or TABLESAMPLE when the query is too expensive."""
+    if not pg_arrow.is_select(query):
+        return await run_preview(query, preview_rows=preview_rows)
+    async with read_transaction(SQL_STATEMENT_TIMEOUT_S) as conn:
+        return await _guarded_preview(query, preview_rows, conn)
+
+
+async def _guarded_preview(
+    query: str, preview_rows: int, conn: asyncpg.Connection
+) -> QueryResult:
+    plan = await estimate(query, conn)
+    if not plan.exceeds():
+        return await run_preview(query, preview_rows=preview_rows, conn=conn)
+
+    limited = pg_arrow.limit_sql(query, preview_rows)
+    if not (await estimate(limited, conn)).exceeds():
+        result = await run_preview(limited, preview_rows=preview_rows, conn=conn)
+        if result.rows_fetched < preview_rows:
+            # The LIMIT was not reached, so this is the whole result.
+            return result
+        result.row_count = int(plan.rows)
+        result.note = (
+            f"Note: the full query is estimated at cost {_fmt(plan.cost)}, so only the first "
+            f"{preview_rows} rows were fetched (LIMIT {preview_rows}); row_count is the planner "
+            "estimate, not an exact count."
+        )
+        return result
+
+    result = await _sampled_preview(query, plan, preview_rows, conn)
+    if result is None:
+        raise refusal(plan)
+    return result
+
+
+async def _sampled_preview(
+    query: str, plan: PlanEstimate, preview_rows: int, conn: asyncpg.Connection
+) -> QueryResult | None:
+    tables = {s.table for s in plan.unfiltered_fact_scans}
+    if not tables:
+        return None
+    percent = _sample_percent(plan)
+    sampled = sample_sql(query, tables, percent)
+    if sampled == query or (await estimate(sampled, conn)).exceeds():
+        return None
+    result = await run_preview(sampled, preview_rows=preview_rows, conn=conn)
+    if not result.rows_fetched:
+        # An empty sample says nothing about the data.
+        return None
+    result.note = (
+        f"Note: the full query is estimated at cost {_fmt(plan.cost)}, so it ran on a "
+        f"{percent:g}% TABLESAMPLE of {', '.join(sorted(tables))}. Values and row_count "
+        "come from the sample and are not exact; add filters before storing a result."
+    )
+    return result
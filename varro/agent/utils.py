@@ -1,10 +1,10 @@
-from functools import lru_cache
 from sqlalchemy import text
 from varro.db.db import dst_read_engine
 from pydantic_ai import BinaryContent
-import plotly.io as pio
 import plotly.graph_objects as go
-from varro.agent.playwright_render import html_to_png
+from varro.agent.playwright_render import figure_to_png
+from varro.agent.png_cache import figure_key, png_cache
+from varro.db.file_cache import CACHE_ERRORS
 from varro.agent.images import (
     optimize_png_bytes,
     SNAPSHOT_MAX_PIXELS,
@@ -12,14 +12,22 @@ from varro.agent.images import (
 )
 from varro.data.utils import df_preview
 import pandas as pd
-import geopandas as gpd
 from pandas.io.formats.style import Styler
-import matplotlib.pyplot as plt
+import asyncio
 import io
-from typing import Any
+import logging
+import sys
+import time
+from typing import TYPE_CHECKING, Any
 
 from pathlib import Path
 from varro.config import SUBJECTS_DIR, GEO_DIR
+from varro.startup import startup_metadata
+
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
 
 
 def generate_hierarchy() -> str:
@@ -49,16 +57,29 @@ def generate_hierarchy() -> str:
     return "\n".join(lines).rstrip()
 
 
-def get_dim_tables() -> tuple[str, ...]:
+def _query_dim_tables() -> list[str]:
     with dst_read_engine.connect() as conn:
-        return tuple(
+        return [
             row[0]
             for row in conn.execute(
                 text(
                     "SELECT table_name FROM information_schema.tables WHERE table_schema = 'dim'"
                 )
             )
-        )
+        ]
+
+
+# Loading a dim table drops the shared snapshot; each process re-reads it this often.
+DIM_TABLES_TTL_S = 60.0
+_dim_tables: tuple[float, tuple[str, ...]] | None = None
+
+
+def get_dim_tables() -> tuple[str, ...]:
+    global _dim_tables
+    now = time.monotonic()
+    if _dim_tables is None or now - _dim_tables[0] > DIM_TABLES_TTL_S:
+        _dim_tables = (now, tuple(startup_metadata("dim_tables", _query_dim_tables)))
+    return _dim_tables[1]
 
 # Helper functions for allowing the agent to view plotly and matplotlib figures
 async def show_element(element) -> Any | None:
@@ -72,14 +93,16 @@ async def show_element(element) -> Any | None:
             element, max_pixels=JUPYTER_SHOW_MAX_PIXELS
         )
         return BinaryContent(data=png_bytes, media_type="image/png")
-    if isinstance(element, plt.Figure):
+    # A matplotlib figure can only exist once matplotlib has been imported.
+    mpl_figure = sys.modules.get("matplotlib.figure")
+    if mpl_figure is not None and isinstance(element, mpl_figure.Figure):
         png_bytes = matplotlib_figure_to_png(element)
         return BinaryContent(data=png_bytes, media_type="image/png")
     else:
         raise ValueError(f"Invalid output type: {type(element)}")
 
 
-def matplotlib_figure_to_png(fig: plt.Figure) -> bytes:
+def matplotlib_figure_to_png(fig: "Figure") -> bytes:
     buf = io.BytesIO()
     fig.savefig(buf, format="png")
     buf.seek(0)
@@ -89,6 +112,23 @@ def matplotlib_figure_to_png(fig: plt.Figure) -> bytes:
 async def plotly_figure_to_png(
     fig: go.Figure, *, max_pixels: int = SNAPSHOT_MAX_PIXELS
 ) -> bytes:
-    html_str = pio.to_html(fig, full_html=True, include_plotlyjs="cdn")
-    png_bytes = await html_to_png(html_str, width=600, height=600)
-    return optimize_png_bytes(png_bytes, max_pixels=max_pixels)
+    """Rasterize and optimize a figure, reusing the PNG of an identical earlier render.
+
+    A PNG cache that cannot be read or written is skipped.
+    """
+    figure_json = fig.to_json()
+    key = figure_key(figure_json, width=600, height=600, max_pixels=max_pixels)
+    try:
+        cached = await asyncio.to_thread(png_cache.get, key)
+    except CACHE_ERRORS:
+        logger.warning("PNG cache lookup failed; rendering the figure", exc_info=True)
+        cached = None
+    if cached is not None:
+        return cached
+    png_bytes = await figure_to_png(figure_json, width=600, height=600)
+    png_bytes = await asyncio.to_thread(optimize_png_bytes, png_bytes, max_pixels=max_pixels)
+    try:
+        await asyncio.to_thread(png_cache.put, key, png_bytes)
+    except CACHE_ERRORS:
+        logger.warning("Could not store a rendered figure in the PNG cache", exc_info=True)
+    return png_bytes
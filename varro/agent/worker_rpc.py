@@ -0,0 +1,61 @@
+"""Length-prefixed msgpack framing for the sandbox worker protocol.
+
+Each message is a 4-byte big-endian length followed by a msgpack map. Requests
+carry an integer ``id`` that the worker echoes in its response, so the host can
+pipeline several requests in one write and match the responses by id. Binary
+values (PNG bytes, figure JSON) travel as msgpack bin; blobs larger than
+BLOB_INLINE_MAX are written to the exchange dir and sent as a path instead.
+"""
+
+from __future__ import annotations
+
+import struct
+from typing import BinaryIO
+
+import msgpack
+
+HEADER = struct.Struct(">I")
+MAX_MESSAGE_BYTES = 256 * 1024 * 1024
+BLOB_INLINE_MAX = 4 * 1024 * 1024
+
+
+class ProtocolError(RuntimeError):
+    pass
+
+
+def send_message(stream: BinaryIO, message: dict) -> None:
+    """Write one framed message; the caller flushes (possibly after a batch)."""
+    payload = msgpack.packb(message, use_bin_type=True)
+    stream.write(HEADER.pack(len(payload)))
+    stream.write(payload)
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes | None:
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            if remaining == size:
+                return None
+            raise ProtocolError("stream closed mid-message")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(stream: BinaryIO) -> dict | None:
+    """Read one framed message, or None at a clean end of stream."""
+    header = _read_exact(stream, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > MAX_MESSAGE_BYTES:
+        raise ProtocolError(f"message of {size} bytes exceeds {MAX_MESSAGE_BYTES}")
+    payload = _read_exact(stream, size)
+    if payload is None:
+        raise ProtocolError("stream closed mid-message")
+    message = msgpack.unpackb(payload, raw=False)
+    if not isinstance(message, dict):
+        raise ProtocolError("message is not a map")
+    return message
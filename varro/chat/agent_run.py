@@ -1,53 +1,235 @@
 from __future__ import annotations
 
 import asyncio
+import time
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import AsyncIterator
+from typing import AsyncIterator, ClassVar
 
 from pydantic_ai import Agent
-from pydantic_ai.messages import ThinkingPart, TextPart, ToolCallPart
+from pydantic_ai.messages import (
+    PartDeltaEvent,
+    PartStartEvent,
+    TextPart,
+    TextPartDelta,
+    ThinkingPart,
+    ThinkingPartDelta,
+    ToolCallPart,
+)
 
-from ui.app.chat import UserPromptBlock, ModelRequestBlock, CallToolsBlock
-from ui.app.tool import ReasoningBlock
-from varro.agent.assistant import AssistantRunDeps, agent
+from ui.app.chat import (
+    CallToolsBlock,
+    LiveDelta,
+    LivePart,
+    LiveResponseBlock,
+    LiveResponseEnd,
+    LiveToolCall,
+    ModelRequestBlock,
+    UserPromptBlock,
+)
+from ui.app.tool import (
+    ReasoningBlock,
+    ReasoningCountUpdate,
+    ReasoningStep,
+    ReasoningStepsAppend,
+    ToolCallStep,
+)
+from varro.agent.assistant import AssistantRunDeps, agent, resolve_model
 from varro.chat.model_registry import get_chat_model
 from varro.chat.model_costs import apply_model_charge, has_positive_balance
 from varro.chat.render_cache import save_turn_render_cache
 from varro.chat.tool_results import ToolRenderRecord, extract_tool_render_records
 from varro.chat.turn_store import load_messages_for_turns, save_turn_messages, turn_fp
-from varro.config import DATA_DIR
+from varro.config import DATA_DIR, settings
 from varro.db.models.chat import Chat, Turn
 from varro.db import crud
 
+# Text and thinking deltas are coalesced for this long before being published,
+# so a fast model sends a handful of SSE messages per second, not one per token.
+STREAM_FLUSH_SECONDS = float(settings.get("CHAT_STREAM_FLUSH_SECONDS", "0.05"))
+
 
 @dataclass
 class ReasoningState:
-    turn_idx: int
+    """The reasoning block of the running turn and what the client already has.
+
+    The block is sent whole once; after that only new steps are appended and
+    tool steps whose status changed are swapped, so each update costs the
+    size of what changed rather than of the whole block. The id of the live
+    response being streamed is kept too, so a run that stops early can take
+    down what the client would otherwise show as still in progress.
+    """
+
+    turn_idx: int = 0
     sequence: list[dict] = field(default_factory=list)
     returns: list[ToolRenderRecord] = field(default_factory=list)
     sent: bool = False
+    sent_steps: int = 0
+    sent_tool_count: int = 0
+    sent_statuses: dict[str, str] = field(default_factory=dict)
+    live_response_id: str | None = None
 
     @property
     def block_id(self) -> str:
         return f"reasoning-{self.turn_idx}"
 
-    def build_block(self, shell) -> object | None:
-        block = ReasoningBlock(
-            self.sequence,
-            self.returns,
-            shell=shell,
-            block_id=self.block_id,
-            swap_oob=self.sent,
-        )
-        if block:
-            self.sent = True
-        return block
+    def build_blocks(self, shell) -> list[object]:
+        results = {record.part.tool_call_id: record for record in self.returns}
+        tool_count = sum(1 for item in self.sequence if item["kind"] == "tool_call")
+        if not self.sent:
+            block = ReasoningBlock(
+                self.sequence, self.returns, shell=shell, block_id=self.block_id
+            )
+            if block is None:
+                return []
+            self._mark_sent(results, tool_count)
+            return [block]
+
+        blocks = []
+        for item in self.sequence[: self.sent_steps]:
+            call_id = item.get("call_id")
+            if item["kind"] != "tool_call" or not call_id:
+                continue
+            if _tool_status(call_id, results) != self.sent_statuses.get(call_id):
+                blocks.append(ReasoningStep(item, results, shell=shell, swap_oob=True))
+        new_steps = [
+            ReasoningStep(
+                item, results, shell=shell, step_id=f"{self.block_id}-step-{idx}"
+            )
+            for idx, item in enumerate(self.sequence)
+            if idx >= self.sent_steps
+        ]
+        if any(new_steps):
+            blocks.append(ReasoningStepsAppend(self.block_id, new_steps))
+        if tool_count != self.sent_tool_count:
+            blocks.append(ReasoningCountUpdate(self.block_id, tool_count))
+        self._mark_sent(results, tool_count)
+        return blocks
+
+    def _mark_sent(self, results: dict[str, ToolRenderRecord], tool_count: int) -> None:
+        self.sent = True
+        self.sent_steps = len(self.sequence)
+        self.sent_tool_count = tool_count
+        self.sent_statuses = {
+            item["call_id"]: _tool_status(item["call_id"], results)
+            for item in self.sequence
+            if item["kind"] == "tool_call" and item.get("call_id")
+        }
+
+    def abort_blocks(self) -> list[object]:
+        """Blocks that delete the live response and mark unfinished tool steps stopped."""
+        blocks = []
+        if self.live_response_id:
+            blocks.append(LiveResponseEnd(self.live_response_id))
+            self.live_response_id = None
+        for item in self.sequence[: self.sent_steps]:
+            call_id = item.get("call_id")
+            if item["kind"] != "tool_call" or self.sent_statuses.get(call_id) != "running":
+                continue
+            blocks.append(
+                ToolCallStep(
+                    tool=item["tool"],
+                    args=item["args"],
+                    result="Stopped before the tool finished.",
+                    status="error",
+                    call_id=call_id,
+                    swap_oob=True,
+                )
+            )
+            self.sent_statuses[call_id] = "error"
+        return blocks
 
     def clear(self):
         self.sequence.clear()
         self.returns.clear()
         self.sent = False
+        self.sent_steps = 0
+        self.sent_tool_count = 0
+        self.sent_statuses.clear()
+
+
+def _tool_status(call_id: str, results: dict[str, ToolRenderRecord]) -> str:
+    # Changes once, when the result arrives; the exact outcome is rendered by the step.
+    return "done" if call_id in results else "running"
+
+
+@dataclass
+class LiveResponse:
+    """Maps the stream events of one model response to incremental HTML updates.
+
+    Parts are appended to a placeholder inserted ahead of #chat-progress; the
+    placeholder is deleted once the response is complete and `node_to_blocks`
+    renders the finished parts in their usual place.
+    """
+
+    flush_seconds: ClassVar[float] = STREAM_FLUSH_SECONDS
+
+    response_id: str
+    part_ids: dict[int, str] = field(default_factory=dict)
+    pending: dict[str, list[str]] = field(default_factory=dict)
+    started: bool = False
+    last_flush: float = 0.0
+
+    def on_event(self, event) -> list[object]:
+        if isinstance(event, PartStartEvent):
+            return self._start_part(event.index, event.part)
+        if isinstance(event, PartDeltaEvent):
+            delta = event.delta
+            if isinstance(delta, (TextPartDelta, ThinkingPartDelta)):
+                part_id = self.part_ids.get(event.index)
+                if part_id and delta.content_delta:
+                    self.pending.setdefault(part_id, []).append(delta.content_delta)
+                    if time.monotonic() - self.last_flush >= self.flush_seconds:
+                        return self.flush()
+        return []
+
+    def _start_part(self, index: int, part) -> list[object]:
+        blocks = self.flush()
+        if not self.started:
+            blocks.append(LiveResponseBlock(self.response_id))
+            self.started = True
+        if isinstance(part, (TextPart, ThinkingPart)):
+            part_id = f"{self.response_id}-part-{index}"
+            self.part_ids[index] = part_id
+            kind = "thinking" if isinstance(part, ThinkingPart) else "text"
+            blocks.append(LivePart(self.response_id, part_id, kind, part.content))
+        elif isinstance(part, ToolCallPart):
+            self.part_ids.pop(index, None)
+            blocks.append(LiveToolCall(self.response_id, part.tool_name))
+        return blocks
+
+    def flush(self) -> list[object]:
+        blocks = [
+            LiveDelta(part_id, "".join(chunks))
+            for part_id, chunks in self.pending.items()
+            if chunks
+        ]
+        self.pending.clear()
+        self.last_flush = time.monotonic()
+        return blocks
+
+    def close(self) -> list[object]:
+        if not self.started:
+            return []
+        self.started = False
+        return [LiveResponseEnd(self.response_id)]
+
+
+async def stream_model_response(node, ctx, response_id: str) -> AsyncIterator[object]:
+    live = LiveResponse(response_id)
+    try:
+        async with node.stream(ctx) as stream:
+            async for event in stream:
+                for block in live.on_event(event):
+                    yield block
+    except Exception:
+        for block in live.close():
+            yield block
+        raise
+    # Pending deltas are dropped with the placeholder; the complete response
+    # is rendered from the CallToolsNode that follows.
+    for block in live.close():
+        yield block
 
 
 async def run_agent(
@@ -59,14 +241,22 @@ async def run_agent(
     chat_id: int,
     run_id: str,
     current_url: str | None = None,
+    state: ReasoningState | None = None,
 ) -> AsyncIterator[object]:
+    """Run one turn and yield its blocks as they are ready.
+
+    Pass a `state` to be able to call its `abort_blocks()` if the run is
+    cancelled or fails part way through.
+    """
     chat = chats.get(chat_id, with_turns=True)
     if not chat:
         return
 
     msg_history = load_messages_for_turns(chat.turns)
     turn_idx = len(chat.turns)
-    state = ReasoningState(turn_idx)
+    if state is None:
+        state = ReasoningState()
+    state.turn_idx = turn_idx
     assistant_model = get_chat_model(getattr(chat, "assistant_model", None))
 
     request_url = (current_url or "").strip()
@@ -95,13 +285,21 @@ async def run_agent(
             user_text,
             message_history=msg_history,
             deps=deps,
-            model=assistant_model.provider_model_name,
+            model=resolve_model(assistant_model.provider_model_name),
             model_settings=assistant_model.model_settings,
         ) as run:
+            response_idx = 0
             async for node in run:
                 for block in node_to_blocks(node, shell, state):
                     if block:
                         yield block
+                if Agent.is_model_request_node(node):
+                    response_id = f"live-response-{turn_idx}-{response_idx}"
+                    response_idx += 1
+                    state.live_response_id = response_id
+                    async for block in stream_model_response(node, run.ctx, response_id):
+                        yield block
+                    state.live_response_id = None
     except Exception:
         if run is not None:
             usage = run.usage()
@@ -200,25 +398,23 @@ def node_to_blocks(
             return []
         state.returns.extend(tool_parts)
         if state.sequence:
-            return [state.build_block(shell)]
+            return state.build_blocks(shell)
         return [ModelRequestBlock(node)]
 
     if Agent.is_call_tools_node(node):
         if node.model_response.finish_reason != "stop":
+            # Show the tool calls as running before they execute.
             cache_tool_calls(node.model_response.parts, state.sequence)
-            return []
-        blocks = []
-        block = state.build_block(shell)
-        if block:
-            blocks.append(block)
+            return state.build_blocks(shell)
+        blocks = state.build_blocks(shell)
         blocks.append(CallToolsBlock(node, shell=shell, connected=False))
         state.clear()
         return blocks
 
     if Agent.is_end_node(node):
-        block = state.build_block(shell)
+        blocks = state.build_blocks(shell)
         state.clear()
-        return [block] if block else []
+        return blocks
 
     return []
 
@@ -1,21 +1,72 @@
 from __future__ import annotations
 
 import asyncio
-from contextlib import asynccontextmanager
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import AsyncIterator, Iterator
 
-from varro.agent.sandbox import close_shell, create_shell
-from varro.config import DATA_DIR
+from varro.agent.sandbox import (
+    attach_shell,
+    bash_sessions,
+    close_shell,
+    create_shell,
+    shell_rss_bytes,
+    spawn_shell,
+)
+from varro.agent.shell_snapshot import remove_snapshot
+from varro.config import DATA_DIR, settings
+from varro.db.admission import worker_count
+
+logger = logging.getLogger(__name__)
+
+# Idle pre-imported shells kept ready per recently active user, and overall.
+SHELL_WARM_PER_USER = int(settings.get("SHELL_WARM_PER_USER", "1"))
+SHELL_WARM_MAX = int(settings.get("SHELL_WARM_MAX", "8"))
+
+
+def _default_memory_budget_mb() -> int:
+    """Half of the host's RAM, split evenly over the uvicorn workers."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) // 1024 // 2 // worker_count()
+    except (OSError, ValueError):
+        pass
+    return 4096
+
+
+# Live shells (leased, idle and warm) per uvicorn worker, and their summed RSS.
+SHELL_MAX_WORKERS = int(settings.get("SHELL_MAX_WORKERS", "16"))
+SHELL_MEMORY_BUDGET_MB = int(
+    settings.get("SHELL_MEMORY_BUDGET_MB") or _default_memory_budget_mb()
+)
+# Memory reserved for a shell that is still starting (imports done, no data yet).
+SHELL_SPAWN_ESTIMATE_MB = int(settings.get("SHELL_SPAWN_ESTIMATE_MB", "300"))
+# Shell RSS is re-read from /proc at most this often on the lease path.
+SHELL_RSS_SAMPLE_S = float(settings.get("SHELL_RSS_SAMPLE_S", "5"))
+# How long a lease waits for capacity before it is rejected.
+SHELL_ADMISSION_TIMEOUT_S = float(settings.get("SHELL_ADMISSION_TIMEOUT_S", "30"))
+
+
+class ShellPoolBusy(RuntimeError):
+    pass
 
 
 def _utc_now() -> datetime:
     return datetime.now(timezone.utc)
 
 
+def shell_state_dir(user_id: int) -> Path:
+    return DATA_DIR / "chat" / str(user_id)
+
+
 def shell_snapshot_fp(user_id: int, chat_id: int) -> Path:
-    return DATA_DIR / "chat" / str(user_id) / str(chat_id) / "shell.pkl"
+    return shell_state_dir(user_id) / str(chat_id) / "shell.pkl"
 
 
 @dataclass
@@ -24,6 +75,33 @@ class ShellEntry:
     lock: asyncio.Lock = field(default_factory=asyncio.Lock)
     in_use_count: int = 0
     last_active: datetime = field(default_factory=_utc_now)
+    rss_bytes: int = 0
+
+
+@dataclass
+class _Timing:
+    count: int = 0
+    total_s: float = 0.0
+    max_s: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total_s += seconds
+        self.max_s = max(self.max_s, seconds)
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_s": round(self.total_s / self.count, 4) if self.count else 0.0,
+            "max_s": round(self.max_s, 4),
+        }
+
+
+@dataclass
+class WarmShell:
+    shell: object
+    created: datetime = field(default_factory=_utc_now)
+    rss_bytes: int = 0
 
 
 class ShellPool:
@@ -32,12 +110,43 @@ class ShellPool:
         *,
         ttl: timedelta = timedelta(minutes=10),
         cleanup_interval: int = 60,
+        warm_per_user: int = 0,
+        warm_max: int = SHELL_WARM_MAX,
+        max_workers: int = SHELL_MAX_WORKERS,
+        memory_budget_mb: int = SHELL_MEMORY_BUDGET_MB,
+        spawn_estimate_mb: int = SHELL_SPAWN_ESTIMATE_MB,
+        admission_timeout_s: float = SHELL_ADMISSION_TIMEOUT_S,
+        rss_sample_s: float = SHELL_RSS_SAMPLE_S,
     ):
         self._ttl = ttl
         self._cleanup_interval = cleanup_interval
         self._entries: dict[tuple[int, int], ShellEntry] = {}
         self._lock = asyncio.Lock()
+        # Notified (under _lock) whenever a shell is released or closed.
+        self._capacity = asyncio.Condition(self._lock)
+        self._max_workers = max_workers
+        self._memory_budget = memory_budget_mb * 1024 * 1024
+        self._spawn_estimate = spawn_estimate_mb * 1024 * 1024
+        self._admission_timeout_s = admission_timeout_s
+        self._rss_sample_s = rss_sample_s
+        self._rss_sampled_at = float("-inf")
         self._cleanup_task: asyncio.Task | None = None
+        self._warm_per_user = warm_per_user
+        self._warm_max = warm_max
+        self._spares: dict[int, list[WarmShell]] = {}
+        self._warming: dict[int, asyncio.Task] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # Set when the in-flight creation for a key finishes (or fails).
+        self._creating: dict[tuple[int, int], asyncio.Event] = {}
+        # Set when a popped entry's shell has been torn down (snapshot written).
+        self._closing: dict[tuple[int, int], asyncio.Event] = {}
+        self._timings = {
+            name: _Timing() for name in ("lock_wait", "spawn", "attach", "snapshot", "teardown")
+        }
+        self._warm_hits = 0
+        self._cold_spawns = 0
+        self._pressure_evictions = 0
+        self._rejections = 0
 
     @asynccontextmanager
     async def lease(self, *, user_id: int, chat_id: int):
@@ -49,35 +158,155 @@ class ShellPool:
             await self._release(key)
 
     async def invalidate(self, user_id: int, chat_id: int) -> None:
-        async with self._lock:
-            entry = self._entries.pop((user_id, chat_id), None)
+        entry = await self._pop_entry((user_id, chat_id))
         if entry is None:
             return
-        self._close_shell(entry.shell, save_snapshot=False, user_id=user_id, chat_id=chat_id)
+        await self._close_shell(entry.shell, save_snapshot=False, user_id=user_id, chat_id=chat_id)
 
     async def remove_chat(self, user_id: int, chat_id: int) -> None:
-        async with self._lock:
-            entry = self._entries.pop((user_id, chat_id), None)
+        entry = await self._pop_entry((user_id, chat_id))
         if entry is not None:
-            self._close_shell(entry.shell, save_snapshot=False, user_id=user_id, chat_id=chat_id)
-        shell_snapshot_fp(user_id, chat_id).unlink(missing_ok=True)
+            await self._close_shell(
+                entry.shell, save_snapshot=False, user_id=user_id, chat_id=chat_id
+            )
+        await asyncio.to_thread(bash_sessions.close, user_id, chat_id)
+        remove_snapshot(shell_snapshot_fp(user_id, chat_id))
 
     async def evict_idle(self, ttl: timedelta | None = None) -> None:
         idle_ttl = self._ttl if ttl is None else ttl
         now = _utc_now()
         evicted: list[tuple[tuple[int, int], ShellEntry]] = []
 
-        async with self._lock:
+        async with self._locked():
             for key, entry in list(self._entries.items()):
                 if entry.in_use_count != 0:
                     continue
                 if now - entry.last_active <= idle_ttl:
                     continue
-                self._entries.pop(key, None)
-                evicted.append((key, entry))
+                evicted.append((key, self._take_entry(key)))
+
+        await asyncio.gather(
+            *(
+                self._close_shell(entry.shell, save_snapshot=True, user_id=user_id, chat_id=chat_id)
+                for (user_id, chat_id), entry in evicted
+            )
+        )
+
+        stale_spares = []
+        for user_id, spares in list(self._spares.items()):
+            keep = [s for s in spares if now - s.created <= idle_ttl]
+            stale_spares += [s for s in spares if now - s.created > idle_ttl]
+            if keep:
+                self._spares[user_id] = keep
+            else:
+                self._spares.pop(user_id, None)
+        await asyncio.gather(*(self._close_spare(spare) for spare in stale_spares))
+        await asyncio.to_thread(bash_sessions.evict_idle, idle_ttl.total_seconds())
+        if evicted or stale_spares:
+            await self._notify_capacity()
+        await self.enforce_budget()
+
+    async def enforce_budget(self) -> None:
+        """Evict idle shells, least recently used first, until the pool fits its budget.
+
+        Leased shells are never evicted; if they alone exceed the budget, new
+        leases wait in _admit until one of them is released.
+        """
+        while True:
+            await self._refresh_rss(max_age_s=0)
+            async with self._locked():
+                if self._within_budget(new_workers=0):
+                    return
+                victim = self._pop_victim()
+            if victim is None:
+                return
+            await self._close_victim(victim)
+
+    def prewarm(self, user_id: int | None) -> None:
+        """Start a spare shell for user_id in the background; callable from any thread.
+
+        Route handlers call this when a user opens the chat panel so the shell
+        for their next new chat is already spawned and pre-imported.
+        """
+        if user_id is None or self._warm_per_user <= 0:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._start_warming, user_id)
+            return
+        self._start_warming(user_id)
+
+    def _start_warming(self, user_id: int) -> None:
+        if user_id in self._warming:
+            return
+        if len(self._spares.get(user_id, [])) >= self._warm_per_user:
+            return
+        # Spares are a latency optimisation; never start one under memory pressure.
+        if not self._within_budget(new_workers=1):
+            return
+        self._loop = asyncio.get_running_loop()
+        self._warming[user_id] = self._loop.create_task(self._warm(user_id))
+
+    async def _warm(self, user_id: int) -> None:
+        try:
+            shell = await asyncio.to_thread(
+                spawn_shell, user_id=user_id, state_root=shell_state_dir(user_id)
+            )
+        except Exception:
+            logger.exception("Failed to pre-warm shell for user %s", user_id)
+            return
+        finally:
+            self._warming.pop(user_id, None)
+        self._spares.setdefault(user_id, []).append(
+            WarmShell(shell=shell, rss_bytes=self._spawn_estimate)
+        )
+        await self._trim_spares()
+
+    async def _trim_spares(self) -> None:
+        """Close the oldest spares beyond warm_max."""
+        spares = sorted(
+            ((s.created, user_id, s) for user_id, items in self._spares.items() for s in items),
+            key=lambda item: item[0],
+        )
+        for _, user_id, spare in spares[: max(0, len(spares) - self._warm_max)]:
+            self._spares[user_id].remove(spare)
+            if not self._spares[user_id]:
+                self._spares.pop(user_id)
+            await self._close_spare(spare)
 
-        for (user_id, chat_id), entry in evicted:
-            self._close_shell(entry.shell, save_snapshot=True, user_id=user_id, chat_id=chat_id)
+    def _take_spare(self, user_id: int) -> WarmShell | None:
+        spares = self._spares.get(user_id)
+        if not spares:
+            return None
+        spare = spares.pop(0)
+        if not spares:
+            self._spares.pop(user_id, None)
+        return spare
+
+    async def _open_shell(self, *, user_id: int, chat_id: int) -> object:
+        """Attach a warm spare to the chat if one is ready, else spawn a new shell."""
+        snapshot_fp = shell_snapshot_fp(user_id, chat_id)
+        spare = self._take_spare(user_id)
+        self.prewarm(user_id)
+        if spare is not None:
+            try:
+                with self._timed("attach"):
+                    await asyncio.to_thread(
+                        attach_shell, spare.shell, chat_id=chat_id, snapshot_fp=snapshot_fp
+                    )
+                self._warm_hits += 1
+                return spare.shell
+            except Exception:
+                logger.exception("Warm shell for user %s failed to attach", user_id)
+                await self._close_spare(spare)
+        with self._timed("spawn"):
+            shell = await asyncio.to_thread(
+                create_shell, user_id=user_id, chat_id=chat_id, snapshot_fp=snapshot_fp
+            )
+        self._cold_spawns += 1
+        return shell
 
     def start_cleanup_task(
         self,
@@ -88,6 +317,7 @@ class ShellPool:
         if self._cleanup_task and not self._cleanup_task.done():
             return
 
+        self._loop = asyncio.get_running_loop()
         idle_ttl = self._ttl if ttl is None else ttl
         delay = self._cleanup_interval if interval is None else interval
 
@@ -103,30 +333,170 @@ class ShellPool:
             self._cleanup_task.cancel()
 
     async def _acquire(self, key: tuple[int, int], *, user_id: int, chat_id: int) -> ShellEntry:
-        async with self._lock:
-            entry = self._entries.get(key)
-            if entry is None:
-                shell = create_shell(
-                    user_id=user_id,
-                    chat_id=chat_id,
-                    snapshot_fp=shell_snapshot_fp(user_id, chat_id),
-                )
-                entry = ShellEntry(shell=shell)
-                self._entries[key] = entry
+        """Lease the entry for key, creating its shell outside the pool lock.
 
-            entry.in_use_count += 1
-            entry.last_active = _utc_now()
-            return entry
+        Concurrent leases of the same chat wait for the one in-flight creation,
+        and for a previous shell of the chat that is still being closed (so its
+        snapshot is written before the new shell loads it); leases of other
+        chats are not held up by either.
+        """
+        while True:
+            async with self._locked():
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.in_use_count += 1
+                    entry.last_active = _utc_now()
+                    return entry
+                pending = self._creating.get(key) or self._closing.get(key)
+                if pending is None:
+                    created = self._creating[key] = asyncio.Event()
+                    break
+            # Another lease is creating this shell, or the old one is closing;
+            # re-check once it is done.
+            await pending.wait()
+
+        try:
+            await self._admit(user_id)
+            shell = await self._open_shell(user_id=user_id, chat_id=chat_id)
+        except BaseException:
+            async with self._locked():
+                self._creating.pop(key, None)
+                self._capacity.notify_all()
+            created.set()
+            raise
+        async with self._locked():
+            self._creating.pop(key, None)
+            # Counted at the spawn estimate until the next RSS sample.
+            entry = ShellEntry(shell=shell, in_use_count=1, rss_bytes=self._spawn_estimate)
+            self._entries[key] = entry
+        created.set()
+        return entry
+
+    async def _pop_entry(self, key: tuple[int, int]) -> ShellEntry | None:
+        """Remove key's entry for closing, waiting out an in-flight creation or close first."""
+        while True:
+            async with self._locked():
+                pending = self._creating.get(key) or self._closing.get(key)
+                if pending is None:
+                    entry = self._take_entry(key) if key in self._entries else None
+                    self._capacity.notify_all()
+                    return entry
+            await pending.wait()
+
+    def _take_entry(self, key: tuple[int, int]) -> ShellEntry:
+        """Pop key's entry and mark it closing; call under the pool lock.
+
+        The caller must hand the shell to _close_shell, which clears the mark.
+        """
+        self._closing[key] = asyncio.Event()
+        return self._entries.pop(key)
+
+    async def _admit(self, user_id: int) -> None:
+        """Wait until one more shell fits the worker and memory budgets.
+
+        Idle shells are evicted (warm spares first, then chats in LRU order with
+        a snapshot) to make room. If everything is leased, the lease waits for
+        a release and fails with ShellPoolBusy after the admission timeout, so
+        the pool refuses work instead of letting the OOM killer choose a victim.
+        """
+        deadline = time.monotonic() + self._admission_timeout_s
+        while True:
+            await self._refresh_rss()
+            async with self._locked():
+                if self._spares.get(user_id):
+                    # Attaching the user's own spare adds no worker.
+                    return
+                if self._within_budget(new_workers=0) or self._live_workers() == 1:
+                    return
+                victim = self._pop_victim()
+                if victim is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejections += 1
+                        raise ShellPoolBusy(
+                            "Der er for mange aktive analyser på serveren lige nu. "
+                            "Prøv igen om lidt."
+                        )
+                    try:
+                        await asyncio.wait_for(self._capacity.wait(), remaining)
+                    except TimeoutError:
+                        pass
+                    continue
+            await self._close_victim(victim)
+
+    def _live_workers(self) -> int:
+        # In-flight creations (including the caller's), spares still spawning and
+        # shells still closing count.
+        spares = sum(len(items) for items in self._spares.values())
+        starting = len(self._creating) + len(self._warming)
+        return len(self._entries) + spares + starting + len(self._closing)
+
+    async def _refresh_rss(self, *, max_age_s: float | None = None) -> None:
+        """Re-read each live shell's RSS from /proc in a worker thread.
+
+        Skipped if the last sample is younger than max_age_s (the pool's
+        rss_sample_s by default), so leases mostly reuse the cached values.
+        The pool lock is not held while /proc is walked.
+        """
+        max_age_s = self._rss_sample_s if max_age_s is None else max_age_s
+        now = time.monotonic()
+        if now - self._rss_sampled_at < max_age_s:
+            return
+        self._rss_sampled_at = now
+        items = [*self._entries.values(), *(s for v in self._spares.values() for s in v)]
+        sizes = await asyncio.to_thread(lambda: [shell_rss_bytes(i.shell) or 0 for i in items])
+        for item, size in zip(items, sizes):
+            item.rss_bytes = size
+
+    def _within_budget(self, *, new_workers: int) -> bool:
+        workers = self._live_workers() + new_workers
+        if workers > self._max_workers:
+            return False
+        used = sum(e.rss_bytes for e in self._entries.values())
+        used += sum(s.rss_bytes for v in self._spares.values() for s in v)
+        starting = len(self._creating) + len(self._warming) + new_workers
+        return used + starting * self._spawn_estimate <= self._memory_budget
+
+    def _pop_victim(self) -> tuple[tuple[int, int] | None, object] | None:
+        """Remove the cheapest idle shell to close: oldest spare, else LRU idle chat."""
+        spares = [(s.created, user_id, s) for user_id, v in self._spares.items() for s in v]
+        if spares:
+            _, user_id, spare = min(spares, key=lambda item: item[0])
+            self._spares[user_id].remove(spare)
+            if not self._spares[user_id]:
+                self._spares.pop(user_id)
+            return None, spare
+        idle = [(e.last_active, key) for key, e in self._entries.items() if e.in_use_count == 0]
+        if not idle:
+            return None
+        _, key = min(idle)
+        return key, self._take_entry(key)
+
+    async def _close_victim(self, victim: tuple[tuple[int, int] | None, object]) -> None:
+        key, item = victim
+        self._pressure_evictions += 1
+        if key is None:
+            await self._close_spare(item)
+        else:
+            logger.info("Evicting idle shell %s under memory pressure", key)
+            await self._close_shell(item.shell, save_snapshot=True, user_id=key[0], chat_id=key[1])
+        await self._notify_capacity()
+
+    async def _notify_capacity(self) -> None:
+        async with self._locked():
+            self._capacity.notify_all()
 
     async def _release(self, key: tuple[int, int]) -> None:
-        async with self._lock:
+        async with self._locked():
             entry = self._entries.get(key)
             if entry is None:
                 return
             entry.in_use_count = max(0, entry.in_use_count - 1)
             entry.last_active = _utc_now()
+            if entry.in_use_count == 0:
+                self._capacity.notify_all()
 
-    def _close_shell(
+    async def _close_shell(
         self,
         shell: object,
         *,
@@ -134,11 +504,65 @@ class ShellPool:
         user_id: int,
         chat_id: int,
     ) -> None:
-        close_shell(
-            shell,
-            save_snapshot=save_snapshot,
-            snapshot_fp=shell_snapshot_fp(user_id, chat_id),
-        )
+        """Snapshot (optionally) and tear down a shell in a worker thread.
+
+        Clears the closing mark _take_entry set for the chat once it is done.
+        """
+        try:
+            with self._timed("snapshot" if save_snapshot else "teardown"):
+                await asyncio.to_thread(
+                    close_shell,
+                    shell,
+                    save_snapshot=save_snapshot,
+                    snapshot_fp=shell_snapshot_fp(user_id, chat_id),
+                )
+        finally:
+            async with self._locked():
+                closed = self._closing.pop((user_id, chat_id), None)
+                self._capacity.notify_all()
+            if closed is not None:
+                closed.set()
+
+    async def _close_spare(self, spare: WarmShell) -> None:
+        with self._timed("teardown"):
+            await asyncio.to_thread(close_shell, spare.shell, save_snapshot=False)
+
+    @contextmanager
+    def _timed(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._timings[name].observe(time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def _locked(self) -> AsyncIterator[None]:
+        start = time.perf_counter()
+        async with self._lock:
+            self._timings["lock_wait"].observe(time.perf_counter() - start)
+            yield
+
+    def stats(self) -> dict:
+        return {
+            "workers": self._live_workers(),
+            "max_workers": self._max_workers,
+            "rss_bytes": sum(e.rss_bytes for e in self._entries.values())
+            + sum(s.rss_bytes for v in self._spares.values() for s in v),
+            "memory_budget_bytes": self._memory_budget,
+            "pressure_evictions": self._pressure_evictions,
+            "rejections": self._rejections,
+            "entries": len(self._entries),
+            "in_use": sum(1 for e in self._entries.values() if e.in_use_count),
+            "creating": len(self._creating),
+            "closing": len(self._closing),
+            "spares": sum(len(spares) for spares in self._spares.values()),
+            "warming": len(self._warming),
+            "warm_hits": self._warm_hits,
+            "cold_spawns": self._cold_spawns,
+            "bash_sessions": len(bash_sessions),
+            "bash_spawns": bash_sessions.spawns,
+            "timings": {name: timing.as_dict() for name, timing in self._timings.items()},
+        }
 
 
-shell_pool = ShellPool()
+shell_pool = ShellPool(warm_per_user=SHELL_WARM_PER_USER)
@@ -27,6 +27,11 @@ SUBJECTS_DIR = AGENT_DATA_DIR / "subjects"
 FACTS_DIR = AGENT_DATA_DIR / "fact"
 DIMS_DIR = AGENT_DATA_DIR / "dim"
 GEO_DIR = AGENT_DATA_DIR / "geo"
+SEARCH_INDEX_DIR = AGENT_DATA_DIR / "search_index"
 DIM_TABLE_DESCR_DIR = DST_DIR / "dim_table_descr"
 TRAJECTORIES_DIR = DATA_DIR / "trajectory"
+SQL_CACHE_DIR = DATA_DIR / "sql_cache"
+PNG_CACHE_DIR = DATA_DIR / "png_cache"
+LINE_INDEX_DIR = DATA_DIR / "line_index"
+STARTUP_METADATA_DIR = DATA_DIR / "startup_metadata"
 USER_WORKSPACE_INIT_DIR = PROJECT_ROOT / "user_workspace"
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import unicodedata
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+DANISH_FOLDS = str.maketrans({"æ": "ae", "ø": "oe", "å": "aa"})
+NGRAM_SIZE = 3
+# Below this many choices scoring everything is cheaper than the prefilter.
+PREFILTER_MIN_CHOICES = 500
+# Candidates kept per query after the n-gram prefilter, as a multiple of limit.
+PREFILTER_FACTOR = 20
+PREFILTER_MIN_CANDIDATES = 200
+
+SCHEMA_COLUMNS = {
+    "fact": ("id", "text", "label"),
+    "dim": ("kode", "titel", "titel"),
+}
+
+
+def fold_text(value: str) -> str:
+    """Lowercase, fold Danish letters and strip accents so Århus == aarhus."""
+    text = str(value).lower().translate(DANISH_FOLDS)
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.split())
+
+
+def text_ngrams(text: str, n: int = NGRAM_SIZE) -> set[str]:
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i : i + n] for i in range(len(padded) - n + 1)}
+
+
+@dataclass
+class FuzzyIndex:
+    """Prebuilt search index over the id/label pairs of one column values table."""
+
+    ids: np.ndarray
+    labels: np.ndarray
+    choices: list[str]
+    postings: dict[str, np.ndarray] = field(default_factory=dict)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, id_col: str, label_col: str) -> FuzzyIndex:
+        ids = df[id_col].to_numpy(dtype=object)
+        labels = df[label_col].fillna("").astype(str).to_numpy(dtype=object)
+        choices = [fold_text(label) for label in labels]
+
+        postings: dict[str, list[int]] = {}
+        if len(choices) >= PREFILTER_MIN_CHOICES:
+            for pos, choice in enumerate(choices):
+                for gram in text_ngrams(choice):
+                    postings.setdefault(gram, []).append(pos)
+        return cls(
+            ids=ids,
+            labels=labels,
+            choices=choices,
+            postings={gram: np.asarray(p, dtype=np.int64) for gram, p in postings.items()},
+        )
+
+    def __len__(self) -> int:
+        return len(self.choices)
+
+    def _candidates(
+        self, query: str, limit: int, allowed: np.ndarray | None = None
+    ) -> np.ndarray | None:
+        """Positions sharing the most n-grams with query, or None to score all."""
+        if not self.postings:
+            return None
+        hits = [self.postings[g] for g in text_ngrams(query) if g in self.postings]
+        if not hits:
+            return None
+        counts = np.bincount(np.concatenate(hits), minlength=len(self.choices))
+        if allowed is not None:
+            counts[~allowed] = 0
+        keep = max(limit * PREFILTER_FACTOR, PREFILTER_MIN_CANDIDATES)
+        matched = np.flatnonzero(counts)
+        if len(matched) < limit:
+            return None
+        if len(matched) <= keep:
+            return matched
+        top = np.argpartition(counts[matched], -keep)[-keep:]
+        return np.sort(matched[top])
+
+    def search(
+        self,
+        queries: list[str],
+        limit: int = 5,
+        allowed: np.ndarray | None = None,
+    ) -> list[list[tuple[int, float]]]:
+        """Return the best (position, score) pairs per query, best first.
+
+        All queries are scored in a single batched ``cdist`` call over the
+        union of their prefiltered candidates. ``allowed`` is an optional
+        boolean mask restricting which positions may be returned; it is applied
+        before the prefilter, so a narrow subset never loses its matches to
+        better-scoring rows outside it.
+        """
+        if not queries or not self.choices:
+            return [[] for _ in queries]
+        folded = [fold_text(q) for q in queries]
+
+        if allowed is not None and allowed.sum() < PREFILTER_MIN_CHOICES:
+            # A narrow subset is cheaper to score whole than to prefilter.
+            candidate_sets = [None]
+        else:
+            candidate_sets = [self._candidates(q, limit, allowed) for q in folded]
+        if any(c is None for c in candidate_sets):
+            positions = np.arange(len(self.choices))
+        else:
+            positions = np.unique(np.concatenate(candidate_sets))
+        if allowed is not None:
+            positions = positions[allowed[positions]]
+        if len(positions) == 0:
+            return [[] for _ in queries]
+
+        choices = [self.choices[pos] for pos in positions]
+        scores = process.cdist(
+            folded, choices, scorer=fuzz.WRatio, dtype=np.float32, workers=-1
+        )
+
+        results = []
+        top_n = min(limit, len(positions))
+        for row in scores:
+            best = np.argpartition(-row, top_n - 1)[:top_n]
+            best = best[np.argsort(-row[best], kind="stable")]
+            results.append([(int(positions[i]), float(row[i])) for i in best])
+        return results
+
+    def allowed_mask(self, codes: set[str]) -> np.ndarray:
+        return np.fromiter(
+            (str(value) in codes for value in self.ids), dtype=bool, count=len(self.ids)
+        )
+
+
+def build_index(df: pd.DataFrame, schema: str) -> FuzzyIndex:
+    if schema not in SCHEMA_COLUMNS:
+        raise ValueError(f"Invalid schema: {schema}")
+    id_col, label_col, _ = SCHEMA_COLUMNS[schema]
+    return FuzzyIndex.from_frame(df, id_col=id_col, label_col=label_col)
+
+
+@lru_cache(maxsize=256)
+def _load_index(path: str, schema: str, mtime_ns: int) -> tuple[pd.DataFrame, FuzzyIndex]:
+    df = pd.read_parquet(path)
+    return df, build_index(df, schema)
+
+
+def load_column_values(path: Path, schema: str) -> tuple[pd.DataFrame, FuzzyIndex]:
+    """Load a column values parquet file together with its cached search index.
+
+    The cache is keyed by path and mtime, so regenerated column values files are
+    picked up without restarting the process.
+    """
+    return _load_index(str(path), schema, path.stat().st_mtime_ns)
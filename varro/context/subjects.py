@@ -10,6 +10,8 @@ import pandas as pd
 from typing import Callable
 from varro.db.db import dst_owner_engine
 from sqlalchemy import inspect
+from varro.context.table_index import build_table_index
+from varro.context.value_index import build_value_index
 from varro.config import COLUMN_VALUES_DIR, FACTS_DIR, SUBJECTS_DIR, DST_METADATA_DIR
 
 G = nx.read_gml(DST_METADATA_DIR / "subjects_graph_da.gml")
@@ -120,5 +122,7 @@ def dump_markdown_to_file(path: Path, markdown: str):
 
 if __name__ == "__main__":
     create_subjects_data()
+    build_value_index()
+    build_table_index()
     # copy_dim_table_docs()
     # dump_dim_table_unique_values()
@@ -0,0 +1,231 @@
+"""BM25 table-discovery index over the generated /fact docs.
+
+Built at doc-generation time (after create_subjects_data) so the SearchTables
+tool can rank tables without the agent grepping /subjects and /fact.
+"""
+
+from __future__ import annotations
+
+import math
+import pickle
+import re
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from varro.config import FACTS_DIR, SEARCH_INDEX_DIR
+from varro.context.fuzzy_index import fold_text
+from varro.data.statbank_to_disk.copy_tables_statbank import write_pickle_atomic
+
+TABLE_INDEX_PATH = SEARCH_INDEX_DIR / "table_index.pkl"
+WORD_RE = re.compile(r"[a-zæøå0-9]+")
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_PREFIXES = ("table:", "description:", "measure:")
+# Description and subject path terms say what the table is about; column
+# values and notes mostly say how to query it.
+DESCRIPTION_WEIGHT = 3
+SUBJECT_WEIGHT = 2
+MIN_COMPOUND_PART = 3
+
+# Danish Snowball stemmer (https://snowballstem.org/algorithms/danish/stemmer.html)
+VOWELS = set("aeiouyæåø")
+S_ENDINGS = set("abcdfghjklmnoprtvyzå")
+STEP1_SUFFIXES = sorted(
+    (
+        "hed ethed ered e erede ende erende ene erne ere en heden eren er heder "
+        "erer heds es endes erendes enes ernes eres ens hedens erens ers ets "
+        "erets et eret"
+    ).split(),
+    key=len,
+    reverse=True,
+)
+STEP2_SUFFIXES = ("gd", "dt", "gt", "kt")
+STEP3_SUFFIXES = ("elig", "løst", "lig", "els", "ig")
+
+
+def _r1_start(word: str) -> int:
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return max(i + 1, 3)
+    return len(word)
+
+
+def _step2(word: str, r1: int) -> str:
+    if word[r1:].endswith(STEP2_SUFFIXES):
+        return word[:-1]
+    return word
+
+
+def danish_stem(word: str) -> str:
+    if len(word) < 3:
+        return word
+    r1 = _r1_start(word)
+
+    region = word[r1:]
+    for suffix in STEP1_SUFFIXES:
+        if region.endswith(suffix):
+            word = word[: -len(suffix)]
+            break
+    else:
+        if region.endswith("s") and len(word) > 1 and word[-2] in S_ENDINGS:
+            word = word[:-1]
+
+    word = _step2(word, r1)
+
+    if word.endswith("igst"):
+        word = word[:-2]
+    region = word[r1:]
+    for suffix in STEP3_SUFFIXES:
+        if region.endswith(suffix):
+            if suffix == "løst":
+                word = word[:-1]
+            else:
+                word = _step2(word[: -len(suffix)], r1)
+            break
+
+    region = word[r1:]
+    if len(region) >= 2 and region[-1] == region[-2] and region[-1] not in VOWELS:
+        word = word[:-1]
+    return word
+
+
+def analyze(text: str) -> list[str]:
+    """Lowercase, split, stem and fold text into index terms."""
+    return [fold_text(danish_stem(word)) for word in WORD_RE.findall(text.lower())]
+
+
+@dataclass
+class TableDoc:
+    table: str
+    path: str
+    snippet: str
+
+
+@dataclass
+class TableIndex:
+    docs: list[TableDoc]
+    doc_lengths: np.ndarray
+    postings: dict[str, tuple[np.ndarray, np.ndarray]]
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def split_compound(self, term: str) -> list[str]:
+        """Split an unknown Danish compound (bilimport, huspris) into indexed terms."""
+        best: list[str] = []
+        for i in range(MIN_COMPOUND_PART, len(term) - MIN_COMPOUND_PART + 1):
+            head, tail = term[:i], term[i:]
+            if tail not in self.postings:
+                continue
+            # Linking letters: "befolkningstal" = befolkning + s + tal.
+            for candidate in (head, head[:-1] if head[-1] in "se" else None):
+                if candidate and candidate in self.postings:
+                    parts = [candidate, tail]
+                    if min(map(len, parts)) > min(map(len, best), default=0):
+                        best = parts
+                    break
+        return best
+
+    def query_terms(self, query: str) -> set[str]:
+        terms = set()
+        for term in analyze(query):
+            if term in self.postings:
+                terms.add(term)
+            else:
+                terms.update(self.split_compound(term))
+        return terms
+
+    def search(self, query: str, k: int = 10) -> list[tuple[TableDoc, float]]:
+        n_docs = len(self.docs)
+        if not n_docs:
+            return []
+        avg_len = float(self.doc_lengths.mean())
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / avg_len)
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in self.query_terms(query):
+            doc_ids, tfs = self.postings[term]
+            idf = math.log(1 + (n_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            scores[doc_ids] += idf * tfs * (BM25_K1 + 1) / (tfs + norm[doc_ids])
+
+        matched = np.flatnonzero(scores)
+        top = matched[np.argsort(-scores[matched], kind="stable")][:k]
+        return [(self.docs[i], float(scores[i])) for i in top]
+
+
+def doc_terms(text: str, subject_parts: tuple[str, ...]) -> list[str]:
+    terms = []
+    for line in text.splitlines():
+        line_terms = analyze(line)
+        if line.startswith("description:"):
+            line_terms = line_terms * DESCRIPTION_WEIGHT
+        terms.extend(line_terms)
+    for part in subject_parts:
+        terms.extend(analyze(part.replace("_", " ")) * SUBJECT_WEIGHT)
+    return terms
+
+
+def doc_snippet(text: str) -> str:
+    return "\n".join(
+        line for line in text.splitlines() if line.startswith(SNIPPET_PREFIXES)
+    )
+
+
+def build_table_index(
+    facts_dir: Path = FACTS_DIR, output_path: Path = TABLE_INDEX_PATH
+) -> TableIndex:
+    docs: list[TableDoc] = []
+    doc_lengths: list[int] = []
+    term_docs: dict[str, list[tuple[int, int]]] = {}
+
+    for path in sorted(facts_dir.rglob("*.md")):
+        text = path.read_text()
+        rel = path.relative_to(facts_dir)
+        terms = doc_terms(text, rel.parts[:-1])
+        doc_id = len(docs)
+        docs.append(
+            TableDoc(table=path.stem, path=f"/fact/{rel.as_posix()}", snippet=doc_snippet(text))
+        )
+        doc_lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            term_docs.setdefault(term, []).append((doc_id, tf))
+
+    index = TableIndex(
+        docs=docs,
+        doc_lengths=np.asarray(doc_lengths, dtype=np.float32),
+        postings={
+            term: (
+                np.asarray([doc for doc, _ in entries], dtype=np.int32),
+                np.asarray([tf for _, tf in entries], dtype=np.float32),
+            )
+            for term, entries in term_docs.items()
+        },
+    )
+    write_pickle_atomic(output_path, index)
+    print(f"Indexed {len(docs)} table docs ({len(term_docs)} terms) to {output_path}")
+    return index
+
+
+@lru_cache(maxsize=4)
+def _load_table_index(path: str, mtime_ns: int) -> TableIndex:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def load_table_index(path: Path = TABLE_INDEX_PATH) -> TableIndex | None:
+    if not path.exists():
+        return None
+    return _load_table_index(str(path), path.stat().st_mtime_ns)
+
+
+def format_table_hits(hits: list[tuple[TableDoc, float]]) -> str:
+    blocks = [f"{doc.path} (score {score:.2f})\n{doc.snippet}" for doc, score in hits]
+    return "\n\n".join(blocks)
+
+
+if __name__ == "__main__":
+    build_table_index()
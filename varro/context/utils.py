@@ -1,7 +1,7 @@
 import json
 from varro.config import DST_DIMENSION_LINKS_DIR
 from varro.data.utils import df_preview
-from rapidfuzz import process
+from varro.context.fuzzy_index import FuzzyIndex, SCHEMA_COLUMNS, build_index
 import pandas as pd
 
 DIM_LINKS_DIR = DST_DIMENSION_LINKS_DIR
@@ -24,29 +24,39 @@ def normalize_fact_col_name(name: str) -> str:
 
 
 def fuzzy_match(
-    query: str, df: pd.DataFrame, limit: int = 5, schema: str = "fact", name: str = "df"
+    query: str | list[str],
+    df: pd.DataFrame,
+    limit: int = 5,
+    schema: str = "fact",
+    name: str = "df",
+    index: FuzzyIndex | None = None,
 ) -> str:
-    if schema == "fact":
-        col = "text"
-        id_col = "id"
-        label_name = "label"
-    elif schema == "dim":
-        col = "titel"
-        id_col = "kode"
-        label_name = "titel"
-    else:
+    """Fuzzy match one or more query strings against a column values table.
+
+    Pass a prebuilt ``index`` (see ``fuzzy_index.load_column_values``) to skip
+    building one; ``df`` may then be a filtered subset of the indexed frame.
+    """
+    if schema not in SCHEMA_COLUMNS:
         raise ValueError(f"Invalid schema: {schema}")
+    id_col, _, label_name = SCHEMA_COLUMNS[schema]
+
+    queries = [query] if isinstance(query, str) else list(query)
+    allowed = None
+    if index is None:
+        index = build_index(df, schema)
+    elif len(df) != len(index):
+        allowed = index.allowed_mask({str(code) for code in df[id_col].dropna()})
+    limit = limit or len(index)
 
-    search_results = process.extract(query, df[col], limit=limit)
     matches = []
-    for choice, similarity, index in search_results:
-        matches.append(
-            {
-                id_col: df.loc[index, id_col],
-                label_name: choice,
-            }
-        )
-    return df_preview(pd.DataFrame(matches), max_rows=limit, name=name)
+    for q, hits in zip(queries, index.search(queries, limit=limit, allowed=allowed)):
+        for pos, _ in hits:
+            match = {id_col: index.ids[pos], label_name: index.labels[pos]}
+            if len(queries) > 1:
+                match = {"query": q, **match}
+            matches.append(match)
+    max_rows = limit * len(queries)
+    return df_preview(pd.DataFrame(matches), max_rows=max_rows, name=name)
 
 
 FACT_TABLES_NOT_IN_DB = [
@@ -0,0 +1,234 @@
+"""Catalog-wide inverted index answering "which tables contain this value".
+
+Built at doc-generation time from the tableinfo pickles and the column values
+parquet dumps. Entries are column values, column titles and table texts.
+"""
+
+from __future__ import annotations
+
+import math
+import pickle
+import re
+from bisect import bisect_left
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from varro.config import COLUMN_VALUES_DIR, DST_METADATA_DIR, SEARCH_INDEX_DIR
+from varro.context.fuzzy_index import fold_text
+from varro.data.statbank_to_disk.copy_tables_statbank import write_pickle_atomic
+from varro.data.utils import normalize_column_name
+
+TABLES_INFO_DIR = DST_METADATA_DIR / "tables_info_raw_da"
+VALUE_INDEX_PATH = SEARCH_INDEX_DIR / "value_index.pkl"
+SKIP_COLUMNS = {"tid"}
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Weight of a query token matching an index term exactly, as a prefix, or as a
+# substring (Danish compounds: "bilimport" should find "import af biler" and
+# "personbiler" should be found by "biler").
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.8
+INFIX_WEIGHT = 0.6
+MIN_PREFIX_LEN = 3
+MIN_INFIX_LEN = 4
+# Label length normalization, as in BM25 with k1 folded into the weights.
+LENGTH_PENALTY = 0.1
+KIND_BOOST = {"value": 1.0, "column": 0.9, "table": 0.8}
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(fold_text(text))
+
+
+@dataclass
+class ValueIndex:
+    tables: list[str]
+    columns: list[str | None]
+    codes: list[str | None]
+    labels: list[str]
+    kinds: list[str]
+    lengths: np.ndarray
+    postings: dict[str, np.ndarray]
+    vocab: list[str]
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings[term])
+        n = len(self.labels)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _expand(self, token: str) -> dict[str, float]:
+        """Index terms matching a query token, with their match weight."""
+        expanded = {}
+        if token in self.postings:
+            expanded[token] = EXACT_WEIGHT
+        if len(token) >= MIN_PREFIX_LEN:
+            start = bisect_left(self.vocab, token)
+            for term in self.vocab[start:]:
+                if not term.startswith(token):
+                    break
+                expanded.setdefault(term, PREFIX_WEIGHT)
+        if len(token) >= MIN_INFIX_LEN:
+            for term in self.vocab:
+                if term not in expanded and (token in term or term in token):
+                    if len(term) >= MIN_INFIX_LEN:
+                        expanded[term] = INFIX_WEIGHT
+        return expanded
+
+    def search(self, phrase: str, limit: int = 20) -> list[tuple[int, float]]:
+        """Return the best (entry, score) pairs for a phrase, best first.
+
+        Entries matching more query tokens always rank above entries matching
+        fewer; within the same coverage they are ordered by idf-weighted score.
+        """
+        tokens = list(dict.fromkeys(tokenize(phrase)))
+        if not tokens or not self.labels:
+            return []
+
+        total = np.zeros(len(self.labels), dtype=np.float32)
+        coverage = np.zeros(len(self.labels), dtype=np.int16)
+        for token in tokens:
+            token_scores = np.zeros(len(self.labels), dtype=np.float32)
+            for term, weight in self._expand(token).items():
+                entries = self.postings[term]
+                token_scores[entries] = np.maximum(
+                    token_scores[entries], weight * self._idf(term)
+                )
+            total += token_scores
+            coverage += token_scores > 0
+
+        matched = np.flatnonzero(coverage)
+        if len(matched) == 0:
+            return []
+        kind_boost = np.array([KIND_BOOST[self.kinds[i]] for i in matched])
+        scores = total[matched] * kind_boost / (
+            1 + LENGTH_PENALTY * (self.lengths[matched] - 1)
+        )
+        order = np.lexsort((-scores, -coverage[matched]))[:limit]
+        return [(int(matched[i]), float(scores[i])) for i in order]
+
+    def hits_frame(self, phrases: list[str], limit: int = 20) -> pd.DataFrame:
+        rows = []
+        for phrase in phrases:
+            for entry, score in self.search(phrase, limit=limit):
+                rows.append(
+                    {
+                        "query": phrase,
+                        "table": self.tables[entry],
+                        "column": self.columns[entry],
+                        "code": self.codes[entry],
+                        "label": self.labels[entry],
+                        "score": round(score, 2),
+                    }
+                )
+        return pd.DataFrame(
+            rows, columns=["query", "table", "column", "code", "label", "score"]
+        )
+
+
+class _IndexBuilder:
+    def __init__(self):
+        self.tables: list[str] = []
+        self.columns: list[str | None] = []
+        self.codes: list[str | None] = []
+        self.labels: list[str] = []
+        self.kinds: list[str] = []
+        self.lengths: list[int] = []
+        self.postings: dict[str, list[int]] = {}
+
+    def add(self, table: str, column: str | None, code, label: str, kind: str) -> None:
+        label = str(label or "").strip()
+        tokens = tokenize(label)
+        if not tokens:
+            return
+        entry = len(self.labels)
+        self.tables.append(table)
+        self.columns.append(column)
+        self.codes.append(None if code is None else str(code))
+        self.labels.append(label)
+        self.kinds.append(kind)
+        self.lengths.append(len(tokens))
+        for token in set(tokens):
+            self.postings.setdefault(token, []).append(entry)
+
+    def build(self) -> ValueIndex:
+        return ValueIndex(
+            tables=self.tables,
+            columns=self.columns,
+            codes=self.codes,
+            labels=self.labels,
+            kinds=self.kinds,
+            lengths=np.asarray(self.lengths, dtype=np.float32),
+            postings={
+                term: np.asarray(entries, dtype=np.int32)
+                for term, entries in self.postings.items()
+            },
+            vocab=sorted(self.postings),
+        )
+
+
+def add_table_info(builder: _IndexBuilder, table_info: dict) -> None:
+    table = table_info["id"].lower()
+    builder.add(table, None, None, table_info.get("text"), "table")
+    builder.add(table, None, None, table_info.get("description"), "table")
+    for var in table_info.get("variables", []):
+        column = normalize_column_name(var["id"])
+        if column in SKIP_COLUMNS:
+            continue
+        builder.add(table, column, None, var.get("text"), "column")
+
+
+def add_column_values(builder: _IndexBuilder, column_values_dir: Path) -> None:
+    for path in sorted(column_values_dir.glob("*.parquet")):
+        dim_table = path.stem
+        df = pd.read_parquet(path, columns=["kode", "titel"])
+        for code, label in zip(df["kode"], df["titel"]):
+            builder.add(dim_table, "kode", code, label, "value")
+
+    for table_dir in sorted(p for p in column_values_dir.iterdir() if p.is_dir()):
+        for path in sorted(table_dir.glob("*.parquet")):
+            if path.stem in SKIP_COLUMNS:
+                continue
+            df = pd.read_parquet(path)
+            if "id" not in df or "text" not in df:
+                continue
+            for code, label in zip(df["id"], df["text"]):
+                builder.add(table_dir.name, path.stem, code, label, "value")
+
+
+def build_value_index(
+    tables_info_dir: Path = TABLES_INFO_DIR,
+    column_values_dir: Path = COLUMN_VALUES_DIR,
+    output_path: Path = VALUE_INDEX_PATH,
+) -> ValueIndex:
+    builder = _IndexBuilder()
+    for path in sorted(tables_info_dir.glob("*.pkl")):
+        with open(path, "rb") as f:
+            add_table_info(builder, pickle.load(f))
+    add_column_values(builder, column_values_dir)
+    index = builder.build()
+    write_pickle_atomic(output_path, index)
+    print(f"Indexed {len(index)} entries ({len(index.vocab)} terms) to {output_path}")
+    return index
+
+
+@lru_cache(maxsize=4)
+def _load_value_index(path: str, mtime_ns: int) -> ValueIndex:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def load_value_index(path: Path = VALUE_INDEX_PATH) -> ValueIndex | None:
+    if not path.exists():
+        return None
+    return _load_value_index(str(path), path.stat().st_mtime_ns)
+
+
+if __name__ == "__main__":
+    build_value_index()
@@ -14,7 +14,6 @@ from fasthtml.common import (
     NotStr,
     Form as HtmlForm,
 )
-import mistletoe
 
 from ui.components import (
     Card,
@@ -38,6 +37,9 @@ from varro.dashboard.filters import (
 from varro.dashboard.parser import ASTNode, ContainerNode, ComponentNode, MarkdownNode
 from varro.dashboard.loader import Dashboard
 from varro.dashboard.executor import SelectOption
+from varro.startup import LazyModule
+
+mistletoe = LazyModule("mistletoe")
 
 
 def render_filter(
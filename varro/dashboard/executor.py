@@ -5,7 +5,6 @@ Execute SQL queries and call @output functions.
 
 from __future__ import annotations
 
-from datetime import date
 import hashlib
 import inspect
 import json
@@ -18,21 +17,13 @@ from sqlalchemy.engine import Engine
 from varro.dashboard.loader import Dashboard, extract_params
 from varro.dashboard.models import Metric
 from varro.dashboard.filters import SelectFilter
+from varro.db.admission import admitted
+from varro.db.pg_arrow import read_frame
 
 _query_cache: dict[tuple[str, str], pd.DataFrame] = {}
 SelectOption = tuple[str, str]
 
 
-def _normalize_date_columns(df: pd.DataFrame) -> pd.DataFrame:
-    for col in df.select_dtypes(include=["object"]).columns:
-        non_null = df[col].dropna()
-        if non_null.empty:
-            continue
-        if non_null.map(lambda value: isinstance(value, date)).all():
-            df[col] = pd.to_datetime(df[col])
-    return df
-
-
 def _infer_param_type(name: str, value: Any = None):
     """Infer SQLAlchemy type from parameter name."""
     if isinstance(value, bool):
@@ -64,9 +55,14 @@ def execute_query(query: str, filters: dict[str, Any], engine: Engine) -> pd.Dat
     for param in params_needed:
         stmt = stmt.bindparams(bindparam(param, type_=param_types[param]))
 
-    with engine.connect() as conn:
-        df = pd.read_sql(stmt, conn, params=bound)
-    return _normalize_date_columns(df)
+    # Compile to driver SQL (with bind casts) and fetch column-wise via COPY.
+    compiled = stmt.compile(dialect=engine.dialect)
+    with admitted(), engine.connect() as conn:
+        return read_frame(
+            conn.connection.driver_connection,
+            compiled.string,
+            compiled.construct_params(bound),
+        )
 
 
 def execute_query_cached(
@@ -102,7 +98,7 @@ def execute_options_query(
     query = dash.queries[f.options_query]
 
     options: list[SelectOption] = []
-    with engine.connect() as conn:
+    with admitted(), engine.connect() as conn:
         for row in conn.execute(text(query)):
             if len(row) < 1:
                 continue
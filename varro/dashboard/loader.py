@@ -19,8 +19,11 @@ from varro.config import GEO_DIR
 from varro.dashboard.models import Metric, output
 from varro.dashboard.filters import Filter, validate_options_queries
 from varro.dashboard.parser import ASTNode, parse_dashboard_md, extract_filters
-import geopandas as gpd
-import matplotlib.pyplot as plt
+from varro.startup import LazyModule
+
+# Only outputs that use them pay for these imports.
+gpd = LazyModule("geopandas")
+plt = LazyModule("matplotlib.pyplot")
 
 pio.templates.default = "plotly_white"
 pio.templates["plotly_white"].layout.legend = dict(
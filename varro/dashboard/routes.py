@@ -49,6 +49,7 @@ from varro.dashboard.public_fs import (
 )
 from varro.dashboard.snapshot_auth import verify_snapshot_token
 from varro.db import crud
+from varro.db.admission import Priority, query_class
 from ui.app.layout import AppShell
 
 _dashboards_root: Path | None = None
@@ -304,19 +305,29 @@ def build_filter_url(
     return base_path
 
 
+def _request_priority(req) -> Priority:
+    # /_internal/ pages are only rendered for snapshots, which queue behind
+    # interactive dashboard views.
+    if req.url.path.startswith("/_internal/"):
+        return Priority.BACKGROUND
+    return Priority.DASHBOARD
+
+
 def _dashboard_content(dash: Dashboard, req, base_path: str):
     filters = parse_filters_from_request(req, dash.filters)
     options: dict[str, list[SelectOption]] = {}
-    for f in dash.filters:
-        if isinstance(f, SelectFilter) and f.options_query:
-            options[f.name] = execute_options_query(dash, f, _engine)
+    with query_class(_request_priority(req)):
+        for f in dash.filters:
+            if isinstance(f, SelectFilter) and f.options_query:
+                options[f.name] = execute_options_query(dash, f, _engine)
     return Div(render_shell(dash, filters, options, base_path=base_path))
 
 
 def _render_output_fragment(dash: Dashboard, output_name: str, req, renderer):
     filters = parse_filters_from_request(req, dash.filters)
     try:
-        result = execute_output(dash, output_name, filters, _engine)
+        with query_class(_request_priority(req)):
+            result = execute_output(dash, output_name, filters, _engine)
         return renderer(result)
     except Exception:
         return None
@@ -21,6 +21,7 @@ from varro.dashboard.loader import Dashboard, load_dashboard, load_outputs
 from varro.dashboard.parser import parse_dashboard_md, extract_filters, ContainerNode, ComponentNode
 from varro.dashboard.filters import SelectFilter
 from varro.dashboard.models import Metric
+from varro.db.admission import Priority, query_class
 from varro.db.db import dst_read_engine as default_engine
 
 STRUCTURE_ERROR_PREFIXES = (
@@ -258,37 +259,38 @@ def validate_dashboard_url(
         unfiltered=(filters == defaults),
     )
 
-    for query_name in sorted(dash.queries):
-        sql = dash.queries[query_name]
-        try:
-            df = execute_query(sql, filters, db_engine)
-        except Exception as exc:
-            result.query_errors.append(f"{query_name}: {exc}")
-            continue
-        row_count = len(df)
-        result.queries[query_name] = row_count
-        if row_count == 0:
-            _record_empty_issue(
-                result,
-                f"{query_name}: returned 0 rows",
-                output=False,
-            )
+    with query_class(Priority.BACKGROUND, user_id):
+        for query_name in sorted(dash.queries):
+            sql = dash.queries[query_name]
+            try:
+                df = execute_query(sql, filters, db_engine)
+            except Exception as exc:
+                result.query_errors.append(f"{query_name}: {exc}")
+                continue
+            row_count = len(df)
+            result.queries[query_name] = row_count
+            if row_count == 0:
+                _record_empty_issue(
+                    result,
+                    f"{query_name}: returned 0 rows",
+                    output=False,
+                )
 
-    clear_query_cache()
-    for output_name in sorted(dash.outputs):
-        try:
-            output_value = execute_output(dash, output_name, filters, db_engine)
-        except Exception as exc:
-            result.output_errors.append(f"{output_name}: {exc}")
-            continue
-        kind = _output_kind(output_value)
-        result.outputs[output_name] = kind
-        if _is_empty_output(output_value):
-            _record_empty_issue(
-                result,
-                f"{output_name}: returned empty {kind}",
-                output=True,
-            )
+        clear_query_cache()
+        for output_name in sorted(dash.outputs):
+            try:
+                output_value = execute_output(dash, output_name, filters, db_engine)
+            except Exception as exc:
+                result.output_errors.append(f"{output_name}: {exc}")
+                continue
+            kind = _output_kind(output_value)
+            result.outputs[output_name] = kind
+            if _is_empty_output(output_value):
+                _record_empty_issue(
+                    result,
+                    f"{output_name}: returned empty {kind}",
+                    output=True,
+                )
 
     return result
 
@@ -404,7 +406,8 @@ def run_validation_after_write(user_id: int, file_path: str) -> str | None:
         sql_path = dashboard_dir / PurePosixPath(file_path).relative_to(f"/dashboard/{slug}")
         if not sql_path.exists():
             return None
-        error = validate_single_query(sql_path.read_text())
+        with query_class(Priority.BACKGROUND, user_id):
+            error = validate_single_query(sql_path.read_text())
         if error:
             return f"SQL validation error in {sql_path.name}: {error}"
         return f"SQL validation passed for {sql_path.name}."
@@ -7,6 +7,7 @@ import numpy as np
 import pandas as pd
 import psycopg
 from varro.db.db import POSTGRES_DST
+from varro.db.result_cache import bump_table_version
 
 # -------------------------- inference helpers --------------------------
 
@@ -248,6 +249,7 @@ def emit_and_apply_fact(
         table_name=table_name,
         schema="fact",
     )
+    bump_table_version("fact", table_name)
     return plan
 
 
@@ -259,4 +261,5 @@ def emit_and_apply_dimension(df: pd.DataFrame, table_name: str) -> DDLPlan:
         table_name=table_name,
         schema="dim",
     )
+    bump_table_version("dim", table_name)
     return plan
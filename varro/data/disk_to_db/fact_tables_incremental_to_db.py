@@ -8,6 +8,7 @@ from varro.config import DST_STATBANK_TABLES_DIR
 from varro.data.disk_to_db.create_db_table import copy_df_via_copy, fq_name, quote_ident
 from varro.data.disk_to_db.process_tables import process_fact_table
 from varro.db.db import POSTGRES_DST, dst_owner_engine
+from varro.db.result_cache import bump_table_version
 
 from uuid import uuid4
 
@@ -84,6 +85,7 @@ def apply_table_delta(table_id: str, changed_tids: list[str]) -> dict:
                 )
                 inserted_rows = cur.rowcount
 
+    bump_table_version("fact", table)
     result = {
         "table": table_id,
         "status": "applied",
@@ -8,8 +8,12 @@ def normalize_column_name(col_name: str) -> str:
     return col_name.lower().replace("å", "a").replace("ø", "o").replace("æ", "ae")
 
 
-def df_preview(df: pd.DataFrame, max_rows: int = 10, name: str = "df") -> str:
-    """Generate a pipe-separated DataFrame preview."""
+def df_preview(df: pd.DataFrame, max_rows: int = 10, name: str = "df", start: int = 0) -> str:
+    """Generate a pipe-separated DataFrame preview.
+
+    start is the position of df's first row in a larger frame it was read from;
+    the title then reads name.iloc[start:stop] instead of name.head(n).
+    """
     if df.index.name:
         df = df.reset_index()
     n_rows = min(max_rows, len(df))
@@ -19,7 +23,8 @@ def df_preview(df: pd.DataFrame, max_rows: int = 10, name: str = "df") -> str:
         float_format="%.3f",
         na_rep="N/A",
     )
-    return f"{name}.head({n_rows})\n" + csv_string
+    title = f"{name}.head({n_rows})" if start == 0 else f"{name}.iloc[{start}:{start + n_rows}]"
+    return f"{title}\n" + csv_string
 
 
 def df_dtype_map(df: pd.DataFrame) -> dict[str, str]:
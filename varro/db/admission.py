@@ -0,0 +1,268 @@
+"""Admission control for queries against the read-only DST database.
+
+Every uvicorn worker gets an equal share of DST_READ_MAX_CONNECTIONS as query
+slots. Queries wait in a priority queue for a slot: interactive dashboards
+first, then agent exploration, then validation/snapshot runs. One slot is
+reserved for dashboards when a worker has more than one, each user is capped
+at a number of concurrent queries, and a query that waits longer than its
+class deadline fails with AdmissionTimeout instead of piling up.
+
+The same controller gates the sync dashboard path (SQLAlchemy/psycopg, run in
+threadpool threads) and the async agent path (asyncpg), so waiting is
+implemented with thread-safe wakeups for both.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import AsyncIterator, Callable, Hashable, Iterator
+
+from varro.config import settings
+
+
+class Priority(IntEnum):
+    DASHBOARD = 0
+    AGENT = 1
+    BACKGROUND = 2
+
+
+class AdmissionTimeout(Exception):
+    pass
+
+
+def worker_count() -> int:
+    if workers := settings.get("VARRO_WORKERS") or os.getenv("VARRO_WORKERS"):
+        return max(1, int(workers))
+    urls = [u for u in (os.getenv("VARRO_APP_BASE_URLS") or "").split(",") if u.strip()]
+    return max(1, len(urls))
+
+
+DST_READ_MAX_CONNECTIONS = int(settings.get("DST_READ_MAX_CONNECTIONS", "20"))
+QUERY_SLOTS = max(1, DST_READ_MAX_CONNECTIONS // worker_count())
+# Each worker's read connections are split between its two pools: the asyncpg
+# pool of the agent Sql tool and the SQLAlchemy pool of dashboards, snapshots
+# and metadata lookups. Together they hold QUERY_SLOTS connections (at least
+# one each); a query admitted beyond its pool's share waits for a connection.
+AGENT_POOL_SIZE = int(settings.get("SQL_POOL_MAX_SIZE", str(max(1, QUERY_SLOTS // 2))))
+SYNC_POOL_SIZE = max(1, QUERY_SLOTS - AGENT_POOL_SIZE)
+USER_QUERY_LIMIT = int(settings.get("DST_READ_USER_CONCURRENCY", str(max(1, QUERY_SLOTS // 2))))
+QUEUE_DEADLINES_S = {
+    Priority.DASHBOARD: float(settings.get("QUERY_DEADLINE_DASHBOARD_S", "10")),
+    Priority.AGENT: float(settings.get("QUERY_DEADLINE_AGENT_S", "30")),
+    Priority.BACKGROUND: float(settings.get("QUERY_DEADLINE_BACKGROUND_S", "60")),
+}
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    user_id: Hashable = field(compare=False)
+    wake: Callable[[], None] = field(compare=False)
+    enqueued: float = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+
+
+@dataclass
+class _ClassStats:
+    admitted: int = 0
+    timeouts: int = 0
+    wait_s_total: float = 0.0
+    wait_s_max: float = 0.0
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        slots: int = QUERY_SLOTS,
+        user_limit: int = USER_QUERY_LIMIT,
+        deadlines_s: dict[Priority, float] = QUEUE_DEADLINES_S,
+    ):
+        self.slots = slots
+        self.user_limit = user_limit
+        self.deadlines_s = dict(deadlines_s)
+        # Keep one slot free for dashboards so agent load cannot starve them.
+        self.reserved = 1 if slots > 1 else 0
+        self._lock = threading.Lock()
+        self._queue: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._active_by_user: dict[Hashable, int] = {}
+        self._stats = {p: _ClassStats() for p in Priority}
+
+    def _limit(self, priority: int) -> int:
+        return self.slots if priority == Priority.DASHBOARD else self.slots - self.reserved
+
+    def _user_has_room(self, user_id: Hashable) -> bool:
+        return user_id is None or self._active_by_user.get(user_id, 0) < self.user_limit
+
+    def _dispatch(self) -> None:
+        """Grant free slots to queued waiters in priority order. Caller holds _lock."""
+        for waiter in sorted(self._queue):
+            if self._active >= self.slots:
+                break
+            if self._active >= self._limit(waiter.priority):
+                continue
+            if not self._user_has_room(waiter.user_id):
+                continue
+            self._queue.remove(waiter)
+            self._grant(waiter)
+
+    def _grant(self, waiter: _Waiter) -> None:
+        waiter.granted = True
+        self._active += 1
+        if waiter.user_id is not None:
+            self._active_by_user[waiter.user_id] = self._active_by_user.get(waiter.user_id, 0) + 1
+        wait_s = time.monotonic() - waiter.enqueued
+        stats = self._stats[Priority(waiter.priority)]
+        stats.admitted += 1
+        stats.wait_s_total += wait_s
+        stats.wait_s_max = max(stats.wait_s_max, wait_s)
+        waiter.wake()
+
+    def _enqueue(self, priority: Priority, user_id: Hashable, wake: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(
+            priority=int(priority),
+            seq=next(self._seq),
+            user_id=user_id,
+            wake=wake,
+            enqueued=time.monotonic(),
+        )
+        with self._lock:
+            self._queue.append(waiter)
+            self._dispatch()
+        return waiter
+
+    def _abandon(self, waiter: _Waiter, timed_out: bool = True) -> bool:
+        """Drop a waiter that gave up. Returns True if it had already been granted."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._queue.remove(waiter)
+            if timed_out:
+                self._stats[Priority(waiter.priority)].timeouts += 1
+            return False
+
+    def _timeout_error(self, priority: Priority, deadline_s: float) -> AdmissionTimeout:
+        return AdmissionTimeout(
+            f"Database busy: no query slot within {deadline_s:g}s "
+            f"({priority.name.lower()} queue depth {len(self._queue)}). Try again shortly."
+        )
+
+    def release(self, user_id: Hashable = None) -> None:
+        with self._lock:
+            self._active -= 1
+            if user_id is not None:
+                remaining = self._active_by_user.get(user_id, 1) - 1
+                if remaining:
+                    self._active_by_user[user_id] = remaining
+                else:
+                    self._active_by_user.pop(user_id, None)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: Priority, user_id: Hashable = None) -> Iterator[None]:
+        """Hold a query slot in a sync caller (must not run on an event loop thread)."""
+        deadline_s = self.deadlines_s[priority]
+        event = threading.Event()
+        waiter = self._enqueue(priority, user_id, event.set)
+        if not event.wait(deadline_s) and not self._abandon(waiter):
+            raise self._timeout_error(priority, deadline_s)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+    @asynccontextmanager
+    async def slot_async(self, priority: Priority, user_id: Hashable = None) -> AsyncIterator[None]:
+        """Hold a query slot in an async caller."""
+        deadline_s = self.deadlines_s[priority]
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enqueue(priority, user_id, wake)
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), deadline_s)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise self._timeout_error(priority, deadline_s) from None
+        except BaseException:
+            if self._abandon(waiter, timed_out=False):
+                self.release(user_id)
+            raise
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = {p.name.lower(): 0 for p in Priority}
+            for waiter in self._queue:
+                queued[Priority(waiter.priority).name.lower()] += 1
+            classes = {}
+            for priority, stats in self._stats.items():
+                classes[priority.name.lower()] = {
+                    "queued": queued[priority.name.lower()],
+                    "admitted": stats.admitted,
+                    "timeouts": stats.timeouts,
+                    "wait_s_avg": round(stats.wait_s_total / stats.admitted, 4)
+                    if stats.admitted
+                    else 0.0,
+                    "wait_s_max": round(stats.wait_s_max, 4),
+                }
+            return {
+                "slots": self.slots,
+                "user_limit": self.user_limit,
+                "active": self._active,
+                "queue_depth": len(self._queue),
+                "classes": classes,
+            }
+
+
+admission = AdmissionController()
+
+# Query class of the current request/task; dashboards are the default since
+# their route handlers are the only callers that do not set it.
+_query_class: ContextVar[tuple[Priority, Hashable]] = ContextVar(
+    "query_class", default=(Priority.DASHBOARD, None)
+)
+
+
+@contextmanager
+def query_class(priority: Priority, user_id: Hashable = None) -> Iterator[None]:
+    """Run the enclosed queries under priority on behalf of user_id."""
+    token = _query_class.set((priority, user_id))
+    try:
+        yield
+    finally:
+        _query_class.reset(token)
+
+
+def current_query_class() -> tuple[Priority, Hashable]:
+    return _query_class.get()
+
+
+@contextmanager
+def admitted() -> Iterator[None]:
+    """Hold a slot for the current query class (sync callers)."""
+    with admission.slot(*current_query_class()):
+        yield
+
+
+@asynccontextmanager
+async def admitted_async() -> AsyncIterator[None]:
+    """Hold a slot for the current query class (async callers)."""
+    async with admission.slot_async(*current_query_class()):
+        yield
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from jinja2 import Environment, FileSystemLoader
 from typing import Any
@@ -30,5 +31,10 @@ class CrudPrompt:
         template = self.env.get_template(f"{name}.j2")
         return template.render(**variables)
 
+    def template_version(self, name: str) -> int:
+        """Modification time of a template file, for keying caches of rendered prompts."""
+        template = self.env.get_template(f"{name}.j2")
+        return os.stat(template.filename).st_mtime_ns
+
 
 prompt = CrudPrompt(Path(__file__).parent.parent.parent / "prompts")
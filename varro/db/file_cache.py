@@ -0,0 +1,140 @@
+"""Size-bounded cache of files on local disk, shared by all worker processes.
+
+Each entry is one file named after its key. A SQLite index next to the files
+holds the entries' sizes and last access times for LRU eviction, plus
+hit/miss counters. ResultCache (SQL results) and PngCache (rendered figures)
+build on it.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+from uuid import uuid4
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+# Errors a cache read or write can fail with; callers fall back to doing the work.
+CACHE_ERRORS = (sqlite3.Error, OSError)
+
+
+class FileCache:
+    """Files under cache_dir/<files_dir_name>, indexed in cache_dir/index.sqlite.
+
+    Subclasses set the file suffix and directory name, may add tables to
+    schema_sql and counter names to counters, and read and write the files.
+    """
+
+    files_dir_name = "files"
+    suffix = ""
+    schema_sql = SCHEMA_SQL
+    counters: tuple[str, ...] = ("hits", "misses", "stores", "evictions")
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.files_dir = self.cache_dir / self.files_dir_name
+        self.index_path = self.cache_dir / "index.sqlite"
+        self.max_bytes = max_bytes
+        # One connection per thread (asyncio.to_thread workers are reused), and
+        # the schema is set up once per process rather than on every call.
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Yield this thread's connection to the index, opening it on first use."""
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.conn = self._open()
+            local.pid = os.getpid()
+        yield local.conn
+
+    def _open(self) -> sqlite3.Connection:
+        with self._init_lock:
+            if not self._initialized:
+                fresh = not self.index_path.exists()
+                self.files_dir.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(self.schema_sql)
+                if fresh:
+                    # Files without an index row can never be hit; drop any left
+                    # behind by a deleted index.
+                    for path in self.files_dir.glob(f"*{self.suffix}"):
+                        path.unlink(missing_ok=True)
+                self._initialized = True
+                return conn
+        return sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+
+    def _count(self, conn: sqlite3.Connection, name: str, n: int = 1) -> None:
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, n),
+        )
+
+    def _path(self, key: str) -> Path:
+        return self.files_dir / f"{key}{self.suffix}"
+
+    def _tmp_path(self, key: str) -> Path:
+        """A unique sibling of key's file to write to before os.replace()."""
+        path = self._path(key)
+        return path.with_name(f".{path.name}.{uuid4().hex}.tmp")
+
+    def _has(self, conn: sqlite3.Connection, key: str) -> bool:
+        return conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+
+    def _hit(self, conn: sqlite3.Connection, key: str) -> None:
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._count(conn, "hits")
+
+    def _stored(self, conn: sqlite3.Connection, key: str, size: int) -> None:
+        """Index a file just written for key, then evict down to max_bytes."""
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, size, last_access) VALUES (?, ?, ?)",
+            (key, size, time.time()),
+        )
+        self._count(conn, "stores")
+        self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._path(key).unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        self._count(conn, "evictions", evicted)
+
+    def stats(self) -> dict[str, int]:
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        stats = {name: counters.get(name, 0) for name in self.counters}
+        stats["entries"] = entries
+        stats["bytes"] = size
+        return stats
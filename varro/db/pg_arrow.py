@@ -0,0 +1,385 @@
+"""Columnar decoding of Postgres results into Arrow-backed DataFrames.
+
+Results are fetched with ``COPY (query) TO STDOUT (FORMAT csv)`` and parsed by
+the multithreaded Arrow CSV reader, using column types taken from the
+statement description. Scalar columns (numbers, dates, timestamps, text) are
+decoded column-wise with no per-row Python objects; dates become datetime64
+columns. The rarer types keep the pandas values a row fetch gives them:
+int4range/int8range/daterange are Arrow structs on disk and asyncpg ``Range``
+objects in the frame, arrays are lists, time is ``datetime.time`` and interval
+is timedelta64.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from datetime import date
+from typing import Any, Iterable, Sequence
+
+import pandas as pd
+import psycopg
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from asyncpg import Range
+
+PG_ARROW_TYPES: dict[str, pa.DataType] = {
+    "bool": pa.bool_(),
+    "int2": pa.int16(),
+    "int4": pa.int32(),
+    "int8": pa.int64(),
+    "float4": pa.float32(),
+    "float8": pa.float64(),
+    "numeric": pa.float64(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us"),
+    "timestamptz": pa.timestamp("us", tz="UTC"),
+    "time": pa.time64("us"),
+}
+RANGE_BOUND_TYPES: dict[str, pa.DataType] = {
+    "int4range": pa.int32(),
+    "int8range": pa.int64(),
+    "daterange": pa.date32(),
+}
+RANGE_FIELDS = ("lower", "upper", "empty")
+DATE_TYPE = pa.timestamp("ns")
+INTERVAL_TYPE = pa.duration("us")
+# Discrete ranges are canonical "[lower,upper)"; either bound may be empty.
+RANGE_RE = r"^[\[(](?P<lower>[^,]*),(?P<upper>[^\])]*)[\])]$"
+INTERVAL_PART_RE = re.compile(
+    r"(?P<n>[+-]?\d+) (?P<unit>year|mon|day)s?"
+    r"|(?P<sign>[+-]?)(?P<h>\d+):(?P<m>\d+):(?P<s>\d+(?:\.\d+)?)"
+)
+# Days per unit, as asyncpg decodes intervals.
+INTERVAL_DAYS = {"year": 365, "mon": 30, "day": 1}
+SELECT_START_RE = re.compile(
+    r"^(?:\s|--[^\n]*\n?|/\*.*?\*/|\()*(select|with|values|table)\b",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# (column name, Postgres type name) pairs from the statement description.
+Columns = Sequence[tuple[str, str]]
+
+
+def range_type(type_name: str) -> pa.StructType:
+    bound = RANGE_BOUND_TYPES[type_name]
+    return pa.struct([("lower", bound), ("upper", bound), ("empty", pa.bool_())])
+
+
+def is_range_struct(arrow_type: pa.DataType) -> bool:
+    return pa.types.is_struct(arrow_type) and tuple(
+        arrow_type.field(i).name for i in range(arrow_type.num_fields)
+    ) == RANGE_FIELDS
+
+
+def is_select(query: str) -> bool:
+    """True if query is a SELECT-like statement that can be wrapped as a subquery."""
+    return SELECT_START_RE.match(query) is not None
+
+
+def array_element_type(type_name: str) -> str | None:
+    """Element type of a Postgres array type name ("_int4" -> "int4")."""
+    return type_name[1:] if type_name.startswith("_") else None
+
+
+def copy_sql(query: str) -> str:
+    return f"COPY (\n{strip_query(query)}\n) TO STDOUT (FORMAT csv)"
+
+
+def limit_sql(query: str, limit: int) -> str:
+    return f"SELECT * FROM (\n{strip_query(query)}\n) AS q LIMIT {int(limit)}"
+
+
+def strip_query(query: str) -> str:
+    return query.strip().rstrip(";").rstrip()
+
+
+def _parse_ranges(text: pa.Array, type_name: str) -> pa.Array:
+    """Parse canonical range text ("[0,5)", "[95,)", "empty") into a struct."""
+    bound = RANGE_BOUND_TYPES[type_name]
+    parts = pc.extract_regex(text, RANGE_RE)
+    fields = []
+    for name in ("lower", "upper"):
+        values = pc.struct_field(parts, name)
+        values = pc.if_else(pc.equal(values, ""), pa.scalar(None, pa.string()), values)
+        fields.append(values.cast(bound))
+    fields.append(pc.fill_null(pc.equal(text, "empty"), False))
+    return pa.StructArray.from_arrays(fields, names=list(RANGE_FIELDS), mask=pc.is_null(text))
+
+
+def _split_array_text(text: str, pos: int = 0) -> tuple[list, int]:
+    """Parse Postgres array text starting at the "{" at pos; returns (items, end)."""
+    items: list = []
+    pos += 1
+    while text[pos] != "}":
+        if text[pos] == "{":
+            item, pos = _split_array_text(text, pos)
+        elif text[pos] == '"':
+            chars = []
+            pos += 1
+            while text[pos] != '"':
+                if text[pos] == "\\":
+                    pos += 1
+                chars.append(text[pos])
+                pos += 1
+            item = "".join(chars)
+            pos += 1
+        else:
+            end = pos
+            while text[end] not in ",}":
+                end += 1
+            item = None if text[pos:end] == "NULL" else text[pos:end]
+            pos = end
+        items.append(item)
+        if text[pos] == ",":
+            pos += 1
+    return items, pos + 1
+
+
+def _array_value(value: Any, element: str) -> Any:
+    if value is None or isinstance(value, list):
+        return value if value is None else [_array_value(v, element) for v in value]
+    if element in ("int2", "int4", "int8"):
+        return int(value)
+    if element in ("float4", "float8", "numeric"):
+        return float(value)
+    if element == "bool":
+        return value == "t"
+    if element == "date":
+        return date.fromisoformat(value)
+    return value
+
+
+def _array_arrow(values: list, element: str) -> pa.Array:
+    try:
+        return pa.array(values, type=pa.list_(_read_type(element)))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Multidimensional arrays nest one list level per dimension.
+        return pa.array(values)
+
+
+def _parse_arrays(text: pa.Array, element: str) -> pa.Array:
+    values = [
+        None if item is None else _array_value(_split_array_text(item)[0], element)
+        for item in text.to_pylist()
+    ]
+    return _array_arrow(values, element)
+
+
+def _interval_micros(text: str) -> int:
+    micros = 0
+    for match in INTERVAL_PART_RE.finditer(text):
+        if match.group("unit"):
+            micros += int(match.group("n")) * INTERVAL_DAYS[match.group("unit")] * 86_400_000_000
+            continue
+        seconds = int(match.group("h")) * 3600 + int(match.group("m")) * 60
+        clock = round((seconds + float(match.group("s"))) * 1_000_000)
+        micros += -clock if match.group("sign") == "-" else clock
+    return micros
+
+
+def _parse_intervals(text: pa.Array) -> pa.Array:
+    values = [None if item is None else _interval_micros(item) for item in text.to_pylist()]
+    return pa.array(values, type=INTERVAL_TYPE)
+
+
+def _finalize(arrays: list[pa.Array], columns: Columns) -> pa.Table:
+    out = []
+    for array, (_, type_name) in zip(arrays, columns):
+        if isinstance(array, pa.ChunkedArray):
+            array = array.combine_chunks()
+        if pa.types.is_string(array.type):
+            if type_name in RANGE_BOUND_TYPES:
+                array = _parse_ranges(array, type_name)
+            elif type_name == "interval":
+                array = _parse_intervals(array)
+            elif element := array_element_type(type_name):
+                array = _parse_arrays(array, element)
+        if pa.types.is_date32(array.type):
+            array = array.cast(DATE_TYPE)
+        out.append(array)
+    return pa.Table.from_arrays(out, names=[name for name, _ in columns])
+
+
+def _read_type(type_name: str) -> pa.DataType:
+    return PG_ARROW_TYPES.get(type_name, pa.string())
+
+
+def empty_table(columns: Columns) -> pa.Table:
+    return _finalize([pa.array([], type=_read_type(t)) for _, t in columns], columns)
+
+
+def complete_csv_rows(data: bytes) -> bytes:
+    """Cut CSV data after its last complete row.
+
+    A newline inside a quoted field is not a row boundary: a newline ends a
+    row only when the quotes before it are balanced (COPY doubles embedded
+    quotes, so the count stays even outside fields).
+    """
+    end = data.rfind(b"\n")
+    if end < 0:
+        return b""
+    quotes = data.count(b'"', 0, end)
+    while quotes % 2:
+        prev = data.rfind(b"\n", 0, end)
+        if prev < 0:
+            return b""
+        quotes -= data.count(b'"', prev, end)
+        end = prev
+    return data[: end + 1]
+
+
+def csv_to_table(data: bytes | memoryview, columns: Columns) -> pa.Table:
+    """Decode Postgres CSV COPY output into an Arrow table."""
+    if not columns:
+        return pa.table({})
+    if not len(data):
+        return empty_table(columns)
+    # Positional names: result columns may share a name (e.g. two joined kode columns).
+    names = [f"c{i}" for i in range(len(columns))]
+    table = pa_csv.read_csv(
+        pa.BufferReader(data),
+        read_options=pa_csv.ReadOptions(column_names=names),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={n: _read_type(t) for n, (_, t) in zip(names, columns)},
+            null_values=[""],
+            true_values=["t"],
+            false_values=["f"],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    return _finalize(table.columns, columns)
+
+
+def _record_value(value: Any, type_name: str) -> Any:
+    if value is None:
+        return None
+    if type_name in RANGE_BOUND_TYPES:
+        return {"lower": value.lower, "upper": value.upper, "empty": value.isempty}
+    if type_name == "interval" or array_element_type(type_name):
+        return value
+    if type_name not in PG_ARROW_TYPES:
+        return str(value)
+    return value
+
+
+def records_to_table(records: Iterable[Sequence], columns: Columns) -> pa.Table:
+    """Build an Arrow table from already-decoded rows (e.g. a small asyncpg fetch)."""
+    rows = list(records)
+    arrays = []
+    for i, (_, type_name) in enumerate(columns):
+        values = [_record_value(row[i], type_name) for row in rows]
+        if type_name in RANGE_BOUND_TYPES:
+            arrays.append(pa.array(values, type=range_type(type_name)))
+        elif type_name == "interval":
+            arrays.append(pa.array(values, type=INTERVAL_TYPE))
+        elif element := array_element_type(type_name):
+            arrays.append(_array_arrow(values, element))
+        else:
+            arrays.append(pa.array(values, type=_read_type(type_name)))
+    return _finalize(arrays, columns)
+
+
+def _range_objects(array: pa.Array) -> list[Range | None]:
+    lowers = pc.struct_field(array, "lower").to_pylist()
+    uppers = pc.struct_field(array, "upper").to_pylist()
+    empties = pc.struct_field(array, "empty").to_pylist()
+    return [
+        None
+        if valid is False
+        else Range(empty=True)
+        if empty
+        else Range(lower, upper, lower_inc=lower is not None, upper_inc=False)
+        for lower, upper, empty, valid in zip(lowers, uppers, empties, array.is_valid().to_pylist())
+    ]
+
+
+def table_to_frame(table: pa.Table, **to_pandas_kwargs) -> pd.DataFrame:
+    """Arrow table to DataFrame; range structs become Range objects and lists become lists."""
+    df = table.to_pandas(**to_pandas_kwargs)
+    # Index columns stored by from_pandas come after the data columns.
+    for i, field in enumerate(list(table.schema)[: df.shape[1]]):
+        if is_range_struct(field.type):
+            values = _range_objects(table.column(i).combine_chunks())
+        elif pa.types.is_list(field.type) or pa.types.is_large_list(field.type):
+            values = table.column(i).to_pylist()
+        else:
+            continue
+        df.isetitem(i, pd.Series(values, index=df.index, dtype=object))
+    return df
+
+
+def frame_to_table(df: pd.DataFrame, *, preserve_index: bool = False) -> pa.Table:
+    """pa.Table.from_pandas that also stores columns of Range objects as range structs."""
+    range_cols = [i for i in range(df.shape[1]) if _is_range_column(df.iloc[:, i])]
+    if not range_cols:
+        return pa.Table.from_pandas(df, preserve_index=preserve_index)
+    df = df.copy(deep=False)
+    for i in range_cols:
+        df.isetitem(i, pd.Series(_range_struct(df.iloc[:, i]), index=df.index))
+    table = pa.Table.from_pandas(df, preserve_index=preserve_index)
+    # Record the columns as plain objects, so to_pandas does not restore an ArrowDtype.
+    meta = json.loads(table.schema.metadata[b"pandas"])
+    for i in range_cols:
+        meta["columns"][i].update(pandas_type="object", numpy_type="object")
+    return table.replace_schema_metadata({**table.schema.metadata, b"pandas": json.dumps(meta)})
+
+
+def _is_range_column(column: pd.Series) -> bool:
+    if column.dtype != object:
+        return False
+    non_null = column.dropna()
+    return not non_null.empty and isinstance(non_null.iloc[0], Range)
+
+
+def _range_struct(column: pd.Series) -> pd.arrays.ArrowExtensionArray:
+    ranges = [value if isinstance(value, Range) else None for value in column]
+    fields = [
+        pa.array([None if r is None else getattr(r, name) for r in ranges])
+        for name in ("lower", "upper")
+    ]
+    fields.append(pa.array([r is not None and r.isempty for r in ranges]))
+    mask = pa.array([r is None for r in ranges])
+    return pd.arrays.ArrowExtensionArray(
+        pa.StructArray.from_arrays(fields, names=list(RANGE_FIELDS), mask=mask)
+    )
+
+
+def _description_columns(cur: psycopg.Cursor) -> list[tuple[str, str]]:
+    types = cur.connection.adapters.types
+    columns = []
+    for column in cur.description:
+        info = types.get(column.type_code)
+        if info is None:
+            columns.append((column.name, "text"))
+        elif info.oid == column.type_code:
+            columns.append((column.name, info.name))
+        else:
+            # The registry maps array oids to the element type.
+            columns.append((column.name, f"_{info.name}"))
+    return columns
+
+
+def describe(cur: psycopg.Cursor, query: str, params: Any = None) -> list[tuple[str, str]]:
+    """Column names and Postgres type names of query, without fetching rows."""
+    cur.execute(limit_sql(query, 0), params)
+    return _description_columns(cur)
+
+
+def read_frame(conn: psycopg.Connection, query: str, params: Any = None) -> pd.DataFrame:
+    """Run query on a psycopg connection and decode the result column-wise.
+
+    Statements COPY cannot wrap (EXPLAIN, SHOW, ...) are fetched as rows.
+    """
+    with conn.cursor() as cur:
+        if not is_select(query):
+            cur.execute(query, params)
+            columns = _description_columns(cur)
+            return table_to_frame(records_to_table(cur.fetchall(), columns))
+        columns = describe(cur, query, params)
+        with cur.copy(copy_sql(query), params) as copy:
+            data = b"".join(copy)
+    return table_to_frame(csv_to_table(data, columns))
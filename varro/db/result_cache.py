@@ -0,0 +1,189 @@
+"""Data-versioned SQL result cache shared by all worker processes.
+
+Results are stored as zstd-compressed Arrow IPC files in a FileCache, whose
+SQLite index also holds per-table data versions. A cache key covers the normalized SQL and the current version of
+every fact/dim table it references, so bumping a table's version (done by
+apply_table_delta and the table loaders) makes older entries unreachable;
+they are evicted by the size bound like any other cold entry.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from varro.config import SQL_CACHE_DIR, settings
+from varro.db import file_cache
+from varro.db.file_cache import FileCache
+from varro.db.pg_arrow import frame_to_table, table_to_frame
+from varro.startup import invalidate_startup_metadata
+
+SQL_CACHE_MAX_BYTES = int(settings.get("SQL_CACHE_MAX_BYTES", str(2 * 1024**3)))
+# Entries larger than this share of the cache are not stored.
+MAX_ENTRY_SHARE = 0.1
+METADATA_KEY = b"varro_result"
+
+TABLE_REF_RE = re.compile(r'"?\b(fact|dim)\b"?\s*\.\s*"?([a-zA-Z0-9_]+)"?', re.IGNORECASE)
+# String literals and quoted identifiers, or runs of whitespace and comments.
+SQL_TOKEN_RE = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|((?:\s|--[^\n]*|/\*.*?\*/)+)", re.DOTALL
+)
+
+# Queries whose result changes between runs without any table changing.
+VOLATILE_SQL_RE = re.compile(
+    r"\b(now|random|setseed|clock_timestamp|statement_timestamp|transaction_timestamp"
+    r"|timeofday|nextval|currval|lastval|setval|gen_random_uuid|uuid_generate_v\w*"
+    r"|txid_current\w*|pg_current_xact_id)\s*\("
+    r"|\b(current_date|current_time|current_timestamp|localtime|localtimestamp)\b",
+    re.IGNORECASE,
+)
+
+SCHEMA_SQL = (
+    file_cache.SCHEMA_SQL
+    + "CREATE TABLE IF NOT EXISTS table_versions "
+    "(name TEXT PRIMARY KEY, version INTEGER NOT NULL);\n"
+)
+
+
+def normalize_sql(query: str) -> str:
+    """Lowercase, strip comments, collapse whitespace and drop trailing semicolons.
+
+    String literals and quoted identifiers are kept verbatim, so queries that
+    only differ in formatting or keyword case share a cache entry.
+    """
+    parts = []
+    pos = 0
+    for match in SQL_TOKEN_RE.finditer(query):
+        parts.append(query[pos : match.start()].lower())
+        parts.append(" " if match.group(1) is not None else match.group(0))
+        pos = match.end()
+    parts.append(query[pos:].lower())
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def referenced_tables(query: str) -> list[str]:
+    """Schema-qualified fact/dim tables referenced by query, e.g. ["fact.folk1a"]."""
+    names = {f"{schema.lower()}.{table.lower()}" for schema, table in TABLE_REF_RE.findall(query)}
+    return sorted(names)
+
+
+def is_volatile(query: str) -> bool:
+    """True if query calls a time, random or sequence function."""
+    return VOLATILE_SQL_RE.search(query) is not None
+
+
+class ResultCache(FileCache):
+    files_dir_name = "results"
+    suffix = ".arrow"
+    schema_sql = SCHEMA_SQL
+    counters = (*FileCache.counters, "uncacheable")
+
+    def __init__(self, cache_dir: Path = SQL_CACHE_DIR, max_bytes: int = SQL_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    # ---------------------------- table versions ----------------------------
+
+    def bump_version(self, name: str) -> int:
+        """Increment the data version of a table such as "fact.folk1a"."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO table_versions (name, version) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+                (name.lower(),),
+            )
+            row = conn.execute(
+                "SELECT version FROM table_versions WHERE name = ?", (name.lower(),)
+            ).fetchone()
+        return row[0]
+
+    def versions(self, names: list[str]) -> dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT name, version FROM table_versions WHERE name IN ({','.join('?' * len(names))})",
+                names,
+            ).fetchall()
+        found = dict(rows)
+        return {name: found.get(name, 0) for name in names}
+
+    # ------------------------------- entries --------------------------------
+
+    def key(self, query: str, kind: str) -> str | None:
+        """Cache key for query, or None if it references no fact/dim table or is volatile."""
+        tables = referenced_tables(query)
+        if not tables or is_volatile(query):
+            return None
+        payload = json.dumps(
+            [kind, normalize_sql(query), sorted(self.versions(tables).items())]
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> tuple[pd.DataFrame, dict] | None:
+        """Return (df, metadata) for a stored result and mark it recently used."""
+        path = self._path(key)
+        with self._connect() as conn:
+            if not self._has(conn, key) or not path.exists():
+                self._count(conn, "misses")
+                return None
+            try:
+                with pa.memory_map(str(path)) as source:
+                    table = pa.ipc.open_file(source).read_all()
+            except (OSError, pa.ArrowInvalid):
+                self._count(conn, "misses")
+                return None
+            self._hit(conn, key)
+        meta = json.loads(table.schema.metadata.get(METADATA_KEY, b"{}"))
+        return table_to_frame(table), meta
+
+    def put(self, key: str, df: pd.DataFrame, meta: dict) -> bool:
+        """Store a result. Returns False if it cannot be represented in Arrow or is too large."""
+        try:
+            table = frame_to_table(df)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            with self._connect() as conn:
+                self._count(conn, "uncacheable")
+            return False
+        if table.nbytes > self.max_bytes * MAX_ENTRY_SHARE:
+            with self._connect() as conn:
+                self._count(conn, "uncacheable")
+            return False
+
+        schema_meta = dict(table.schema.metadata or {})
+        schema_meta[METADATA_KEY] = json.dumps(meta).encode()
+        table = table.replace_schema_metadata(schema_meta)
+
+        path = self._path(key)
+        self.files_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._tmp_path(key)
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+        with self._connect() as conn:
+            self._stored(conn, key, path.stat().st_size)
+        return True
+
+
+result_cache = ResultCache()
+
+
+def bump_table_version(schema: str, table: str) -> int:
+    """Invalidate cached results that read schema.table. Called after data loads.
+
+    Loading a dim table also drops the snapshot of the dim table list.
+    """
+    if schema == "dim":
+        invalidate_startup_metadata("dim_tables")
+    return result_cache.bump_version(f"{schema}.{table}")
+
+
+if __name__ == "__main__":
+    for name, value in result_cache.stats().items():
+        print(f"{name}: {value}")
@@ -54,6 +54,10 @@ def _format_tool_args(tool_name: str, args: dict[str, Any]) -> str:
         if fuzzy:
             text += f" fuzzy=`{fuzzy}`"
         return text
+    if tool_name == "SearchTables":
+        return f"`{args.get('query', '')}`"
+    if tool_name == "SearchValues":
+        return f"phrases=`{args.get('phrases', [])}`"
     if tool_name in ("Snapshot", "UpdateUrl"):
         val = args.get("url") or args.get("path") or ""
         return f"`{val}`" if val else ""
@@ -0,0 +1,134 @@
+"""Keep web-worker startup cheap: defer heavy imports and DB lookups.
+
+Modules that are only needed once a chat turn or a dashboard render runs are
+imported on first use (`LazyModule`), metadata that used to be queried at
+import time is read from an on-disk snapshot (`startup_metadata`), and
+`warm_start` pays for both in a background thread after the app is up so the
+first request does not. `scripts/import_report.py` tracks what is left.
+"""
+
+from __future__ import annotations
+
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from types import ModuleType
+from typing import Callable, TypeVar
+from uuid import uuid4
+
+from varro.config import STARTUP_METADATA_DIR, settings
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+STARTUP_METADATA_TTL_S = int(settings.get("STARTUP_METADATA_TTL_S", str(24 * 3600)))
+WARM_START = settings.get("WARM_START", "1") != "0"
+WARM_MODULES = (
+    "varro.chat.agent_run",
+    "geopandas",
+    "matplotlib.pyplot",
+    "mistletoe",
+)
+
+
+class LazyModule:
+    """Module stand-in that imports `name` on first attribute access."""
+
+    def __init__(self, name: str):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            object.__setattr__(self, "_module", importlib.import_module(self._name))
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    # Writes go to the module too, so patching through the proxy patches the
+    # module everyone else sees.
+    def __setattr__(self, attr: str, value) -> None:
+        setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr: str) -> None:
+        delattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+
+def _metadata_fp(name: str) -> Path:
+    return STARTUP_METADATA_DIR / f"{name}.json"
+
+
+def startup_metadata(name: str, load: Callable[[], T], *, ttl_s: int | None = None) -> T:
+    """Return `load()`, served from a JSON snapshot younger than the TTL.
+
+    A stale snapshot is refreshed; if the refresh fails (DB down) the stale
+    value is used rather than failing the caller.
+    """
+    ttl = STARTUP_METADATA_TTL_S if ttl_s is None else ttl_s
+    fp = _metadata_fp(name)
+    cached = None
+    try:
+        cached = json.loads(fp.read_text())
+    except (OSError, ValueError):
+        pass
+    if cached is not None and time.time() - cached["saved_at"] <= ttl:
+        return cached["value"]
+
+    try:
+        value = load()
+    except Exception:
+        if cached is None:
+            raise
+        logger.warning("Using stale startup metadata %s", name, exc_info=True)
+        return cached["value"]
+
+    try:
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        tmp_fp = fp.with_name(f".{fp.name}.{uuid4().hex}.tmp")
+        tmp_fp.write_text(json.dumps({"saved_at": time.time(), "value": value}))
+        os.replace(tmp_fp, fp)
+    except OSError:
+        logger.warning("Could not save startup metadata %s", name, exc_info=True)
+    return value
+
+
+def invalidate_startup_metadata(name: str) -> None:
+    """Drop the snapshot of `name`, so the next `startup_metadata` call reloads it."""
+    try:
+        _metadata_fp(name).unlink(missing_ok=True)
+    except OSError:
+        logger.warning("Could not remove startup metadata %s", name, exc_info=True)
+
+
+def _warm() -> None:
+    started = time.perf_counter()
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            logger.warning("Warm start could not import %s", name, exc_info=True)
+    try:
+        from varro.agent.utils import get_dim_tables
+
+        get_dim_tables()
+    except Exception:
+        logger.warning("Warm start could not load dim tables", exc_info=True)
+    logger.info("Warm start finished in %.1fs", time.perf_counter() - started)
+
+
+def warm_start() -> threading.Thread | None:
+    """Import the chat/dashboard stack in the background once the app is serving."""
+    if not WARM_START:
+        return None
+    thread = threading.Thread(target=_warm, name="warm-start", daemon=True)
+    thread.start()
+    return thread